@@ -0,0 +1,120 @@
+"""
+Proxy compression benchmark: bytes saved vs CPU cost.
+
+Compresses representative API payloads with every available encoding and
+reports ratio, time per body and throughput, plus what serving N requests
+costs when each response is compressed on the fly vs. once per cached
+object (the proxy's precompressed-variant cache).
+
+Payloads default to synthetic bodies shaped like /api/rankings/dashboard,
+/api/tokens and /api/token-runner/analyses; pass --file to use a recorded
+response instead (e.g. `curl -s localhost:8001/api/tokens?limit=500 > tokens.json`).
+
+Usage (from backend/):
+    python benchmarks/bench_compression.py --requests 1000
+    python benchmarks/bench_compression.py --file tokens.json --json results.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gateway.compression import Compressor, available_encodings  # noqa: E402
+
+LABELS = ("BUY", "NEUTRAL", "SELL")
+
+
+def synthetic_token(i: int, rng: random.Random) -> dict:
+    return {
+        "symbol": f"TKN{i}",
+        "name": f"Token {i}",
+        "contractAddress": "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(40)),
+        "chainId": 1,
+        "marketCap": round(rng.uniform(1e6, 1e10), 2),
+        "volume24h": round(rng.uniform(1e4, 1e9), 2),
+        "priceChange24h": round(rng.uniform(-20, 20), 3),
+        "engineScore": rng.randint(0, 100),
+        "engineLabel": rng.choice(LABELS),
+        "engineConfidence": rng.randint(0, 100),
+        "confidence": rng.randint(0, 100),
+        "risk": rng.randint(0, 100),
+        "bucket": rng.choice(("BUY", "WATCH", "SELL")),
+        "coverage": {"onchain": rng.random() > 0.3, "market": True, "social": rng.random() > 0.5},
+        "analyzedAt": "2026-01-20T13:09:58.387Z",
+    }
+
+
+def synthetic_payloads() -> dict:
+    rng = random.Random(42)
+    tokens = [synthetic_token(i, rng) for i in range(500)]
+    return {
+        "rankings/dashboard?limit=50": {"ok": True, "data": {"buckets": {
+            b: tokens[i * 50:(i + 1) * 50] for i, b in enumerate(("BUY", "WATCH", "SELL"))
+        }}},
+        "tokens?limit=500": {"ok": True, "data": {"tokens": tokens, "total": 500, "limit": 500, "offset": 0, "hasMore": False}},
+        "token-runner/analyses?limit=100": {"ok": True, "data": {"analyses": tokens[:100], "total": 100, "limit": 100, "offset": 0, "hasMore": False}},
+    }
+
+
+def bench_one(body: bytes, encoding: str, level: int, rounds: int) -> dict:
+    compressor = Compressor({encoding: level})
+    out = compressor.compress(body, encoding)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        compressor.compress(body, encoding)
+    per_call = (time.perf_counter() - started) / rounds
+    return {
+        "level": level,
+        "bytes_in": len(body),
+        "bytes_out": len(out),
+        "ratio": round(len(out) / len(body), 4),
+        "ms_per_body": round(per_call * 1000, 3),
+        "mb_per_s": round(len(body) / per_call / 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", action="append", help="recorded JSON response to benchmark (repeatable)")
+    parser.add_argument("--requests", type=int, default=1000, help="requests served per cached object")
+    parser.add_argument("--rounds", type=int, default=20, help="timing rounds per encoding")
+    parser.add_argument("--levels", default="gzip=6,br=5,zstd=6")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    levels = {k: int(v) for k, v in (item.split("=") for item in args.levels.split(","))}
+    if args.file:
+        payloads = {Path(f).name: Path(f).read_bytes() for f in args.file}
+    else:
+        payloads = {name: json.dumps(body, separators=(",", ":")).encode() for name, body in synthetic_payloads().items()}
+
+    results = {}
+    print(f"encodings available: {', '.join(available_encodings())}")
+    for name, body in payloads.items():
+        print(f"\n{name} ({len(body):,} bytes)")
+        print(f"{'encoding':<8} {'level':>5} {'bytes':>10} {'ratio':>7} {'ms/body':>8} {'MB/s':>7} "
+              f"{'on-the-fly ms':>14} {'cached ms':>10} {'saved/req':>10}")
+        results[name] = {}
+        for encoding in available_encodings():
+            level = levels.get(encoding)
+            if level is None:
+                continue
+            r = bench_one(body, encoding, level, args.rounds)
+            r["on_the_fly_ms"] = round(r["ms_per_body"] * args.requests, 1)
+            r["cached_ms"] = r["ms_per_body"]
+            r["bytes_saved_per_request"] = r["bytes_in"] - r["bytes_out"]
+            results[name][encoding] = r
+            print(f"{encoding:<8} {level:>5} {r['bytes_out']:>10,} {r['ratio']:>7} {r['ms_per_body']:>8} {r['mb_per_s']:>7} "
+                  f"{r['on_the_fly_ms']:>14} {r['cached_ms']:>10} {r['bytes_saved_per_request']:>10,}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"requests": args.requests, "levels": levels, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
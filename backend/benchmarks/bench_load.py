@@ -0,0 +1,175 @@
+"""
+Open-loop load benchmark over the API test catalog.
+
+Requests are fired at a fixed arrival rate (constant or Poisson), each in
+its own coroutine, whether or not earlier ones have finished, so a slow
+backend shows up as latency instead of silently lowering the offered load.
+Latency is measured from each request's scheduled start, which keeps
+coordinated omission out of the percentiles.
+
+Endpoints come from tests/endpoints.py; --mix picks one of its named
+mixes or takes explicit weights. Reports p50 / p95 / p99 / max latency,
+throughput and error rate per endpoint and overall. An error is a
+transport failure, a timeout or an unexpected status.
+
+Usage (from backend/):
+    python benchmarks/bench_load.py --url http://127.0.0.1:8001 --rate 200 --duration 30 --mix dashboard
+    python benchmarks/bench_load.py --mix "rankings.dashboard=3,tokens.stats=1" --json results/load.json
+    python benchmarks/bench_load.py --json new.json --compare old.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from tests.endpoints import BY_NAME, parse_mix  # noqa: E402
+from tests.latency import git_revision, percentile  # noqa: E402
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "throughput_rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+async def run_load(base_url: str, weights: dict, rate: float, duration: float, arrival: str,
+                   timeout: float, max_in_flight: int, seed: int = None) -> dict:
+    rng = random.Random(seed)
+    names = list(weights)
+    cumulative = list(weights.values())
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    status_counts = {}
+    in_flight = 0
+    skipped = 0
+
+    async def fire(client, endpoint, scheduled):
+        nonlocal in_flight
+        in_flight += 1
+        failed = False
+        try:
+            resp = await client.request(endpoint.method, endpoint.path, json=endpoint.body, headers=endpoint.headers)
+            await resp.aread()
+            failed = resp.status_code != endpoint.expect_status
+            status_counts[str(resp.status_code)] = status_counts.get(str(resp.status_code), 0) + 1
+        except httpx.HTTPError as err:
+            failed = True
+            label = type(err).__name__
+            status_counts[label] = status_counts.get(label, 0) + 1
+        finally:
+            in_flight -= 1
+        samples[endpoint.name].append((time.perf_counter() - scheduled) * 1000)
+        if failed:
+            errors[endpoint.name] += 1
+
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        tasks = set()
+        started = time.perf_counter()
+        next_at = started
+        while next_at - started < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if in_flight >= max_in_flight:
+                # The client is the bottleneck now; count it instead of queueing unboundedly
+                skipped += 1
+            else:
+                endpoint = BY_NAME[rng.choices(names, cumulative)[0]]
+                task = asyncio.ensure_future(fire(client, endpoint, next_at))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            next_at += rng.expovariate(rate) if arrival == "poisson" else 1 / rate
+        if tasks:
+            await asyncio.wait(tasks)
+        elapsed = time.perf_counter() - started
+
+    endpoints = {name: summarize(samples[name], errors[name], elapsed) for name in names if samples[name]}
+    everything = [value for name in names for value in samples[name]]
+    return {
+        "overall": {**summarize(everything, sum(errors.values()), elapsed), "skipped": skipped},
+        "statuses": status_counts,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(results: dict, baseline: dict = None):
+    header = f"{'endpoint':<36} {'reqs':>7} {'err%':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    if baseline:
+        header += f" {'p95 Δ':>9}"
+    print(header)
+    base_endpoints = (baseline or {}).get("endpoints", {})
+    rows = list(results["endpoints"].items()) + [("TOTAL", results["overall"])]
+    for name, r in rows:
+        line = (f"{name:<36} {r['requests']:>7} {r['error_rate'] * 100:>6.2f} {r['throughput_rps']:>8} "
+                f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['max_ms']:>8}")
+        if baseline:
+            before = baseline["overall"] if name == "TOTAL" else base_endpoints.get(name)
+            if before and before["p95_ms"]:
+                line += f" {(r['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100:>+8.1f}%"
+        print(line)
+    if results["overall"]["skipped"]:
+        print(f"\n{results['overall']['skipped']} arrivals skipped at --max-in-flight; raise it or lower --rate")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8001", help="proxy (or worker) base URL")
+    parser.add_argument("--mix", default="reads", help="mix name from tests/endpoints.py or name=weight,...")
+    parser.add_argument("--rate", type=float, default=100, help="arrivals per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load")
+    parser.add_argument("--arrival", choices=("constant", "poisson"), default="poisson")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--seed", type=int, help="seed the endpoint and arrival sequence")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of unmeasured load first")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="earlier --json results to show p95 change against")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    if args.warmup > 0:
+        asyncio.run(run_load(args.url, weights, args.rate, args.warmup, args.arrival, args.timeout, args.max_in_flight, args.seed))
+    results = asyncio.run(run_load(
+        args.url, weights, args.rate, args.duration, args.arrival, args.timeout, args.max_in_flight, args.seed,
+    ))
+
+    baseline = json.loads(Path(args.compare).read_text())["results"] if args.compare else None
+    print_report(results, baseline)
+
+    if args.json:
+        path = Path(args.json)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "url": args.url,
+            "mix": weights,
+            "rate": args.rate,
+            "duration": args.duration,
+            "arrival": args.arrival,
+            "results": results,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
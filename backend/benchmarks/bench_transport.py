@@ -0,0 +1,173 @@
+"""
+Proxy transport benchmark: loopback TCP vs Unix domain socket.
+
+Starts one minimal upstream that listens on both a TCP port and a Unix
+socket, then drives it through the proxy's own upstream client
+(gateway.upstream) over each transport:
+
+- latency:    sequential requests, p50 / p95 / p99 / max
+- throughput: fixed number of requests at a given concurrency, req/s
+
+Usage (from backend/):
+    python benchmarks/bench_transport.py --requests 5000 --concurrency 64 --payload 2048
+    python benchmarks/bench_transport.py --tcp-url http://127.0.0.1:8002 --uds-path /tmp/ts.sock \\
+        --path /api/health        # against already-running TS workers
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from gateway.upstream import make_upstream_client, upstream_limits  # noqa: E402
+from gateway.workers import WorkerPool  # noqa: E402
+from tests.latency import percentile  # noqa: E402
+
+
+def make_echo_app(payload_bytes: int):
+    """ASGI app that answers every request with a fixed JSON body"""
+    body = json.dumps({"ok": True, "data": "x" * max(0, payload_bytes - 24)}).encode()
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def serve(port: int, uds: str, payload_bytes: int):
+    """Run the echo upstream on a TCP port and a Unix socket at once"""
+    import uvicorn
+
+    app = make_echo_app(payload_bytes)
+
+    async def main():
+        servers = [
+            uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")),
+            uvicorn.Server(uvicorn.Config(app, uds=uds, log_level="warning")),
+        ]
+        for server in servers:
+            server.install_signal_handlers = lambda: None
+        await asyncio.gather(*(server.serve() for server in servers))
+
+    asyncio.run(main())
+
+
+async def measure(client, url: str, requests: int, concurrency: int) -> dict:
+    # Warm the pool so connection setup is not counted
+    for _ in range(min(50, requests)):
+        (await client.get(url)).raise_for_status()
+
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        resp = await client.get(url)
+        resp.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    remaining = requests
+
+    async def runner():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            (await client.get(url)).raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(runner() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3),
+        "throughput_rps": round(requests / elapsed, 1),
+    }
+
+
+async def run(args) -> dict:
+    limits = upstream_limits(args.concurrency, args.concurrency, 30)
+    results = {}
+    for transport in ("tcp", "uds"):
+        pool = WorkerPool(args.port, 1, socket_dir=str(Path(args.uds_path).parent) if transport == "uds" else None)
+        worker = pool.workers[0]
+        if transport == "uds":
+            worker.socket_path = args.uds_path
+        elif args.tcp_url:
+            worker.url = args.tcp_url.rstrip("/")
+        async with make_upstream_client(pool, timeout=30, limits=limits) as client:
+            results[transport] = await measure(client, f"{worker.url}{args.path}", args.requests, args.concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--payload", type=int, default=1024, help="echo upstream body size in bytes")
+    parser.add_argument("--port", type=int, default=18002)
+    parser.add_argument("--path", default="/api/health")
+    parser.add_argument("--tcp-url", help="benchmark an already-running upstream instead of the echo app")
+    parser.add_argument("--uds-path", help="Unix socket of an already-running upstream")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.uds_path, args.payload)
+        return
+
+    upstream = None
+    if not (args.tcp_url and args.uds_path):
+        args.tcp_url = None
+        args.uds_path = os.path.join(tempfile.gettempdir(), f"bench-transport-{os.getpid()}.sock")
+        upstream = subprocess.Popen([
+            sys.executable, __file__, "--serve",
+            "--port", str(args.port), "--uds-path", args.uds_path, "--payload", str(args.payload),
+        ])
+        deadline = time.monotonic() + 10
+        while not os.path.exists(args.uds_path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.2)
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if upstream:
+            upstream.terminate()
+            upstream.wait(timeout=5)
+            if os.path.exists(args.uds_path):
+                os.unlink(args.uds_path)
+
+    print(f"{'transport':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'req/s':>10}")
+    for transport, r in results.items():
+        print(f"{transport:<10} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['max_ms']:>8} {r['throughput_rps']:>10}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "payload": args.payload,
+            "path": args.path,
+            "results": results,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
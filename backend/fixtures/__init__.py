@@ -0,0 +1,3 @@
+"""
+Offline stand-in backend: recorded API responses and the server that replays them.
+"""
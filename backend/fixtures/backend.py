@@ -0,0 +1,262 @@
+"""
+Recorded-fixture stand-in for a TypeScript worker.
+
+Replays the responses in fixtures/recorded.json (see fixtures.record) with
+no database, RPC or network access, so the proxy can be tested and
+benchmarked on one machine. It speaks the same process contract as
+`tsx src/server.ts`: listens on PORT, or on SOCKET_PATH when that is set,
+answers /api/health once up and serves the /ws protocol of
+src/core/websocket/ws-gateway.ts.
+server.py starts it instead of tsx when TS_BACKEND=fixtures.
+
+Knobs, all environment variables:
+
+- FIXTURE_RECORDINGS      recordings file (default fixtures/recorded.json)
+- FIXTURE_LATENCY_MS      artificial latency added to every response
+- FIXTURE_JITTER_MS       uniform random extra latency on top of that
+- FIXTURE_ROUTE_LATENCY   "prefix=ms,..." per-route latency, longest prefix wins
+- FIXTURE_PAYLOAD_BYTES   pad every JSON object body to at least this size
+- FIXTURE_WS_INTERVAL_MS  emit one fake SystemEvent per category at this
+                          interval (0 = never); like ws-gateway.ts, each
+                          connection gets the categories it subscribed to,
+                          or all of them when it subscribed to none
+
+A recording can also be a list of variants, each with a "when" object that
+must match fields of the JSON request body (the first one without "when"
+is the fallback). Requests without a recording get Fastify's 404 body.
+
+Usage (from backend/):
+    PORT=8002 python -m fixtures.backend
+"""
+
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gateway.cache import longest_prefix  # noqa: E402
+from gateway.config import env_float, env_int, env_map  # noqa: E402
+from fixtures.record import DEFAULT_PATH, record_key  # noqa: E402
+
+
+# ws-gateway.ts getEventCategory(), and one sample SystemEvent per category
+EVENT_CATEGORIES = (
+    ('bootstrap.', 'bootstrap'),
+    ('resolver.', 'resolver'),
+    ('attribution.', 'attribution'),
+    ('alert.', 'alerts'),
+    ('signal.', 'signals'),
+)
+SAMPLE_EVENTS = (
+    lambda n: {'type': 'bootstrap.progress', 'dedupKey': 'fixture', 'progress': n % 100, 'step': 'indexing', 'eta': None},
+    lambda n: {'type': 'resolver.updated', 'input': 'fixture.eth', 'status': 'resolved', 'confidence': 0.9},
+    lambda n: {'type': 'attribution.confirmed', 'subjectType': 'entity', 'subjectId': 'fixture', 'address': '0x0'},
+    lambda n: {'type': 'alert.new', 'alertId': f'alert-{n}', 'severity': 1, 'message': 'fixture alert'},
+    lambda n: {'type': 'signal.new', 'signalId': f'signal-{n}', 'actor': 'fixture', 'action': 'buy'},
+)
+
+
+def event_category(type_: str) -> str:
+    for prefix, category in EVENT_CATEGORIES:
+        if type_.startswith(prefix):
+            return category
+    return 'resolver'
+
+
+def compact(body) -> bytes:
+    return json.dumps(body, separators=(',', ':')).encode()
+
+
+def padded(body, payload_bytes: int) -> bytes:
+    """Serialized body, grown with a '_pad' field to at least payload_bytes"""
+    raw = compact(body)
+    if isinstance(body, dict) and len(raw) < payload_bytes:
+        # '"_pad":"",' adds 10 bytes before the padding itself
+        raw = compact({**body, '_pad': 'x' * max(0, payload_bytes - len(raw) - 10)})
+    return raw
+
+
+class FixtureBackend:
+    """ASGI app replaying recorded responses with artificial latency."""
+
+    def __init__(self, recordings: dict, latency_ms: float = 0, jitter_ms: float = 0,
+                 route_latency: dict = None, payload_bytes: int = 0, ws_interval_ms: float = 0):
+        # Bodies are serialized once here, so replay cost stays flat per request.
+        # A recording is one response, or a list of variants picked by request body.
+        self.responses = {}
+        for key, rec in recordings['responses'].items():
+            if isinstance(rec, list):
+                self.responses[key] = [
+                    (variant.get('when'), variant['status'], padded(variant['body'], payload_bytes))
+                    for variant in rec
+                ]
+            else:
+                self.responses[key] = (rec['status'], padded(rec['body'], payload_bytes))
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.route_latency = route_latency or {}
+        self.ws_interval_ms = ws_interval_ms
+        self.ws_clients = 0
+        self.served = 0
+
+    def delay_for(self, path: str) -> float:
+        prefix = longest_prefix(path, self.route_latency)
+        base = self.route_latency[prefix] if prefix is not None else self.latency_ms
+        if self.jitter_ms:
+            base += random.uniform(0, self.jitter_ms)
+        return base / 1000
+
+    def lookup(self, method: str, path: str, query: str, body: bytes = b''):
+        found = self.responses.get(record_key(method, path, query))
+        if found is None and query:
+            found = self.responses.get(record_key(method, path))
+        if isinstance(found, list):
+            found = match_variant(found, body)
+        if found is None:
+            found = (404, compact({'message': f"Route {method}:{path} not found", 'error': 'Not Found', 'statusCode': 404}))
+        return found
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            await self.websocket(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await receive()  # lifespan.startup
+            await send({'type': 'lifespan.startup.complete'})
+            await receive()  # lifespan.shutdown
+            await send({'type': 'lifespan.shutdown.complete'})
+
+    async def http(self, scope, receive, send):
+        # Read the whole request body; variants may match on it
+        chunks = []
+        more = True
+        while more:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            more = message.get('more_body', False)
+        path = scope['path']
+        query = scope['query_string'].decode()
+        delay = self.delay_for(path)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        status, body = self.lookup(scope['method'], path, query, b''.join(chunks))
+        self.served += 1
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json; charset=utf-8'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def websocket(self, scope, receive, send):
+        if scope['path'] != '/ws':
+            await send({'type': 'websocket.close', 'code': 1008})
+            return
+        await receive()  # websocket.connect
+        await send({'type': 'websocket.accept'})
+        self.ws_clients += 1
+        await self.ws_send(send, {'type': 'connected', 'clientId': f'ws_fixture_{self.ws_clients}', 'timestamp': now_ms()})
+        subscriptions = set()
+        broadcaster = asyncio.ensure_future(self.broadcast(send, subscriptions)) if self.ws_interval_ms > 0 else None
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'websocket.disconnect':
+                    return
+                try:
+                    data = json.loads(message.get('text') or message.get('bytes') or b'')
+                except ValueError:
+                    continue
+                if not isinstance(data, dict):
+                    continue
+                type_, category = data.get('type'), data.get('category')
+                if type_ == 'hello' and isinstance(data.get('subscriptions'), list):
+                    subscriptions.clear()
+                    subscriptions.update(data['subscriptions'])
+                elif type_ == 'subscribe' and category:
+                    subscriptions.add(category)
+                elif type_ == 'unsubscribe' and category:
+                    subscriptions.discard(category)
+                elif type_ == 'ping':
+                    await self.ws_send(send, {'type': 'pong', 'timestamp': now_ms()})
+        finally:
+            if broadcaster is not None:
+                broadcaster.cancel()
+
+    @staticmethod
+    async def ws_send(send, message: dict):
+        await send({'type': 'websocket.send', 'text': json.dumps(message, separators=(',', ':'))})
+
+    async def broadcast(self, send, subscriptions: set):
+        sequence = 0
+        while True:
+            await asyncio.sleep(self.ws_interval_ms / 1000)
+            sequence += 1
+            for sample in SAMPLE_EVENTS:
+                event = sample(sequence)
+                # SystemEvents carry no channel; an empty subscription set means everything
+                if not subscriptions or event_category(event['type']) in subscriptions:
+                    await self.ws_send(send, event)
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def match_variant(variants: list, body: bytes):
+    """First variant whose 'when' fields all equal the request's JSON body fields"""
+    try:
+        request = json.loads(body) if body else {}
+    except ValueError:
+        request = {}
+    if not isinstance(request, dict):
+        request = {}
+    for when, status, raw in variants:
+        if not when or all(request.get(k) == v for k, v in when.items()):
+            return status, raw
+    return None
+
+
+def load_recordings(path: str = None) -> dict:
+    return json.loads(Path(path or DEFAULT_PATH).read_text())
+
+
+def app_from_env() -> FixtureBackend:
+    return FixtureBackend(
+        load_recordings(os.environ.get('FIXTURE_RECORDINGS')),
+        latency_ms=env_float('FIXTURE_LATENCY_MS', 0),
+        jitter_ms=env_float('FIXTURE_JITTER_MS', 0),
+        route_latency={k: float(v) for k, v in env_map('FIXTURE_ROUTE_LATENCY', {}).items()},
+        payload_bytes=env_int('FIXTURE_PAYLOAD_BYTES', 0),
+        ws_interval_ms=env_float('FIXTURE_WS_INTERVAL_MS', 0),
+    )
+
+
+def main():
+    import uvicorn
+
+    app = app_from_env()
+    socket_path = os.environ.get('SOCKET_PATH')
+    role = os.environ.get('WORKER_ROLE', 'primary')
+    if os.environ.get('WORKER_DEFER_JOBS'):
+        # Sent by the proxy once the primary this one replaces has exited
+        signal.signal(signal.SIGUSR2, lambda *_: print(f"[Fixtures] {role} background jobs released"))
+    print(f"[Fixtures] {role} serving {len(app.responses)} recorded responses on {socket_path or os.environ.get('PORT', '8002')}")
+    if socket_path:
+        uvicorn.run(app, uds=socket_path, log_level='warning')
+    else:
+        uvicorn.run(app, host='127.0.0.1', port=env_int('PORT', 8002), log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
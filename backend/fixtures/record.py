@@ -0,0 +1,263 @@
+"""
+Build the fixture backend's recordings.
+
+Two sources, same file format:
+
+- record:     GET every read endpoint in tests/endpoints.py from a running
+              backend and store the responses as they came back
+- synthesize: generate a deterministic dataset with the shapes the TS
+              handlers return and the API suites assert on; this is what
+              the checked-in fixtures/recorded.json is made from
+
+Usage (from backend/):
+    python -m fixtures.record --synthesize
+    python -m fixtures.record --url http://127.0.0.1:8001 --out fixtures/live.json
+"""
+
+import argparse
+import json
+import random
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from gateway.cache import cache_key  # noqa: E402
+from tests.endpoints import ENDPOINTS  # noqa: E402
+
+DEFAULT_PATH = Path(__file__).resolve().parent / 'recorded.json'
+
+SYMBOLS = (
+    'USDT', 'USDC', 'WETH', 'WBTC', 'DAI', 'LINK', 'UNI', 'AAVE', 'MKR', 'LDO',
+    'ARB', 'OP', 'PEPE', 'SHIB', 'CRV', 'SNX', 'COMP', 'GRT', 'ENS', 'RPL',
+    'APE', 'BLUR', 'FXS', 'SUSHI', 'BAL', '1INCH', 'YFI', 'DYDX', 'IMX', 'MATIC',
+    'STETH', 'RETH', 'FRAX', 'LUSD', 'GNO', 'CVX', 'ETHFI', 'PENDLE', 'ENA', 'WLD',
+)
+BUCKETS = ('BUY', 'WATCH', 'SELL')
+LABELS = ('BUY', 'NEUTRAL', 'SELL')
+
+
+def record_key(method: str, path: str, query: str = '') -> str:
+    """Lookup key of a response: method plus path with sorted query"""
+    return f"{method.upper()} {cache_key(path, query)}"
+
+
+def iso(ts: datetime) -> str:
+    return ts.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def synthesize(seed: int = 42) -> dict:
+    """Recordings for every catalog endpoint from a seeded, self-consistent dataset"""
+    rng = random.Random(seed)
+    analyzed_at = iso(datetime(2026, 1, 20, 13, 9, 58, 387000, tzinfo=timezone.utc))
+
+    tokens = []
+    for i, symbol in enumerate(SYMBOLS):
+        tokens.append({
+            'symbol': symbol,
+            'name': f"{symbol.title()} Token",
+            'contractAddress': '0x' + ''.join(rng.choice('0123456789abcdef') for _ in range(40)),
+            'chainId': 1,
+            'decimals': 6 if symbol in ('USDT', 'USDC') else 18,
+            'marketCap': round(rng.uniform(5e7, 9e10) / (i + 1), 2),
+            'volume24h': round(rng.uniform(1e6, 5e9) / (i + 1), 2),
+            'priceUsd': round(rng.uniform(0.0001, 3500), 6),
+            'priceChange24h': round(rng.uniform(-15, 15), 2),
+            'source': 'coingecko',
+            'isActive': True,
+            'lastSyncedAt': analyzed_at,
+        })
+
+    analyses = []
+    for token in tokens:
+        score = rng.randint(20, 95)
+        label = 'BUY' if score >= 70 else 'SELL' if score < 40 else 'NEUTRAL'
+        analyses.append({
+            'symbol': token['symbol'],
+            'contractAddress': token['contractAddress'],
+            'engineScore': score,
+            'confidence': rng.randint(30, 95),
+            'risk': rng.randint(5, 80),
+            'engineLabel': label,
+            'engineStrength': rng.choice(('weak', 'moderate', 'strong')),
+            'coverage': {'onchain': rng.random() > 0.2, 'market': True, 'social': rng.random() > 0.5},
+            'analyzedAt': analyzed_at,
+            'status': 'completed' if rng.random() > 0.1 else 'failed',
+        })
+    analyses.sort(key=lambda a: a['engineScore'], reverse=True)
+    by_symbol = {a['symbol']: a for a in analyses}
+
+    rankings = []
+    for token in tokens:
+        analysis = by_symbol[token['symbol']]
+        composite = round(0.6 * analysis['engineScore'] + 0.4 * rng.uniform(20, 90), 2)
+        rankings.append({
+            'symbol': token['symbol'],
+            'name': token['name'],
+            'contractAddress': token['contractAddress'],
+            'compositeScore': composite,
+            'marketCapScore': round(rng.uniform(0, 100), 2),
+            'momentumScore': round(rng.uniform(0, 100), 2),
+            'engineScore': analysis['engineScore'],
+            'engineConfidence': analysis['confidence'],
+            'engineLabel': analysis['engineLabel'],
+            'bucket': 'BUY' if composite >= 65 else 'SELL' if composite < 45 else 'WATCH',
+            'priceChange24h': token['priceChange24h'],
+            'computedAt': analyzed_at,
+        })
+    rankings.sort(key=lambda r: r['compositeScore'], reverse=True)
+    in_bucket = {b: [r for r in rankings if r['bucket'] == b] for b in BUCKETS}
+    for bucket in BUCKETS:
+        for rank, row in enumerate(in_bucket[bucket], 1):
+            row['bucketRank'] = rank
+    counts = {b: len(in_bucket[b]) for b in BUCKETS}
+    with_engine = sum(1 for a in analyses if a['status'] == 'completed')
+
+    def ok(data):
+        return {'status': 200, 'body': {'ok': True, 'data': data}}
+
+    def page(key, items, limit):
+        return ok({key: items[:limit], 'total': len(items), 'limit': limit, 'offset': 0, 'hasMore': limit < len(items)})
+
+    def bucket_row(row):
+        return {k: v for k, v in row.items() if k != 'bucket'}
+
+    listing = ['symbol', 'contractAddress', 'engineScore', 'confidence', 'risk', 'engineLabel', 'engineStrength', 'analyzedAt', 'status']
+    summary = {**counts, 'total': len(rankings), 'withEngineData': with_engine}
+    eth_matches = [t for t in tokens if 'ETH' in t['symbol'] or 'ETH' in t['name'].upper()]
+    top_analysis = analyses[0]['symbol']
+
+    responses = {
+        record_key('GET', '/api/health'): ok({'status': 'ok', 'uptime': 3600, 'mongo': 'connected'}),
+        record_key('GET', '/api/tokens/stats'): ok({
+            'totalTokens': len(tokens),
+            'activeTokens': len(tokens),
+            'byChain': {'1': len(tokens)},
+            'bySource': {'coingecko': len(tokens)},
+            'topTokens': [{'symbol': t['symbol'], 'marketCap': t['marketCap']} for t in tokens[:5]],
+        }),
+        record_key('GET', '/api/tokens', 'limit=10'): page('tokens', tokens, 10),
+        record_key('GET', '/api/tokens', 'search=ETH&limit=5'): page('tokens', eth_matches, 5),
+        record_key('GET', '/api/tokens/top', 'limit=10'): ok({'tokens': tokens[:10], 'count': 10}),
+        record_key('GET', '/api/rankings', 'limit=10'): ok({'rankings': rankings[:10], 'total': len(rankings), 'limit': 10, 'offset': 0}),
+        record_key('GET', '/api/rankings/buckets'): ok(summary),
+        record_key('GET', '/api/rankings/dashboard', 'limit=5'): ok({
+            'summary': summary,
+            'buckets': {b: [bucket_row(r) for r in in_bucket[b][:5]] for b in BUCKETS},
+        }),
+        record_key('GET', '/api/rankings/movers', 'limit=5'): ok({
+            'movers': sorted(rankings, key=lambda r: abs(r['priceChange24h']), reverse=True)[:5],
+            'count': 5,
+        }),
+        record_key('POST', '/api/rankings/compute'): ok({
+            'computed': len(rankings),
+            'buckets': counts,
+            'withEngineData': with_engine,
+            'withoutEngineData': len(rankings) - with_engine,
+            'duration_ms': 412,
+        }),
+        record_key('GET', '/api/token-runner/stats'): ok({
+            'totalAnalyses': len(analyses),
+            'completed': with_engine,
+            'failed': len(analyses) - with_engine,
+            'byLabel': {label: sum(1 for a in analyses if a['engineLabel'] == label) for label in LABELS},
+            'lastRunAt': analyzed_at,
+        }),
+        record_key('GET', '/api/token-runner/top', 'limit=10'): ok({
+            'tokens': [{k: a[k] for k in ('symbol', 'engineScore', 'confidence', 'risk', 'engineLabel')} for a in analyses[:10]],
+            'count': 10,
+        }),
+        record_key('GET', '/api/token-runner/analysis/NONEXISTENT_TOKEN_XYZ'): {
+            'status': 200, 'body': {'ok': False, 'error': 'No analysis found for this token'},
+        },
+        record_key('POST', '/api/token-runner/run'): ok({
+            'processed': 5,
+            'successful': 5,
+            'failed': 0,
+            'skipped': 0,
+            'duration_ms': 1840,
+            'tokens': [{
+                'symbol': a['symbol'],
+                'contractAddress': a['contractAddress'],
+                'engineScore': a['engineScore'],
+                'confidence': a['confidence'],
+                'risk': a['risk'],
+                'label': a['engineLabel'],
+                'status': 'completed',
+                'processingTime': rng.randint(150, 600),
+            } for a in analyses[:5]],
+        }),
+        record_key('GET', '/api/engine/ml/runtime'): ok({'mlEnabled': True, 'mlMode': 'advisor', 'killSwitchActive': False}),
+        record_key('POST', '/api/engine/ml/runtime'): [
+            {'when': {'mlMode': mode}, **ok({'mlEnabled': mode != 'off', 'mlMode': mode, 'killSwitchActive': False})}
+            for mode in ('off', 'advisor', 'assist')
+        ] + [{'status': 200, 'body': {'ok': False, 'error': 'Invalid mlMode. Must be one of: off, advisor, assist'}}],
+    }
+
+    for symbol in ('USDT', top_analysis):
+        responses[record_key('GET', f'/api/tokens/{symbol}')] = ok(next(t for t in tokens if t['symbol'] == symbol))
+        responses[record_key('GET', f'/api/token-runner/analysis/{symbol}')] = ok(by_symbol[symbol])
+    for bucket in BUCKETS:
+        rows = [bucket_row(r) for r in in_bucket[bucket][:5]]
+        responses[record_key('GET', f'/api/rankings/bucket/{bucket}', 'limit=5')] = ok({'bucket': bucket, 'tokens': rows, 'count': len(rows)})
+
+    listed = [{k: a[k] for k in listing} for a in analyses]
+    for query, items in (
+        ('limit=1', listed),
+        ('limit=10', listed),
+        ('limit=50', listed),
+        ('status=completed&limit=5', [a for a in listed if a['status'] == 'completed']),
+        ('label=NEUTRAL&limit=5', [a for a in listed if a['engineLabel'] == 'NEUTRAL']),
+    ):
+        limit = int(dict(p.split('=') for p in query.split('&'))['limit'])
+        responses[record_key('GET', '/api/token-runner/analyses', query)] = page('analyses', items, limit)
+
+    return {'source': 'synthetic', 'seed': seed, 'recorded_at': analyzed_at, 'responses': responses}
+
+
+def record(base_url: str, include_mutating: bool = False, timeout: float = 30) -> dict:
+    """Recordings captured from a running backend"""
+    responses = {}
+    with httpx.Client(base_url=base_url, timeout=timeout) as client:
+        for endpoint in ENDPOINTS:
+            if endpoint.mutating and not include_mutating:
+                continue
+            # Through the proxy, compute calls are background jobs; ask for the result inline
+            headers = {'prefer': f'wait={timeout:g}'} if endpoint.mutating else None
+            resp = client.request(endpoint.method, endpoint.path, json=endpoint.body, headers=headers)
+            path, _, query = endpoint.path.partition('?')
+            try:
+                body = resp.json()
+            except ValueError:
+                print(f"skipping {endpoint.name}: non-JSON response ({resp.status_code})")
+                continue
+            responses[record_key(endpoint.method, path, query)] = {'status': resp.status_code, 'body': body}
+            print(f"recorded {endpoint.method} {endpoint.path} -> {resp.status_code}")
+    return {
+        'source': base_url,
+        'recorded_at': iso(datetime.now(timezone.utc)),
+        'responses': responses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--url', help='record from this running backend')
+    source.add_argument('--synthesize', action='store_true', help='generate the synthetic dataset')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--include-mutating', action='store_true', help='also record POST endpoints (they run for real)')
+    parser.add_argument('--out', default=str(DEFAULT_PATH))
+    args = parser.parse_args()
+
+    recordings = synthesize(args.seed) if args.synthesize else record(args.url, args.include_mutating)
+    Path(args.out).write_text(json.dumps(recordings, indent=1, sort_keys=True) + '\n')
+    print(f"{len(recordings['responses'])} responses written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
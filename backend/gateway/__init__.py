@@ -0,0 +1,7 @@
+"""
+BlockView Proxy Gateway
+
+Building blocks for the Python proxy in server.py.
+The proxy carries no business logic; these modules only deal with
+supervising the TypeScript child and moving bytes to and from it.
+"""
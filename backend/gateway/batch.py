@@ -0,0 +1,127 @@
+"""
+Batch endpoint: many GETs in one round trip.
+
+POST /api/_proxy/batch takes {"requests": [...]}, where each item is a
+path with optional query ("/api/rankings/movers?limit=5") or an object
+{"id": "movers", "path": "/api/rankings/movers?limit=5", "headers": {...}}.
+Streamed routes (the NDJSON exports) cannot be batched, since their
+bodies would have to be buffered whole. server.py runs
+every sub-request concurrently through the normal proxy pipeline (rate
+limit, cache, coalescing, bulkheads, hedging, metrics) and answers with
+one JSON document holding each sub-response, in request order.
+
+Sub-requests inherit the caller's headers, so they count against the
+caller's rate limit and honour its Cache-Control, but never its
+Accept-Encoding or conditional headers: sub-bodies are embedded as JSON,
+and the combined response is what gets compressed. An item's own headers
+are added on top, under the same restriction.
+"""
+
+import json
+import re
+from typing import NamedTuple
+
+from gateway.cache import longest_prefix
+
+# Parent headers that belong to the batch call itself, not to its sub-requests
+DROPPED_HEADERS = {
+    'content-length', 'content-type', 'content-encoding', 'transfer-encoding', 'accept-encoding',
+    'if-none-match', 'if-modified-since', 'a-im',
+}
+
+# RFC 9110 token
+HEADER_NAME = re.compile(r"^[!#$%&'*+.^_`|~0-9A-Za-z-]+$")
+
+
+class BatchError(ValueError):
+    """The batch body is malformed; the message is returned to the caller"""
+
+
+class SubRequest(NamedTuple):
+    id: str
+    path: str
+    query: str
+    headers: tuple = ()
+
+
+def parse_headers(index: int, headers) -> tuple:
+    """An item's {"name": "value"} headers as raw ASGI pairs, minus DROPPED_HEADERS"""
+    if headers is None:
+        return ()
+    if not isinstance(headers, dict):
+        raise BatchError(f"Request {index}: headers must be an object")
+    pairs = []
+    for name, value in headers.items():
+        if not isinstance(value, str) or not HEADER_NAME.match(name) or '\r' in value or '\n' in value:
+            raise BatchError(f"Request {index}: invalid header {name!r}")
+        try:
+            value = value.encode('latin-1')
+        except UnicodeEncodeError:
+            raise BatchError(f"Request {index}: invalid header {name!r}") from None
+        if name.lower() not in DROPPED_HEADERS:
+            pairs.append((name.lower().encode('latin-1'), value))
+    return tuple(pairs)
+
+
+def parse_batch(payload, max_requests: int, reserved_prefix: str, streamed_prefixes=()) -> list:
+    """Validated SubRequests from a batch body; raises BatchError"""
+    items = payload.get('requests') if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError('Body must be {"requests": [...]} with at least one request')
+    if len(items) > max_requests:
+        raise BatchError(f"At most {max_requests} requests per batch")
+    subs = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'path': item}
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchError(f"Request {index} needs a path")
+        method = item.get('method', 'GET')
+        if not isinstance(method, str) or method.upper() != 'GET':
+            raise BatchError(f"Request {index}: only GET is supported")
+        path, _, query = item['path'].partition('?')
+        if not path.startswith('/api/') or path == reserved_prefix or path.startswith(reserved_prefix + '/'):
+            raise BatchError(f"Request {index}: path must be an /api/ route outside {reserved_prefix}")
+        if longest_prefix(path, streamed_prefixes) is not None:
+            raise BatchError(f"Request {index}: {path} is streamed and cannot be batched")
+        headers = parse_headers(index, item.get('headers'))
+        subs.append(SubRequest(str(item.get('id', index)), path, query, headers))
+    return subs
+
+
+def sub_request_scope(parent: dict, sub: SubRequest) -> dict:
+    """ASGI scope for a GET sub-request made on behalf of the batch caller"""
+    own = {name for name, _ in sub.headers}
+    headers = [
+        (k, v) for k, v in parent['headers']
+        if k.decode('latin-1').lower() not in DROPPED_HEADERS and k.lower() not in own
+    ] + list(sub.headers)
+    return {
+        'type': 'http',
+        'asgi': parent.get('asgi', {'version': '3.0'}),
+        'http_version': parent.get('http_version', '1.1'),
+        'method': 'GET',
+        'scheme': parent.get('scheme', 'http'),
+        'server': parent.get('server'),
+        'client': parent.get('client'),
+        'root_path': parent.get('root_path', ''),
+        'path': sub.path,
+        'raw_path': sub.path.encode(),
+        'query_string': sub.query.encode(),
+        'headers': headers,
+        'state': {},
+    }
+
+
+async def empty_body():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+def decode_body(content_type: str, body: bytes):
+    """Sub-response body for embedding: parsed JSON when it is JSON, else text"""
+    if 'json' in (content_type or ''):
+        try:
+            return json.loads(body)
+        except ValueError:
+            pass
+    return body.decode('utf-8', 'replace')
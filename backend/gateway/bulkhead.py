@@ -0,0 +1,120 @@
+"""
+Bulkheads: route classes with their own upstream pool, concurrency cap
+and timeout.
+
+Each request path maps to a class by longest configured prefix, falling
+back to 'default'. A class admits at most `max_concurrency` upstream
+calls at once; further calls wait in FIFO order for up to `queue_wait`
+seconds and are then turned away, so a pile of slow batch runs queues
+behind its own cap instead of taking every connection from cheap reads.
+
+A freed slot is handed straight to the next waiter, so a newcomer can
+never overtake the queue and a timed-out waiter can never strand a slot.
+"""
+
+import asyncio
+from collections import deque
+
+from gateway.cache import longest_prefix
+
+
+class RouteClass:
+    """One bulkhead: a concurrency cap, a wait queue and upstream settings."""
+
+    def __init__(self, name: str, max_concurrency: int, timeout: float, queue_wait: float = 5.0):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.queue_wait = queue_wait
+        self.client = None  # set at startup; None means use the shared client
+        self.active = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_active = 0
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting up to queue_wait; False if none came free in time"""
+        if self.active < self.max_concurrency and not self._waiters:
+            self._admit()
+            return True
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_wait)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as the wait ran out
+                self.admitted += 1
+                return True
+            self._discard(waiter)
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+        self.admitted += 1
+        return True
+
+    def _admit(self):
+        self.active += 1
+        self.admitted += 1
+        self.max_active = max(self.max_active, self.active)
+
+    def _discard(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        # Pass the slot on to the oldest live waiter; active stays the same
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "timeout_s": self.timeout,
+            "queue_wait_s": self.queue_wait,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_active": self.max_active,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+class Bulkheads:
+    """Maps request paths to route classes."""
+
+    def __init__(self, classes: list, prefixes: dict):
+        self.classes = {rc.name: rc for rc in classes}
+        if 'default' not in self.classes:
+            raise ValueError("Bulkheads need a 'default' route class")
+        unknown = set(prefixes.values()) - set(self.classes)
+        if unknown:
+            raise ValueError(f"Route prefixes refer to unknown classes: {sorted(unknown)}")
+        self.prefixes = prefixes  # prefix -> class name
+
+    def classify(self, path: str) -> RouteClass:
+        prefix = longest_prefix(path, self.prefixes)
+        return self.classes[self.prefixes[prefix] if prefix is not None else 'default']
+
+    def stats(self) -> dict:
+        return {
+            "prefixes": self.prefixes,
+            "classes": {name: rc.stats() for name, rc in self.classes.items()},
+        }
@@ -0,0 +1,212 @@
+"""
+Response cache for hot read endpoints.
+
+Entries are keyed on path plus normalized query string, expire after a
+per-route TTL and are bounded by entry count and total body bytes with an
+LRU policy. Successful mutating calls (e.g. POST /api/rankings/compute)
+purge every entry under the route prefixes configured for them.
+
+Routes may also keep expired entries around for a while (RFC 5861): for
+their stale-while-revalidate window an expired entry is still served
+while one background request refreshes it, and for their stale-if-error
+window it stands in for an upstream failure.
+"""
+
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+from gateway.etag import make_etag
+
+
+class CachedResponse:
+    """A complete upstream response held in memory."""
+
+    __slots__ = ('status_code', 'headers', 'body', 'stored_at', 'expires_at', 'variants', 'etag',
+                 'stale_until', 'error_until')
+
+    def __init__(self, status_code: int, headers: list, body: bytes, ttl: float):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+        # Content-Encoding -> compressed body, filled lazily on first request
+        self.variants = {}
+        # Hashed once at store time; every hit and 304 reuses it
+        self.etag = dict(headers).get('etag') or make_etag(body)
+        # Set by ResponseCache.put from the route's stale windows
+        self.stale_until = self.error_until = self.expires_at
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.variants.values())
+
+    def fresh(self, now: float = None) -> bool:
+        return (now or time.monotonic()) < self.expires_at
+
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+    def retained(self, now: float = None) -> bool:
+        """Still worth keeping: fresh, or inside one of its stale windows"""
+        return (now or time.monotonic()) < max(self.expires_at, self.stale_until, self.error_until)
+
+
+def longest_prefix(path: str, prefixes) -> str:
+    """Longest configured prefix that path falls under, or None"""
+    best = None
+    for prefix in prefixes:
+        if path == prefix or path.startswith(prefix.rstrip('/') + '/'):
+            if best is None or len(prefix) > len(best):
+                best = prefix
+    return best
+
+
+def cache_key(path: str, query: str) -> str:
+    """path?query with parameters sorted, so ?a=1&b=2 and ?b=2&a=1 share an entry"""
+    if not query:
+        return path
+    params = sorted(parse_qsl(query, keep_blank_values=True))
+    return f"{path}?{urlencode(params)}"
+
+
+class ResponseCache:
+    """TTL + LRU cache with prefix-based purge rules and counters."""
+
+    def __init__(self, routes: dict, purge: dict, max_entries: int = 1024,
+                 max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 4 * 1024 * 1024,
+                 stale: dict = None, stale_if_error: dict = None):
+        self.routes = routes          # prefix -> TTL seconds
+        self.purge = purge            # mutating path -> [prefixes to purge]
+        self.stale = stale or {}      # prefix -> stale-while-revalidate seconds
+        self.stale_if_error = stale_if_error or {}   # prefix -> stale-if-error seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.purges = 0
+        self.stale_hits = 0
+        # Bumped on every purge, so a response fetched before a purge
+        # is not stored after it
+        self.generation = 0
+
+    def ttl_for(self, path: str):
+        """TTL for a cacheable path, or None when the route is not cached"""
+        prefix = longest_prefix(path, self.routes)
+        return self.routes[prefix] if prefix else None
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if not entry.fresh():
+            if not entry.retained():
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def get_stale(self, key: str, on_error: bool = False):
+        """An expired entry still inside its stale-while-revalidate (or stale-if-error) window"""
+        entry = self._entries.get(key)
+        if entry is None or entry.fresh():
+            return None
+        if time.monotonic() >= (entry.error_until if on_error else entry.stale_until):
+            return None
+        self.stale_hits += 1
+        return entry
+
+    def _window(self, windows: dict, path: str) -> float:
+        prefix = longest_prefix(path, windows)
+        return windows[prefix] if prefix else 0
+
+    def put(self, key: str, entry: CachedResponse, generation: int = None) -> bool:
+        if entry.size > self.max_entry_bytes:
+            return False
+        if generation is not None and generation != self.generation:
+            return False
+        path = key.split('?', 1)[0]
+        entry.stale_until = entry.expires_at + self._window(self.stale, path)
+        entry.error_until = entry.expires_at + self._window(self.stale_if_error, path)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+        return True
+
+    def items(self, prefixes) -> list:
+        """(key, entry) for every retained entry under one of the prefixes, oldest use first"""
+        now = time.monotonic()
+        return [
+            (key, entry) for key, entry in self._entries.items()
+            if entry.retained(now) and longest_prefix(key.split('?', 1)[0], prefixes)
+        ]
+
+    def store_variant(self, key: str, entry: CachedResponse, encoding: str, body: bytes):
+        """Attach a compressed variant, counting it against the byte bound"""
+        entry.variants[encoding] = body
+        if self._entries.get(key) is entry:
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                if oldest == key:
+                    self._entries.move_to_end(key)
+                    continue
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def invalidate(self, prefixes) -> int:
+        """Drop every entry whose path falls under one of the prefixes"""
+        doomed = [
+            key for key in self._entries
+            if longest_prefix(key.split('?', 1)[0], prefixes)
+        ]
+        for key in doomed:
+            self._remove(key)
+        self.purges += len(doomed)
+        self.generation += 1
+        return len(doomed)
+
+    def on_mutation(self, path: str) -> int:
+        """Apply the purge rule for a successful non-GET call to path"""
+        prefixes = self.purge.get(path)
+        return self.invalidate(prefixes) if prefixes else 0
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self.generation += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "purged": self.purges,
+            "stale_hits": self.stale_hits,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,50 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+While a request for a key is in flight upstream, later callers with the
+same key await that result instead of issuing their own. The upstream call
+runs in its own task, so a leader whose client disconnects does not cancel
+the call for everyone waiting on it.
+
+Routes are opted in by exact path. A coalesced response has to be buffered
+to be shared, so the option suits small hot endpoints (dashboard, stats)
+and not the large list pages that are streamed through.
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    """Per-key in-flight deduplication with counters."""
+
+    def __init__(self, routes: list):
+        self.routes = list(routes)
+        self._paths = set(self.routes)
+        self._inflight = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def enabled_for(self, path: str) -> bool:
+        return path in self._paths
+
+    async def do(self, key: str, fn):
+        """Run fn() once per key at a time; concurrent callers share its result"""
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "routes": self.routes,
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.leaders,
+            "coalesced": self.followers,
+            "saved_ratio": round(self.followers / (self.leaders + self.followers), 4)
+            if self.leaders + self.followers else 0.0,
+        }
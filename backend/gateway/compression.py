@@ -0,0 +1,162 @@
+"""
+Negotiated response compression (zstd, brotli, gzip).
+
+gzip is always available; brotli and zstd are used when the `brotli` and
+`zstandard` packages are installed. The encoding is picked from the
+client's Accept-Encoding q-values, ties broken by server preference
+(zstd > br > gzip).
+
+Bodies can be compressed in one shot (buffered and cached responses) or
+incrementally (streamed responses). Every call is counted in
+CompressionStats so the CPU cost can be weighed against bytes saved.
+"""
+
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+SERVER_PREFERENCE = ('zstd', 'br', 'gzip')
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/', 'application/javascript', 'application/xml')
+
+
+def available_encodings() -> tuple:
+    return tuple(
+        enc for enc in SERVER_PREFERENCE
+        if enc == 'gzip' or (enc == 'br' and brotli) or (enc == 'zstd' and zstandard)
+    )
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """Accept-Encoding as {coding: q}"""
+    result = {}
+    for part in header.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        coding, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        result[coding.strip().lower()] = q
+    return result
+
+
+def negotiate(accept_encoding: str, encodings: tuple) -> str:
+    """Best encoding both sides support, or None for identity"""
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get('*')
+    best, best_q = None, 0.0
+    for enc in encodings:
+        q = accepted.get(enc, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = (content_type or '').lower()
+    return any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+
+class CompressionStats:
+    """Bytes in/out and time spent per encoding."""
+
+    def __init__(self):
+        self.by_encoding = {}
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, seconds: float):
+        s = self.by_encoding.setdefault(encoding, {"calls": 0, "bytes_in": 0, "bytes_out": 0, "cpu_ms": 0.0})
+        s["calls"] += 1
+        s["bytes_in"] += bytes_in
+        s["bytes_out"] += bytes_out
+        s["cpu_ms"] += seconds * 1000
+
+    def as_dict(self) -> dict:
+        result = {}
+        for enc, s in self.by_encoding.items():
+            result[enc] = {
+                **s,
+                "cpu_ms": round(s["cpu_ms"], 2),
+                "bytes_saved": s["bytes_in"] - s["bytes_out"],
+                "ratio": round(s["bytes_out"] / s["bytes_in"], 4) if s["bytes_in"] else 1.0,
+            }
+        return result
+
+
+class Compressor:
+    """One-shot and streaming compression at configured levels."""
+
+    def __init__(self, levels: dict, stats: CompressionStats = None):
+        self.levels = levels
+        self.stats = stats or CompressionStats()
+
+    def compress(self, body: bytes, encoding: str, level: int = None) -> bytes:
+        level = self.levels[encoding] if level is None else level
+        started = time.perf_counter()
+        if encoding == 'gzip':
+            out = gzip_compress(body, level)
+        elif encoding == 'br':
+            out = brotli.compress(body, quality=level)
+        elif encoding == 'zstd':
+            out = zstandard.ZstdCompressor(level=level).compress(body)
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        self.stats.record(encoding, len(body), len(out), time.perf_counter() - started)
+        return out
+
+    async def compress_stream(self, chunks, encoding: str):
+        """Compress an async iterator of chunks, flushing after each one"""
+        level = self.levels[encoding]
+        if encoding == 'gzip':
+            engine = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            process, flush, finish = engine.compress, lambda: engine.flush(zlib.Z_SYNC_FLUSH), engine.flush
+        elif encoding == 'br':
+            engine = brotli.Compressor(quality=level)
+            process, flush, finish = engine.process, engine.flush, engine.finish
+        elif encoding == 'zstd':
+            engine = zstandard.ZstdCompressor(level=level).compressobj()
+            process = engine.compress
+            flush = lambda: engine.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            finish = engine.flush
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+        bytes_in = bytes_out = 0
+        spent = 0.0
+        async for chunk in chunks:
+            started = time.perf_counter()
+            # Flushing per chunk keeps time-to-first-byte close to the upstream's
+            out = process(chunk) + flush()
+            spent += time.perf_counter() - started
+            bytes_in += len(chunk)
+            bytes_out += len(out)
+            if out:
+                yield out
+        started = time.perf_counter()
+        out = finish()
+        spent += time.perf_counter() - started
+        bytes_out += len(out)
+        self.stats.record(encoding, bytes_in, bytes_out, spent)
+        if out:
+            yield out
+
+
+def gzip_compress(body: bytes, level: int) -> bytes:
+    engine = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return engine.compress(body) + engine.flush()
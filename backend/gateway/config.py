@@ -0,0 +1,51 @@
+"""
+Environment helpers for proxy settings.
+
+All proxy knobs are plain environment variables, like the ones startup()
+already forwards to the TypeScript child.
+"""
+
+import os
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def env_map(name: str, default: dict) -> dict:
+    """
+    Parse "key=value,key=value" into a dict of strings.
+
+    An unset variable returns the default unchanged.
+    """
+    value = os.environ.get(name)
+    if not value:
+        return dict(default)
+    result = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        key, _, val = item.partition('=')
+        result[key.strip()] = val.strip()
+    return result
+
+
+def env_list(name: str, default: list) -> list:
+    """Parse "a,b,c" into a list of non-empty strings"""
+    value = os.environ.get(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(',') if item.strip()]
@@ -0,0 +1,238 @@
+"""
+Delta responses for polling clients (RFC 3229 style).
+
+A client that already holds a version of a delta route sends its ETag in
+If-None-Match together with "A-IM: json-delta". If the proxy still has
+that version, it answers 226 IM Used with a patch from it to the current
+body instead of the whole document. An unknown or evicted base, or a
+patch that is no smaller than the body, gets the full 200 response.
+
+The proxy keeps the last few parsed snapshots per route and query, but
+only for queries some client has asked a delta for: their successful 200
+responses are recorded as they pass through. Snapshots and memoized
+patches share a byte budget (counted as serialized JSON size); the least
+recently used queries are dropped first when it is exceeded. A patch is a list of operations,
+applied in order to the base document:
+
+- {"op": "set", "path": [...], "value": v}      replace one value
+- {"op": "unset", "path": [...]}                 delete one object key
+- {"op": "list", "path": [...], "key": "symbol",
+   "removed": [symbols], "changed": [partial items], "added": [items],
+   "order": [symbols]}                           patch a list of items
+
+List items are matched by symbol. A changed item carries only its symbol,
+the fields that differ, and a "$unset" list when fields went away.
+"order" is only sent when the new sequence is not simply the old one
+minus the removed items with the added ones appended.
+"""
+
+import json
+from collections import OrderedDict
+
+from gateway.etag import opaque_tags
+
+DELTA_IM = 'json-delta'
+ITEM_KEY = 'symbol'
+
+
+def wants_delta(a_im: str) -> bool:
+    return any(part.split(';')[0].strip().lower() == DELTA_IM for part in (a_im or '').split(','))
+
+
+def _keyed(items) -> bool:
+    if not isinstance(items, list):
+        return False
+    symbols = [item.get(ITEM_KEY) for item in items if isinstance(item, dict)]
+    return len(symbols) == len(items) and None not in symbols and len(set(symbols)) == len(symbols)
+
+
+def _diff_item(old: dict, new: dict):
+    changed = {k: v for k, v in new.items() if k not in old or old[k] != v}
+    gone = [k for k in old if k not in new]
+    if not changed and not gone:
+        return None
+    changed[ITEM_KEY] = new[ITEM_KEY]
+    if gone:
+        changed['$unset'] = gone
+    return changed
+
+
+def _diff_list(path: list, old: list, new: list):
+    old_by_key = {item[ITEM_KEY]: item for item in old}
+    new_keys = [item[ITEM_KEY] for item in new]
+    new_set = set(new_keys)
+    removed = [item[ITEM_KEY] for item in old if item[ITEM_KEY] not in new_set]
+    added, changed = [], []
+    for item in new:
+        before = old_by_key.get(item[ITEM_KEY])
+        if before is None:
+            added.append(item)
+        else:
+            patch = _diff_item(before, item)
+            if patch is not None:
+                changed.append(patch)
+    natural = [item[ITEM_KEY] for item in old if item[ITEM_KEY] in new_set] + [item[ITEM_KEY] for item in added]
+    if not (removed or added or changed) and natural == new_keys:
+        return None
+    op = {"op": "list", "path": path, "key": ITEM_KEY}
+    if removed:
+        op["removed"] = removed
+    if changed:
+        op["changed"] = changed
+    if added:
+        op["added"] = added
+    if natural != new_keys:
+        op["order"] = new_keys
+    return op
+
+
+def diff(old, new, path: list = None) -> list:
+    """Operations that turn old into new"""
+    path = path or []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "set", "path": path + [key], "value": value})
+            else:
+                ops.extend(diff(old[key], value, path + [key]))
+        ops.extend({"op": "unset", "path": path + [key]} for key in old if key not in new)
+        return ops
+    if _keyed(old) and _keyed(new):
+        op = _diff_list(path, old, new)
+        return [op] if op else []
+    if old != new:
+        return [{"op": "set", "path": path, "value": new}]
+    return []
+
+
+def _parent(doc, path: list):
+    for key in path[:-1]:
+        doc = doc[key]
+    return doc
+
+
+def apply_delta(doc, ops: list):
+    """Apply a patch from diff() to (a copy of) its base document"""
+    doc = json.loads(json.dumps(doc))
+    for op in ops:
+        path = op["path"]
+        if op["op"] == "set":
+            if not path:
+                doc = op["value"]
+            else:
+                _parent(doc, path)[path[-1]] = op["value"]
+        elif op["op"] == "unset":
+            del _parent(doc, path)[path[-1]]
+        elif op["op"] == "list":
+            items = _parent(doc, path)[path[-1]] if path else doc
+            key = op["key"]
+            gone = set(op.get("removed", ()))
+            by_key = OrderedDict((item[key], item) for item in items if item[key] not in gone)
+            for patch in op.get("changed", ()):
+                item = by_key[patch[key]]
+                for field in patch.get('$unset', ()):
+                    item.pop(field, None)
+                item.update({k: v for k, v in patch.items() if k != '$unset'})
+            for item in op.get("added", ()):
+                by_key[item[key]] = item
+            order = op.get("order", list(by_key))
+            result = [by_key[k] for k in order]
+            if not path:
+                doc = result
+            else:
+                _parent(doc, path)[path[-1]] = result
+    return doc
+
+
+class DeltaHistory:
+    """Recent parsed snapshots per route and query, and the patches between them."""
+
+    def __init__(self, versions: int = 8, max_keys: int = 256, max_bytes: int = 32 * 1024 * 1024):
+        self.versions = max(2, versions)
+        self.max_keys = max_keys
+        self.max_bytes = max_bytes
+        self._snapshots = OrderedDict()   # key -> OrderedDict(etag -> (document, size))
+        self._patches = OrderedDict()     # (key, base, etag) -> encoded patch
+        self._bytes = 0
+        self.recorded = 0
+        self.evictions = 0
+        self.deltas = 0
+        self.misses = 0
+
+    def tracks(self, key: str) -> bool:
+        """True once a client has asked for deltas of key (and it was not evicted since)"""
+        return key in self._snapshots
+
+    def record(self, key: str, etag: str, body: bytes):
+        """Remember the document behind etag; a no-op when it is already the latest"""
+        if len(body) > self.max_bytes:
+            return
+        versions = self._snapshots.get(key)
+        if versions is not None:
+            self._snapshots.move_to_end(key)
+            if etag in versions:
+                return
+        try:
+            document = json.loads(body)
+        except (ValueError, UnicodeDecodeError):
+            return
+        if versions is None:
+            versions = self._snapshots[key] = OrderedDict()
+        versions[etag] = (document, len(body))
+        self._bytes += len(body)
+        while len(versions) > self.versions:
+            self._bytes -= versions.popitem(last=False)[1][1]
+        self.recorded += 1
+        self._evict(keep=key)
+
+    def _evict(self, keep: str = None):
+        """Drop least recently used queries, then old patches, until within both bounds"""
+        while len(self._snapshots) > self.max_keys or self._bytes > self.max_bytes:
+            oldest = next(iter(self._snapshots))
+            if oldest == keep:
+                if len(self._snapshots) == 1:
+                    break
+                self._snapshots.move_to_end(keep)
+                continue
+            versions = self._snapshots.pop(oldest)
+            self._bytes -= sum(size for _, size in versions.values())
+            for memo in [memo for memo in self._patches if memo[0] == oldest]:
+                self._bytes -= len(self._patches.pop(memo))
+            self.evictions += 1
+        while self._patches and (len(self._patches) > self.max_keys or self._bytes > self.max_bytes):
+            self._bytes -= len(self._patches.popitem(last=False)[1])
+
+    def patch(self, key: str, if_none_match: str, etag: str):
+        """(base etag, encoded patch) from a version the client holds to etag, or None"""
+        versions = self._snapshots.get(key, {})
+        if etag not in versions or not if_none_match:
+            return None
+        for base in opaque_tags(if_none_match):
+            if base != etag and base in versions:
+                break
+        else:
+            self.misses += 1
+            return None
+        memo = (key, base, etag)
+        encoded = self._patches.get(memo)
+        if encoded is None:
+            ops = diff(versions[base][0], versions[etag][0])
+            encoded = json.dumps({"base": base, "etag": etag, "ops": ops}, separators=(',', ':')).encode()
+            self._patches[memo] = encoded
+            self._bytes += len(encoded)
+            self._evict(keep=key)
+        self.deltas += 1
+        return base, encoded
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._snapshots),
+            "snapshots": sum(len(v) for v in self._snapshots.values()),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "recorded": self.recorded,
+            "evictions": self.evictions,
+            "deltas_served": self.deltas,
+            "base_misses": self.misses,
+        }
@@ -0,0 +1,64 @@
+"""
+Strong ETags and conditional GETs.
+
+The proxy tags buffered and cached 200 responses with an ETag taken from
+a BLAKE2b hash of the identity body (or the upstream's own ETag, when it
+sends one). A request whose If-None-Match lists that tag gets a bodiless
+304 instead. For cache hits that means no upstream call at all.
+
+Compressed bodies are different byte sequences, so they get their own
+tag: the identity tag with "-<encoding>" appended inside the quotes, the
+way Apache does it. If-None-Match matches a tag with or without such a
+suffix, so a client that cached the gzip variant still gets a 304 after
+switching to identity.
+
+Streamed responses are not tagged, since their headers go out before the
+body has been seen; routes in the response cache get tagged once stored.
+"""
+
+import hashlib
+
+# Headers a 304 repeats from the 200 it stands for (RFC 7232 §4.1), plus the proxy's own
+NOT_MODIFIED_HEADERS = ('etag', 'cache-control', 'content-location', 'expires', 'vary', 'age', 'x-cache')
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def variant_etag(etag: str, encoding: str = None) -> str:
+    """Tag of the body as sent: the identity tag, suffixed for a Content-Encoding"""
+    if not encoding or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _opaque(tag: str, encodings) -> str:
+    """Tag without W/ and without a -<encoding> suffix"""
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for encoding in encodings:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def opaque_tags(if_none_match: str, encodings=('gzip', 'br', 'zstd')) -> list:
+    """Identity tags listed in an If-None-Match header"""
+    return [_opaque(tag, encodings) for tag in (if_none_match or '').split(',') if tag.strip() and tag.strip() != '*']
+
+
+def etag_matches(if_none_match: str, etag: str, encodings=('gzip', 'br', 'zstd')) -> bool:
+    """Weak If-None-Match comparison of a header value against an identity ETag"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    target = _opaque(etag, encodings)
+    return any(_opaque(tag, encodings) == target for tag in if_none_match.split(',') if tag.strip())
+
+
+def not_modified_headers(headers: dict) -> dict:
+    return {k: v for k, v in headers.items() if k.lower() in NOT_MODIFIED_HEADERS}
@@ -0,0 +1,245 @@
+"""
+Asynchronous jobs for long-running compute calls.
+
+POSTs to job routes (token-runner batches, ranking recomputes) are not
+forwarded inline. The proxy answers 202 with a job id and makes the call
+in the background, so the client's connection is free while the TS
+worker computes and the caller polls for the outcome instead.
+
+- Submissions are keyed by method, path, query and body. One that finds
+  a queued job for its key joins it instead of adding a run. While the
+  job for a key is running, the next submission queues one follow-up run
+  and every later duplicate joins that, so a burst of triggers costs at
+  most the run in progress plus one more.
+- A queued job waits `debounce` seconds before it starts, so triggers
+  that arrive close together collapse into one run.
+- At most `concurrency` jobs run at once, and never two for one key.
+- The TS routes do not report progress, so `progress` is an estimate
+  from the duration of the last run of the same route.
+- Every state change is passed to on_update(job); server.py publishes it
+  as job.updated events in the proxy-local 'jobs' WebSocket category.
+"""
+
+import asyncio
+import hashlib
+import json
+import secrets
+import time
+from collections import OrderedDict
+
+from gateway.cache import cache_key, longest_prefix
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class Job:
+    """One background upstream call and its outcome."""
+
+    def __init__(self, key: tuple, method: str, path: str, query: str, body: bytes, headers: dict):
+        self.id = secrets.token_hex(8)
+        self.key = key
+        self.method = method
+        self.path = path
+        self.query = query
+        self.body = body
+        self.headers = headers
+        self.state = QUEUED
+        self.submissions = 1
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.status_code = None
+        self.content_type = None
+        self.result = None
+        self.error = None
+        self.progress = 0.0
+        self._done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (SUCCEEDED, FAILED)
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for the job to finish; True if it has"""
+        if not self.finished and timeout > 0:
+            try:
+                await asyncio.wait_for(self._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.finished
+
+    def _finish(self, state: str):
+        self.state = state
+        self.finished_at = time.time()
+        self.progress = 1.0
+        self._done.set()
+
+    def parsed_result(self):
+        """Upstream body as JSON when it is JSON, else as text"""
+        if self.result is None:
+            return None
+        try:
+            return json.loads(self.result)
+        except (ValueError, UnicodeDecodeError):
+            return self.result.decode('utf-8', 'replace')
+
+    def as_dict(self, include_result: bool = False) -> dict:
+        data = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "state": self.state,
+            "submissions": self.submissions,
+            "progress": round(self.progress, 3),
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "status_code": self.status_code,
+            "error": self.error,
+        }
+        if include_result:
+            data["result"] = self.parsed_result()
+        return data
+
+
+def job_failed(status_code: int, body: bytes) -> bool:
+    # TS handlers report failures as 200 {"ok": false, ...}
+    return status_code >= 400 or body.lstrip().startswith(b'{"ok":false')
+
+
+class JobQueue:
+    """Deduplicating background runner for the configured job routes."""
+
+    def __init__(self, routes: list, run, debounce: float = 0.5, concurrency: int = 2,
+                 history: int = 200, on_update=None):
+        """
+        `await run(job)` makes the upstream call and returns
+        (status_code, content_type, body).
+        """
+        self.routes = routes
+        self.run = run
+        self.debounce = debounce
+        self.concurrency = max(1, concurrency)
+        self.history = history
+        self.on_update = on_update
+        self.jobs = OrderedDict()   # id -> Job, oldest first
+        self._queued = {}           # key -> Job not yet started
+        self._running = {}          # key -> Job in progress
+        self._slots = None
+        self._tasks = set()
+        self._durations = {}        # path -> seconds of the last finished run
+        self.submitted = 0
+        self.deduplicated = 0
+        self.runs = 0
+        self.failures = 0
+
+    def handles(self, method: str, path: str) -> bool:
+        return method == 'POST' and longest_prefix(path, self.routes) is not None
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def submit(self, method: str, path: str, query: str, body: bytes, headers: dict):
+        """Queue a run, or join the queued one for the same call; returns (job, deduplicated)"""
+        self.submitted += 1
+        key = (method, cache_key(path, query), hashlib.sha256(body).hexdigest())
+        job = self._queued.get(key)
+        if job is not None:
+            job.submissions += 1
+            self.deduplicated += 1
+            return job, True
+        job = Job(key, method, path, query, body, headers)
+        self._queued[key] = job
+        self.jobs[job.id] = job
+        self._trim()
+        task = asyncio.ensure_future(self._execute(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._notify(job)
+        return job, False
+
+    async def _execute(self, job: Job):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        await asyncio.sleep(self.debounce)
+        previous = self._running.get(job.key)
+        if previous is not None:
+            await previous._done.wait()
+        async with self._slots:
+            # Duplicates keep joining until the job actually starts
+            self._queued.pop(job.key, None)
+            self._running[job.key] = job
+            job.state = RUNNING
+            job.started_at = time.time()
+            self.runs += 1
+            self._notify(job)
+            try:
+                status_code, content_type, body = await self.run(job)
+            except asyncio.CancelledError:
+                job.error = "Cancelled"
+                job._finish(FAILED)
+                raise
+            except Exception as err:
+                self.failures += 1
+                job.error = repr(err)
+                job._finish(FAILED)
+            else:
+                job.status_code, job.content_type, job.result = status_code, content_type, body
+                if job_failed(status_code, body):
+                    self.failures += 1
+                    job._finish(FAILED)
+                else:
+                    job._finish(SUCCEEDED)
+                    self._durations[job.path] = job.finished_at - job.started_at
+            finally:
+                self._running.pop(job.key, None)
+        self._notify(job)
+
+    def estimate(self, job: Job) -> float:
+        """Fraction done, from the last run of the same route; capped below 1 while running"""
+        if job.state != RUNNING:
+            return job.progress
+        last = self._durations.get(job.path)
+        if not last:
+            return 0.0
+        return min(0.99, (time.time() - job.started_at) / last)
+
+    def refresh(self, job: Job) -> Job:
+        job.progress = self.estimate(job)
+        return job
+
+    def _notify(self, job: Job):
+        if self.on_update is not None:
+            self.on_update(job)
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond the history bound"""
+        excess = len(self.jobs) - self.history
+        if excess <= 0:
+            return
+        for job_id in [jid for jid, job in self.jobs.items() if job.finished][:excess]:
+            del self.jobs[job_id]
+
+    async def stop(self):
+        pending = list(self._tasks)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "routes": self.routes,
+            "debounce_s": self.debounce,
+            "concurrency": self.concurrency,
+            "queued": len(self._queued),
+            "running": len(self._running),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_duration_s": {path: round(s, 3) for path, s in self._durations.items()},
+        }
@@ -0,0 +1,222 @@
+"""
+Per-route proxy metrics in Prometheus text format.
+
+Hand-rolled rather than prometheus_client: the hot path is a dict lookup
+and a few integer increments per request, and nothing here needs the
+client library's registries or multiprocess mode (one proxy process).
+
+Concrete paths are folded into route templates before they become label
+values, so /api/tokens/USDT and /api/tokens/WETH both count as
+/api/tokens/:symbol:
+
+- configured templates win, static segments before parameters, the way
+  Fastify resolves /api/tokens/stats vs /api/tokens/:symbol
+- otherwise segments that look like ids (0x addresses, numbers, UUIDs,
+  Mongo ObjectIds, ENS names) become :address / :id / :name
+- past max_routes distinct templates everything else is counted as
+  'other', so unknown paths cannot blow up label cardinality
+"""
+
+import re
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds; +Inf is implicit
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+OTHER_ROUTE = 'other'
+
+_ADDRESS = re.compile(r'^0x[0-9a-fA-F]{40}$')
+_HEX = re.compile(r'^(0x[0-9a-fA-F]+|[0-9a-fA-F]{24,})$')
+_NUMBER = re.compile(r'^\d+$')
+_UUID = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+_ENS = re.compile(r'^[^/]+\.eth$', re.IGNORECASE)
+
+
+def generic_segment(segment: str) -> str:
+    """Placeholder for a segment that looks like an identifier, else the segment itself"""
+    if _ADDRESS.match(segment):
+        return ':address'
+    if _NUMBER.match(segment) or _UUID.match(segment) or _HEX.match(segment):
+        return ':id'
+    if _ENS.match(segment):
+        return ':name'
+    return segment
+
+
+class RouteTemplates:
+    """Folds request paths into a bounded set of route templates."""
+
+    def __init__(self, templates: list, max_routes: int = 200):
+        self.max_routes = max_routes
+        self._by_length = {}
+        for template in templates:
+            segments = tuple(template.strip('/').split('/'))
+            # Static segments outrank parameters position by position
+            rank = tuple(not s.startswith(':') for s in segments)
+            self._by_length.setdefault(len(segments), []).append((rank, segments, template))
+        for candidates in self._by_length.values():
+            candidates.sort(key=lambda c: c[0], reverse=True)
+        self._routes = set()
+        self._seen = {}
+
+    def template_for(self, path: str) -> str:
+        route = self._seen.get(path)
+        if route is not None:
+            return route
+        route = self._match(path)
+        if route not in self._routes:
+            if len(self._routes) >= self.max_routes:
+                route = OTHER_ROUTE
+            else:
+                self._routes.add(route)
+        if len(self._seen) >= self.max_routes * 16:
+            # Memo of concrete paths; cheap to rebuild, so just start over
+            self._seen.clear()
+        self._seen[path] = route
+        return route
+
+    def _match(self, path: str) -> str:
+        segments = path.strip('/').split('/')
+        for _, template_segments, template in self._by_length.get(len(segments), ()):
+            if all(t.startswith(':') or t == s for t, s in zip(template_segments, segments)):
+                return template
+        return '/' + '/'.join(generic_segment(s) for s in segments)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a label tuple."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, labels: tuple) -> int:
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+
+class ProxyMetrics:
+    """Request, upstream and WebSocket metrics for the proxy."""
+
+    def __init__(self, templates: RouteTemplates, buckets: tuple = DEFAULT_BUCKETS, live_ws_clients=None):
+        self.templates = templates
+        self.live_ws_clients = live_ws_clients or (lambda: ())
+        self.started_at = time.time()
+        self.requests = {}            # (route, method, status_class) -> count
+        self.request_bytes = {}       # route -> bytes
+        self.response_bytes = {}      # route -> bytes
+        self.in_flight = {}           # route -> gauge
+        self.duration = Histogram(buckets)
+        self.upstream_latency = Histogram(buckets)
+        self.upstream_errors = {}     # route -> count
+        self.ws_connections = 0
+        self.ws_connections_total = 0
+        self.ws_messages = {'in': 0, 'out': 0}
+
+    def route_for(self, path: str) -> str:
+        return self.templates.template_for(path)
+
+    def request_started(self, route: str):
+        self.in_flight[route] = self.in_flight.get(route, 0) + 1
+
+    def request_finished(self, route: str, method: str, status_code: int, seconds: float,
+                         bytes_in: int = 0, bytes_out: int = 0):
+        self.in_flight[route] = self.in_flight.get(route, 1) - 1
+        key = (route, method, f"{status_code // 100}xx")
+        self.requests[key] = self.requests.get(key, 0) + 1
+        self.duration.observe((route, method), seconds)
+        self.request_bytes[route] = self.request_bytes.get(route, 0) + bytes_in
+        self.response_bytes[route] = self.response_bytes.get(route, 0) + bytes_out
+
+    def upstream_observed(self, route: str, seconds: float):
+        self.upstream_latency.observe((route,), seconds)
+
+    def upstream_failed(self, route: str):
+        self.upstream_errors[route] = self.upstream_errors.get(route, 0) + 1
+
+    def ws_opened(self):
+        self.ws_connections += 1
+        self.ws_connections_total += 1
+
+    def ws_closed(self, client):
+        """Fold a finished LocalClient's message counts into the totals"""
+        self.ws_connections -= 1
+        self.ws_messages['in'] += client.received
+        self.ws_messages['out'] += client.sent
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+
+        def family(name, kind, help_):
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        family('proxy_http_requests_total', 'counter', 'Requests answered by the proxy, by route template and status class.')
+        for (route, method, status), value in sorted(self.requests.items()):
+            lines.append(f'proxy_http_requests_total{{route="{escape(route)}",method="{method}",status="{status}"}} {value}')
+
+        family('proxy_http_in_flight_requests', 'gauge', 'Requests currently being handled.')
+        for route, value in sorted(self.in_flight.items()):
+            lines.append(f'proxy_http_in_flight_requests{{route="{escape(route)}"}} {value}')
+
+        render_histogram(lines, family, 'proxy_http_request_duration_seconds',
+                         'Time from request arrival to the last response byte.',
+                         self.duration, ('route', 'method'))
+        render_histogram(lines, family, 'proxy_upstream_latency_seconds',
+                         'Time for a TS worker to answer (headers for streamed responses).',
+                         self.upstream_latency, ('route',))
+
+        family('proxy_upstream_errors_total', 'counter', 'Upstream calls that failed to connect.')
+        for route, value in sorted(self.upstream_errors.items()):
+            lines.append(f'proxy_upstream_errors_total{{route="{escape(route)}"}} {value}')
+
+        family('proxy_http_request_bytes_total', 'counter', 'Request body bytes received from clients.')
+        for route, value in sorted(self.request_bytes.items()):
+            lines.append(f'proxy_http_request_bytes_total{{route="{escape(route)}"}} {value}')
+
+        family('proxy_http_response_bytes_total', 'counter', 'Response body bytes sent to clients, after compression.')
+        for route, value in sorted(self.response_bytes.items()):
+            lines.append(f'proxy_http_response_bytes_total{{route="{escape(route)}"}} {value}')
+
+        family('proxy_ws_connections', 'gauge', 'Open browser WebSocket connections.')
+        lines.append(f'proxy_ws_connections {self.ws_connections}')
+        family('proxy_ws_connections_total', 'counter', 'Browser WebSocket connections accepted.')
+        lines.append(f'proxy_ws_connections_total {self.ws_connections_total}')
+        # Open connections keep their own counters; read them instead of counting per message
+        live = list(self.live_ws_clients())
+        messages_in = self.ws_messages['in'] + sum(c.received for c in live)
+        messages_out = self.ws_messages['out'] + sum(c.sent for c in live)
+        family('proxy_ws_messages_total', 'counter', 'WebSocket messages from (in) and to (out) browser clients.')
+        lines.append(f'proxy_ws_messages_total{{direction="in"}} {messages_in}')
+        lines.append(f'proxy_ws_messages_total{{direction="out"}} {messages_out}')
+
+        family('proxy_start_time_seconds', 'gauge', 'Unix time the proxy started.')
+        lines.append(f'proxy_start_time_seconds {self.started_at:.3f}')
+        return '\n'.join(lines) + '\n'
+
+
+def render_histogram(lines: list, family, name: str, help_: str, histogram: Histogram, label_names: tuple):
+    family(name, 'histogram', help_)
+    for labels, series in sorted(histogram.series.items()):
+        label_str = ','.join(f'{n}="{escape(v)}"' for n, v in zip(label_names, labels))
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, series):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label_str},le="{bound:g}"}} {cumulative}')
+        cumulative += series[len(histogram.buckets)]
+        lines.append(f'{name}_bucket{{{label_str},le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{{label_str}}} {series[-1]:.6f}')
+        lines.append(f'{name}_count{{{label_str}}} {cumulative}')
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
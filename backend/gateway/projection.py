@@ -0,0 +1,88 @@
+"""
+Field projection for large list endpoints.
+
+GET /api/tokens?fields=symbol,engineScore,metrics.confidence makes the
+proxy fetch the full page from TypeScript (with `fields` removed from the
+query) and trim every item of the response's lists to the requested
+paths. Dotted paths select nested properties; lists of objects met along
+a path are projected element by element. Everything outside the item
+lists (ok, total, limit, offset, ...) is kept as is.
+
+server.py caches projected bodies under their own key, since `fields` is
+part of the query string. JSON is parsed and serialized with orjson when
+it is installed, and with the standard library otherwise.
+"""
+
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+FIELD_PATH = re.compile(r'^[A-Za-z_$][A-Za-z0-9_$]*(\.[A-Za-z_$][A-Za-z0-9_$]*)*$')
+
+
+class ProjectionError(ValueError):
+    """The fields parameter is malformed; the message is returned to the caller"""
+
+
+def parse_fields(value: str, max_fields: int) -> dict:
+    """Field tree from "a,b.c,b.d": {'a': None, 'b': {'c': None, 'd': None}}"""
+    paths = [part.strip() for part in (value or '').split(',') if part.strip()]
+    if not paths:
+        raise ProjectionError("fields must name at least one field")
+    if len(paths) > max_fields:
+        raise ProjectionError(f"At most {max_fields} fields")
+    tree = {}
+    for path in paths:
+        if not FIELD_PATH.match(path):
+            raise ProjectionError(f"Invalid field path: {path!r}")
+        node = tree
+        names = path.split('.')
+        for name in names[:-1]:
+            child = node.get(name, {})
+            if child is None:
+                break  # a parent was requested whole
+            node = node.setdefault(name, child)
+        else:
+            node[names[-1]] = None
+    return tree
+
+
+def project_item(item, tree: dict):
+    """item trimmed to the paths in tree"""
+    if isinstance(item, list):
+        return [project_item(element, tree) for element in item]
+    if not isinstance(item, dict):
+        return item
+    result = {}
+    for name, subtree in tree.items():
+        if name in item:
+            result[name] = item[name] if subtree is None else project_item(item[name], subtree)
+    return result
+
+
+def project(document, tree: dict):
+    """document with the items of every list of objects trimmed to tree"""
+    if isinstance(document, dict):
+        return {key: project(value, tree) for key, value in document.items()}
+    if isinstance(document, list) and document and all(isinstance(item, dict) for item in document):
+        return [project_item(item, tree) for item in document]
+    return document
+
+
+def loads(body: bytes):
+    return orjson.loads(body) if orjson else json.loads(body)
+
+
+def dumps(document) -> bytes:
+    if orjson:
+        return orjson.dumps(document)
+    return json.dumps(document, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def project_body(body: bytes, tree: dict) -> bytes:
+    """Projected JSON body; raises ValueError when body is not JSON"""
+    return dumps(project(loads(body), tree))
@@ -0,0 +1,161 @@
+"""
+Per-client token-bucket admission control.
+
+Every client (API key if it sent one, else its IP) has a bucket that
+refills at `rate` tokens per second up to `burst`. A request costs the
+tokens configured for its route prefix, so one batch run can be worth
+dozens of reads.
+
+A request that finds too few tokens takes them anyway (the bucket goes
+negative) and waits until the debt is repaid, as long as the wait is at
+most `max_wait` seconds and the client has fewer than `max_queue` requests
+already waiting. Otherwise the tokens are handed back and the caller gets
+the number of seconds after which a retry would be admitted, for a 429
+Retry-After.
+
+State is one small object per active client in an LRU-ordered dict.
+Buckets that have sat idle long enough to be full again are
+indistinguishable from new ones, so they are dropped from the cold end a
+few at a time on each request; the cost per request is O(1).
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+from gateway.cache import longest_prefix
+
+
+class Bucket:
+    __slots__ = ('tokens', 'updated', 'waiting')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.waiting = 0
+
+
+class RateLimiter:
+    """Token buckets keyed by client, with per-route costs and a bounded wait."""
+
+    def __init__(self, rate: float, burst: float, costs: dict = None, default_cost: float = 1.0,
+                 max_queue: int = 8, max_wait: float = 2.0, exempt=(), max_clients: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.costs = costs or {}
+        self.default_cost = default_cost
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.exempt = set(exempt)
+        self.max_clients = max_clients
+        # An idle bucket is full again after this long
+        self.idle_expiry = burst / rate if rate > 0 else float('inf')
+        self._buckets = OrderedDict()
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.expired = 0
+
+    def cost_for(self, path: str) -> float:
+        prefix = longest_prefix(path, self.costs)
+        cost = self.costs[prefix] if prefix is not None else self.default_cost
+        # A cost above the burst could never be paid
+        return min(cost, self.burst)
+
+    def _bucket(self, client: str, now: float) -> Bucket:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = Bucket(self.burst, now)
+        else:
+            self._buckets.move_to_end(client)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        self._expire(now)
+        return bucket
+
+    def _expire(self, now: float, budget: int = 4):
+        for _ in range(budget):
+            if not self._buckets:
+                return
+            client, oldest = next(iter(self._buckets.items()))
+            overfull = len(self._buckets) > self.max_clients
+            if not overfull and (oldest.waiting or now - oldest.updated < self.idle_expiry):
+                return
+            del self._buckets[client]
+            self.expired += 1
+
+    def reserve(self, client: str, cost: float, now: float = None):
+        """
+        Take `cost` tokens for `client`.
+
+        Returns (wait, retry_after): a wait in seconds (0 to go right away)
+        and None when admitted, or None and the seconds until a retry would
+        be admitted when rejected.
+        """
+        now = time.monotonic() if now is None else now
+        bucket = self._bucket(client, now)
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            self.admitted += 1
+            return 0.0, None
+        wait = (cost - bucket.tokens) / self.rate if self.rate > 0 else float('inf')
+        if wait > self.max_wait or bucket.waiting >= self.max_queue:
+            self.rejected += 1
+            # Without queueing ahead of it, this is when the bucket could cover the cost
+            return None, wait
+        bucket.tokens -= cost
+        bucket.waiting += 1
+        self.delayed += 1
+        return wait, None
+
+    def refund(self, client: str, cost: float):
+        """Give back tokens of a waiting request that was abandoned"""
+        bucket = self._buckets.get(client)
+        if bucket is not None:
+            bucket.tokens = min(self.burst, bucket.tokens + cost)
+
+    def done_waiting(self, client: str):
+        bucket = self._buckets.get(client)
+        if bucket is not None and bucket.waiting:
+            bucket.waiting -= 1
+
+    async def acquire(self, client: str, path: str, peer: str = None):
+        """
+        None once the request may proceed, else seconds to put in Retry-After.
+        Exemptions match peer (the socket address) when given, so a forwarded
+        or claimed identity can never make a caller exempt.
+        """
+        if (client if peer is None else peer) in self.exempt:
+            return None
+        cost = self.cost_for(path)
+        if cost <= 0:
+            return None
+        wait, retry_after = self.reserve(client, cost)
+        if retry_after is not None:
+            return retry_after
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.refund(client, cost)
+                raise
+            finally:
+                self.done_waiting(client)
+            self.admitted += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "max_queue": self.max_queue,
+            "max_wait_s": self.max_wait,
+            "costs": self.costs,
+            "default_cost": self.default_cost,
+            "clients": len(self._buckets),
+            "waiting": sum(b.waiting for b in self._buckets.values()),
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }
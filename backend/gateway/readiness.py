@@ -0,0 +1,106 @@
+"""
+Readiness probing for the TypeScript child.
+
+Replaces the fixed startup sleep: the child's health endpoint is polled
+with exponential backoff until it answers, the process dies, or the
+deadline passes. Requests that arrive in the meantime wait on a
+ReadinessGate instead of failing straight away.
+"""
+
+import asyncio
+import time
+
+import httpx
+
+
+class StartupTimings:
+    """Wall-clock timings of the startup phases, relative to the first mark."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+        self.probes = 0
+
+    def mark(self, phase: str):
+        self.phases[phase] = time.monotonic() - self.started
+
+    def as_dict(self) -> dict:
+        return {
+            "phases_ms": {k: round(v * 1000, 1) for k, v in self.phases.items()},
+            "probes": self.probes,
+        }
+
+    def report(self) -> str:
+        parts = [f"{k}={v * 1000:.0f}ms" for k, v in self.phases.items()]
+        return f"{', '.join(parts)} ({self.probes} probes)"
+
+
+class ReadinessGate:
+    """Open/closed flag that callers can await with a timeout."""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    @property
+    def is_open(self) -> bool:
+        return self._event.is_set()
+
+    def open(self):
+        self._event.set()
+
+    def close(self):
+        self._event.clear()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for the gate to open"""
+        if self._event.is_set():
+            return True
+        if timeout <= 0:
+            return False
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+async def wait_until_ready(
+    client: httpx.AsyncClient,
+    url: str,
+    deadline: float,
+    timings: StartupTimings,
+    process=None,
+    initial_delay: float = 0.05,
+    max_delay: float = 1.0,
+) -> bool:
+    """
+    Poll url until it returns 2xx.
+
+    Returns False when the deadline passes or the child process exits first.
+    Records 'listening' on the first accepted connection and 'ready' on the
+    first healthy answer.
+    """
+    delay = initial_delay
+    give_up_at = time.monotonic() + deadline
+
+    while time.monotonic() < give_up_at:
+        if process is not None and process.poll() is not None:
+            timings.mark("exited")
+            return False
+
+        timings.probes += 1
+        try:
+            resp = await client.get(url, timeout=max(delay * 2, 1.0))
+            if "listening" not in timings.phases:
+                timings.mark("listening")
+            if resp.is_success:
+                timings.mark("ready")
+                return True
+        except httpx.TransportError:
+            pass
+
+        await asyncio.sleep(min(delay, max(0.0, give_up_at - time.monotonic())))
+        delay = min(delay * 2, max_delay)
+
+    timings.mark("deadline")
+    return False
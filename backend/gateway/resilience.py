@@ -0,0 +1,237 @@
+"""
+Upstream resilience: per-worker circuit breakers, a retry budget and
+hedged requests.
+
+- CircuitBreaker: after `failures` consecutive connect errors, timeouts or
+  502/503/504s a worker is skipped for `cooldown` seconds, then gets one
+  trial request; success closes the breaker, failure reopens it. While
+  every worker is open, requests fail fast instead of piling up on a
+  child that is restarting or overloaded.
+- RetryBudget: every request deposits `ratio` tokens (capped at `burst`),
+  every retry or hedge spends one, so extra attempts stay within that
+  fraction of real traffic however bad things get.
+- LatencyTracker: recent upstream latencies per route; a hedge fires once
+  a request has been outstanding longer than its route's p95.
+- hedged_call: runs an attempt, adds a hedge on another worker after the
+  delay, retries retryable failures on another worker, and returns the
+  first success. Losing attempts are cancelled or discarded.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Loser clean-up runs after the winner has been returned; keep the tasks referenced
+_cleanups = set()
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open trial."""
+
+    def __init__(self, failures: int = 5, cooldown: float = 5.0):
+        self.failure_threshold = max(1, failures)
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opens = 0
+
+    def accepting(self, now: float = None) -> bool:
+        """Whether a request may be routed here (does not change state)"""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN and now - self.opened_at < self.cooldown:
+            return False
+        return not self.trial_in_flight
+
+    def on_attempt(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = True
+
+    def on_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+
+    def on_failure(self, now: float = None):
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opens += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic() if now is None else now
+
+    def on_abandon(self):
+        """A cancelled attempt (e.g. a losing hedge) says nothing about health"""
+        self.trial_in_flight = False
+
+    def retry_after(self, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.cooldown - (now - self.opened_at)) if self.state == OPEN else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opens": self.opens,
+            "retry_after_s": round(self.retry_after(), 2),
+        }
+
+
+class RetryBudget:
+    """Caps retries and hedges at a fraction of requests."""
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.balance = burst
+        self.requests = 0
+        self.spent = 0
+        self.denied = 0
+
+    def deposit(self):
+        self.requests += 1
+        self.balance = min(self.burst, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.balance < 1:
+            self.denied += 1
+            return False
+        self.balance -= 1
+        self.spent += 1
+        return True
+
+    def as_dict(self) -> dict:
+        return {
+            "ratio": self.ratio,
+            "burst": self.burst,
+            "balance": round(self.balance, 2),
+            "requests": self.requests,
+            "spent": self.spent,
+            "denied": self.denied,
+        }
+
+
+class LatencyTracker:
+    """Sliding window of upstream latencies per route, with a cached p95."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20, refresh_every: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self._samples = {}
+        self._p95 = {}
+        self._since_refresh = {}
+
+    def record(self, route: str, seconds: float):
+        samples = self._samples.get(route)
+        if samples is None:
+            samples = self._samples[route] = deque(maxlen=self.window)
+        samples.append(seconds)
+        count = self._since_refresh.get(route, 0) + 1
+        # Sorting the window on every sample would cost more than the proxying
+        if count >= self.refresh_every and len(samples) >= self.min_samples:
+            ordered = sorted(samples)
+            self._p95[route] = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+            count = 0
+        self._since_refresh[route] = count
+
+    def p95(self, route: str):
+        """Seconds, or None until enough samples have been seen"""
+        return self._p95.get(route)
+
+    def as_dict(self) -> dict:
+        return {route: round(p95 * 1000, 2) for route, p95 in self._p95.items()}
+
+
+class HedgeStats:
+    def __init__(self):
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+
+    def as_dict(self) -> dict:
+        return {"hedges": self.hedges, "hedge_wins": self.hedge_wins, "retries": self.retries}
+
+
+async def hedged_call(pick, attempt, discard, *, hedge_delay=None, budget=None,
+                      max_retries: int = 0, retryable=(), stats: HedgeStats = None):
+    """
+    First successful attempt(worker) among the original, at most one hedge
+    and up to max_retries retries.
+
+    pick(exclude) returns a worker not in `exclude`, or None. discard(result)
+    cleans up a successful attempt that lost the race. The last error is
+    raised when every attempt failed.
+    """
+    stats = stats or HedgeStats()
+    worker = pick(())
+    if worker is None:
+        return None
+    tried = [worker]
+    tasks = {asyncio.ensure_future(attempt(worker)): worker}
+    first_task = next(iter(tasks))
+    hedged = hedge_delay is None
+    retries = 0
+    last_error = None
+
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(
+                tasks, timeout=None if hedged else hedge_delay, return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                hedged = True
+                other = pick(tuple(tried))
+                if other is not None and (budget is None or budget.withdraw()):
+                    stats.hedges += 1
+                    tried.append(other)
+                    tasks[asyncio.ensure_future(attempt(other))] = other
+                continue
+
+            winner = None
+            for task in done:
+                tasks.pop(task)
+                if task.cancelled():
+                    continue
+                if task.exception() is None:
+                    if winner is None:
+                        winner = task
+                    else:
+                        await discard(task.result())
+                    continue
+                last_error = task.exception()
+                if isinstance(last_error, retryable) and retries < max_retries:
+                    other = pick(tuple(tried))
+                    if other is not None and (budget is None or budget.withdraw()):
+                        retries += 1
+                        stats.retries += 1
+                        tried.append(other)
+                        tasks[asyncio.ensure_future(attempt(other))] = other
+            if winner is not None:
+                if winner is not first_task:
+                    stats.hedge_wins += 1
+                return winner.result()
+        raise last_error
+    finally:
+        if tasks:
+            # Losers: cancel the ones still running, clean up any that finished meanwhile
+            for task in tasks:
+                task.cancel()
+            cleanup = asyncio.ensure_future(_discard_all(list(tasks), discard))
+            _cleanups.add(cleanup)
+            cleanup.add_done_callback(_cleanups.discard)
+
+
+async def _discard_all(tasks, discard):
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if not isinstance(result, BaseException):
+            await discard(result)
@@ -0,0 +1,126 @@
+"""
+On-disk snapshot of hot cache entries, so a restarted proxy starts warm.
+
+server.py writes the cached 200 responses of the snapshot routes to one
+file periodically and on shutdown, and reads it back on startup. Restored
+entries go into the response cache already expired, so they are served
+marked stale (through the stale-while-revalidate and stale-if-error
+windows) until the new workers answer the warm-up fetches.
+
+Layout: the magic line, a 4-byte big-endian index length, a JSON index of
+{"key", "status", "headers", "age", "offset", "length"} records, then the
+bodies back to back. The file is memory-mapped on load, so only the index
+and the bodies of entries still young enough to restore are read. Writes
+go to a uniquely named temporary file that is fsynced and then renamed
+over the old one, so neither a crash mid-write nor a power loss right
+after the rename leaves a torn snapshot behind.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import NamedTuple
+
+MAGIC = b'AQPROXYSNAP1\n'
+_LENGTH = struct.Struct('>I')
+
+
+class SnapshotEntry(NamedTuple):
+    key: str
+    status_code: int
+    headers: list
+    body: bytes
+    age: float          # seconds since the upstream produced the body
+
+
+def write_snapshot(path: str, entries) -> int:
+    """Replace the snapshot at path with entries; returns how many were written"""
+    index, bodies, offset = [], [], 0
+    for entry in entries:
+        index.append({
+            "key": entry.key,
+            "status": entry.status_code,
+            "headers": entry.headers,
+            "age": round(entry.age, 3),
+            "offset": offset,
+            "length": len(entry.body),
+        })
+        bodies.append(entry.body)
+        offset += len(entry.body)
+    header = json.dumps(index, separators=(',', ':')).encode()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_LENGTH.pack(len(header)))
+            f.write(header)
+            for body in bodies:
+                f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+    return len(index)
+
+
+def _fsync_directory(directory: str):
+    """Persist the rename itself; not every platform can open a directory"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def read_snapshot(path: str, max_age: float) -> list:
+    """
+    SnapshotEntries from path younger than max_age, counting the time since
+    the file was written on top of each entry's own age. Missing or
+    unreadable snapshots yield nothing.
+    """
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return []
+    with f:
+        saved_age = max(0.0, time.time() - os.fstat(f.fileno()).st_mtime)
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return []
+        with mapped:
+            start = len(MAGIC) + _LENGTH.size
+            if mapped[:len(MAGIC)] != MAGIC or len(mapped) < start:
+                return []
+            (header_length,) = _LENGTH.unpack(mapped[len(MAGIC):start])
+            try:
+                index = json.loads(mapped[start:start + header_length])
+            except ValueError:
+                return []
+            base = start + header_length
+            entries = []
+            for record in index:
+                age = record["age"] + saved_age
+                end = base + record["offset"] + record["length"]
+                if age > max_age or end > len(mapped):
+                    continue
+                body = mapped[base + record["offset"]:end]
+                headers = [tuple(pair) for pair in record["headers"]]
+                entries.append(SnapshotEntry(record["key"], record["status"], headers, body, age))
+            return entries
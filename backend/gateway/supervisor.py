@@ -0,0 +1,190 @@
+"""
+Supervision of the TypeScript workers.
+
+- Crash restarts: a monitor loop notices workers whose process has
+  exited, takes them out of rotation and respawns them on the same port
+  after an exponential backoff (base * 2^n, capped). A worker that stayed
+  up for `stable_after` seconds starts again from the base delay.
+- Rolling restarts (blue-green per slot): each worker's replacement is
+  spawned on the slot's standby port and probed. Only once it is healthy
+  does it take new traffic. The old worker then drains its in-flight
+  requests and WebSocket sessions (up to `drain_timeout`) before it is
+  stopped. A replacement that never becomes healthy is discarded and the
+  old worker keeps serving.
+
+While worker 0 is replaced, old and new primary overlap for the drain.
+The new primary is spawned with its background jobs deferred (scheduler,
+bootstrap worker, Telegram polling) and only told to start them once the
+old one has drained and exited, so they never run twice.
+"""
+
+import asyncio
+import time
+
+
+class Supervisor:
+    """Keeps a WorkerPool's processes running and replaces them on demand."""
+
+    def __init__(self, pool, spawn, probe, on_ready=None, on_retire=None, backoff: float = 0.5, backoff_max: float = 30.0,
+                 stable_after: float = 60.0, drain_timeout: float = 30.0, stop_timeout: float = 10.0,
+                 check_interval: float = 0.5):
+        """
+        spawn(worker) starts the worker's process and returns a context for
+        probe(worker, context, require_healthy), which returns True once the
+        worker should take traffic (for replacements only after a healthy
+        answer). on_ready(worker) runs after a worker is put in rotation;
+        `await on_retire(worker)` after one is taken out, before it drains.
+        """
+        self.pool = pool
+        self.spawn = spawn
+        self.probe = probe
+        self.on_ready = on_ready
+        self.on_retire = on_retire
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.drain_timeout = drain_timeout
+        self.stop_timeout = stop_timeout
+        self.check_interval = check_interval
+        self.crash_streak = [0] * len(pool)
+        self.restarts = 0
+        self.rolling_restarts = 0
+        self.last_rolling = None
+        self._restarting = set()
+        self._rolling_task = None
+        self._tasks = set()
+        self._monitor = None
+        self._stopping = False
+
+    def start(self):
+        """Spawn every worker and begin watching them"""
+        for worker in self.pool.workers:
+            self._background(self._launch(worker))
+        self._monitor = asyncio.ensure_future(self._watch())
+
+    async def stop(self):
+        """Stop restarting; the caller terminates the processes"""
+        self._stopping = True
+        pending = list(self._tasks) + ([self._monitor] if self._monitor else [])
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def _background(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _launch(self, worker) -> bool:
+        context = self.spawn(worker)
+        if not await self.probe(worker, context, require_healthy=False):
+            return False
+        worker.ready = True
+        if self.on_ready is not None:
+            self.on_ready(worker)
+        return True
+
+    async def _watch(self):
+        while not self._stopping:
+            for slot, worker in enumerate(self.pool.workers):
+                if worker.process is not None and not worker.alive() and slot not in self._restarting:
+                    self._restarting.add(slot)
+                    self._background(self._restart(slot, worker))
+            await asyncio.sleep(self.check_interval)
+
+    def backoff_for(self, slot: int) -> float:
+        return min(self.backoff_max, self.backoff * 2 ** self.crash_streak[slot])
+
+    async def _restart(self, slot: int, worker):
+        try:
+            worker.ready = False
+            if worker.started_at is not None and time.monotonic() - worker.started_at >= self.stable_after:
+                self.crash_streak[slot] = 0
+            delay = self.backoff_for(slot)
+            self.crash_streak[slot] += 1
+            print(f"[Proxy] TypeScript {worker.name} exited with code {worker.process.returncode}; "
+                  f"restarting in {delay:.1f}s (crash {self.crash_streak[slot]} in a row)")
+            await asyncio.sleep(delay)
+            if self._stopping or self.pool.workers[slot] is not worker:
+                return
+            self.restarts += 1
+            await self._launch(worker)
+        finally:
+            self._restarting.discard(slot)
+
+    @property
+    def rolling(self) -> bool:
+        return self._rolling_task is not None and not self._rolling_task.done()
+
+    def schedule_rolling_restart(self):
+        """Start a rolling restart in the background; None if one is already running"""
+        if self.rolling or self._stopping:
+            return None
+        self._rolling_task = self._background(self._rolling_restart())
+        return self._rolling_task
+
+    async def _rolling_restart(self) -> dict:
+        """Replace every worker in turn; stops at the first replacement that fails"""
+        started = time.monotonic()
+        replaced = []
+        result = {"ok": True, "replaced": replaced}
+        for slot in range(len(self.pool)):
+            while slot in self._restarting:
+                # A crash restart of this slot is already under way
+                await asyncio.sleep(self.check_interval)
+            if self._stopping:
+                result["ok"] = False
+                break
+            standby = self.pool.standby[slot]
+            standby.defer_jobs = standby.role == 'primary'
+            if not await self._launch_standby(standby):
+                await asyncio.to_thread(standby.terminate, self.stop_timeout)
+                print(f"[Proxy] Rolling restart: {standby.name} never became healthy; keeping the old worker")
+                result.update(ok=False, failed=standby.name)
+                break
+            old = self.pool.swap(slot)
+            self.crash_streak[slot] = 0
+            old.ready = False
+            print(f"[Proxy] Rolling restart: {standby.name} took over slot {slot}; draining {old.name}")
+            if self.on_retire is not None:
+                await self.on_retire(old)
+            drained = await self._drain(old)
+            await asyncio.to_thread(old.terminate, self.stop_timeout)
+            standby.start_jobs()
+            replaced.append({"slot": slot, "worker": standby.name, "drained": drained})
+        result["duration_s"] = round(time.monotonic() - started, 2)
+        self.rolling_restarts += 1
+        self.last_rolling = result
+        return result
+
+    async def _launch_standby(self, standby) -> bool:
+        if standby.alive():
+            # Leftover from an aborted restart
+            await asyncio.to_thread(standby.terminate, self.stop_timeout)
+        context = self.spawn(standby)
+        if not await self.probe(standby, context, require_healthy=True) or not standby.alive():
+            return False
+        standby.ready = True
+        if self.on_ready is not None:
+            self.on_ready(standby)
+        return True
+
+    async def _drain(self, worker) -> bool:
+        """Wait for in-flight requests and sessions; False if the timeout cut them off"""
+        give_up_at = time.monotonic() + self.drain_timeout
+        while worker.outstanding > 0 or worker.ws_sessions > 0:
+            if time.monotonic() >= give_up_at or not worker.alive():
+                return worker.outstanding == 0 and worker.ws_sessions == 0
+            await asyncio.sleep(0.05)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "restarts": self.restarts,
+            "crash_streak": self.crash_streak,
+            "restarting": sorted(self._restarting),
+            "rolling": self.rolling,
+            "rolling_restarts": self.rolling_restarts,
+            "last_rolling": self.last_rolling,
+        }
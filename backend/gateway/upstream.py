@@ -0,0 +1,28 @@
+"""
+Upstream HTTP client construction.
+
+Every worker, standby included, gets its own mounted transport, so
+connection-pool limits apply per worker whether it is reached over
+loopback TCP or a Unix domain socket.
+"""
+
+import httpx
+
+
+def upstream_limits(max_connections: int, max_keepalive: int, keepalive_expiry: float) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+def make_upstream_client(pool, timeout: float, limits: httpx.Limits) -> httpx.AsyncClient:
+    """AsyncClient that routes each worker URL through its own transport"""
+    mounts = {}
+    for worker in pool.all_workers():
+        if worker.socket_path:
+            mounts[worker.url] = httpx.AsyncHTTPTransport(uds=worker.socket_path, limits=limits)
+        else:
+            mounts[worker.url] = httpx.AsyncHTTPTransport(limits=limits)
+    return httpx.AsyncClient(timeout=timeout, limits=limits, mounts=mounts)
@@ -0,0 +1,220 @@
+"""
+TypeScript worker pool.
+
+The proxy supervises N `tsx src/server.ts` processes on consecutive ports.
+Worker 0 is the primary (seeding, scheduler, bootstrap worker, Telegram);
+the rest run with WORKER_ROLE=replica and only serve HTTP. Process-local
+state is not shared between them: an in-memory cache such as the 5s
+configCache in engine_runtime_config.service.ts only sees writes made in
+its own worker, so after an update through one worker the others serve
+the old value until their TTL expires.
+
+HTTP traffic goes to the ready worker with the fewest outstanding requests,
+skipping workers whose circuit breaker is open.
+WebSocket sessions always go to the primary: it runs the background jobs
+that emit SystemEvents, and replicas have nothing to broadcast.
+
+With a socket directory configured, workers listen on Unix domain sockets
+instead of TCP ports. Their URLs then use a per-worker pseudo host that
+the upstream client mounts onto the matching socket.
+
+Every slot also has a standby worker on the next block of ports (or a
+second socket). A rolling restart starts the replacement there and swaps
+the two once it is ready, so old and new never compete for one port.
+"""
+
+import itertools
+import math
+import os
+import signal
+import subprocess
+import time
+
+import websockets
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may actually use: the affinity mask, further limited
+    by a cgroup CPU quota (v2 cpu.max or v1 cfs quota), as in a container
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def _cgroup_cpu_quota():
+    """CPU quota in cores, or None when unlimited or not in a cgroup"""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        return None if quota <= 0 or period <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+class TsWorker:
+    """One TypeScript child process and its load counters."""
+
+    def __init__(self, index: int, port: int, socket_path: str = None, name: str = None):
+        self.index = index
+        self.port = port
+        self.socket_path = socket_path
+        self.name = name or f"ts-worker-{index}"
+        if socket_path:
+            self.url = f"http://{self.name}"
+            self.ws_url = f"ws://{self.name}/ws"
+        else:
+            self.url = f"http://127.0.0.1:{port}"
+            self.ws_url = f"ws://127.0.0.1:{port}/ws"
+        self.process = None
+        self.ready = False
+        self.started_at = None
+        self.outstanding = 0
+        self.ws_sessions = 0
+        self.breaker = None  # optional gateway.resilience.CircuitBreaker
+        # Primary spawned next to a still-running one: background jobs wait for start_jobs()
+        self.defer_jobs = False
+
+    @property
+    def role(self) -> str:
+        return "primary" if self.index == 0 else "replica"
+
+    def spawn(self, cmd: list, env: dict, cwd: str):
+        env = dict(env)
+        env['PORT'] = str(self.port)
+        env['WORKER_ROLE'] = self.role
+        if self.defer_jobs and self.role == 'primary':
+            env['WORKER_DEFER_JOBS'] = '1'
+        if self.socket_path:
+            env['SOCKET_PATH'] = self.socket_path
+            # A stale socket file from a previous run makes listen() fail
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        self.ready = False
+        self.process = subprocess.Popen(cmd, cwd=cwd, env=env)
+        self.started_at = time.monotonic()
+
+    def start_jobs(self):
+        """Let a primary spawned with defer_jobs start its seeding and background jobs"""
+        if self.defer_jobs and self.alive():
+            self.process.send_signal(signal.SIGUSR2)
+        self.defer_jobs = False
+
+    def ws_connect(self):
+        """websockets connect context for this worker's /ws endpoint"""
+        if self.socket_path:
+            return websockets.unix_connect(self.socket_path, self.ws_url)
+        return websockets.connect(self.ws_url)
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def available(self) -> bool:
+        return self.ready and self.alive() and (self.breaker is None or self.breaker.accepting())
+
+    def terminate(self, timeout: float = 5):
+        if not self.process:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    def as_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "name": self.name,
+            "port": self.port,
+            "socket": self.socket_path,
+            "role": self.role,
+            "pid": self.process.pid if self.process else None,
+            "alive": self.alive(),
+            "ready": self.ready,
+            "outstanding": self.outstanding,
+            "ws_sessions": self.ws_sessions,
+            "breaker": self.breaker.as_dict() if self.breaker else None,
+        }
+
+
+class WorkerPool:
+    """Least-outstanding-requests balancer over a fixed set of workers."""
+
+    def __init__(self, base_port: int, size: int, socket_dir: str = None):
+        size = max(1, size)
+        self.workers = []
+        self.standby = []
+        for i in range(size):
+            # The proxy pid keeps socket names unique across instances on one host
+            socket_path = os.path.join(socket_dir, f"blockview-ts-{os.getpid()}-{i}.sock") if socket_dir else None
+            self.workers.append(TsWorker(i, base_port + i, socket_path))
+            standby_socket = os.path.join(socket_dir, f"blockview-ts-{os.getpid()}-{i}b.sock") if socket_dir else None
+            self.standby.append(TsWorker(i, base_port + size + i, standby_socket, name=f"ts-worker-{i}b"))
+        # Rotating start offset so ties don't always land on worker 0
+        self._rotation = itertools.cycle(range(len(self.workers)))
+
+    def __len__(self):
+        return len(self.workers)
+
+    def _candidates(self, exclude=()):
+        start = next(self._rotation)
+        ordered = self.workers[start:] + self.workers[:start]
+        return [w for w in ordered if w.available() and w not in exclude]
+
+    def pick(self, exclude=()):
+        """Ready worker with the fewest in-flight HTTP requests, or None"""
+        candidates = self._candidates(exclude)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda w: w.outstanding)
+
+    def pick_for_websocket(self):
+        """The primary if it is ready, else None: only it has events to send"""
+        primary = self.workers[0]
+        return primary if primary.available() else None
+
+    def acquire(self, worker: TsWorker):
+        worker.outstanding += 1
+
+    def release(self, worker: TsWorker):
+        worker.outstanding -= 1
+
+    def all_workers(self) -> list:
+        """Serving and standby workers: every address the upstream client must reach"""
+        return self.workers + self.standby
+
+    def swap(self, index: int) -> TsWorker:
+        """Put slot `index`'s standby into service; returns the worker it replaced"""
+        old = self.workers[index]
+        self.workers[index], self.standby[index] = self.standby[index], old
+        return old
+
+    def terminate_all(self, timeout: float = 5):
+        for worker in self.all_workers():
+            if worker.alive():
+                worker.process.terminate()
+        for worker in self.all_workers():
+            worker.terminate(timeout)
+            if worker.socket_path and os.path.exists(worker.socket_path):
+                os.unlink(worker.socket_path)
+
+    def as_dict(self) -> dict:
+        return {
+            "size": len(self.workers),
+            "workers": [w.as_dict() for w in self.workers],
+            "standby": [w.as_dict() for w in self.standby if w.alive()],
+        }
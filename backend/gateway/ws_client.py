@@ -0,0 +1,165 @@
+"""
+Per-client WebSocket send queues with slow-consumer policies.
+
+Upstream readers never await a browser socket directly. Each client has a
+bounded queue drained by its own writer task, so one slow browser can only
+hurt itself. The overflow policy decides what happens when it falls behind:
+
+- drop_oldest: a full queue discards its oldest message
+- coalesce:    a newer message with the same key (event type + identity) replaces
+               the queued one in place, so a lagging client only gets the
+               latest state; a full queue without a match drops the oldest
+- disconnect:  a full queue closes the client with 1008 "slow consumer"
+
+Text and binary frames are both carried; the frame type is preserved.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+
+OVERFLOW_POLICIES = ('drop_oldest', 'coalesce', 'disconnect')
+
+
+class QueuedMessage:
+    __slots__ = ('payload', 'key', 'enqueued_at')
+
+    def __init__(self, payload, key):
+        self.payload = payload
+        self.key = key
+        self.enqueued_at = time.monotonic()
+
+
+class LocalClient:
+    """A browser connection with a bounded outbound queue."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, websocket, max_queue: int = 256, policy: str = 'drop_oldest'):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown WebSocket overflow policy: {policy}")
+        self.id = next(self._ids)
+        self.websocket = websocket
+        self.subscriptions = set()
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self._queue = deque()
+        self._by_key = {}
+        self._wakeup = asyncio.Event()
+        self._writer = None
+        self.closed = False
+        self.connected_at = time.monotonic()
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def start(self):
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._drain())
+
+    async def stop(self):
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._writer = None
+
+    def offer(self, payload, key: str = None) -> bool:
+        """Queue a text (str) or binary (bytes) frame without blocking; False if it was not queued"""
+        if self.closed:
+            return False
+
+        if key is not None and self.policy == 'coalesce':
+            queued = self._by_key.get(key)
+            if queued is not None:
+                # Newest state wins, but the slot keeps its place (and lag) in the queue
+                queued.payload = payload
+                self.coalesced += 1
+                return True
+
+        if len(self._queue) >= self.max_queue:
+            if self.policy == 'disconnect':
+                self._overflow_disconnect()
+                return False
+            self._drop_oldest()
+
+        message = QueuedMessage(payload, key)
+        self._queue.append(message)
+        if key is not None and self.policy == 'coalesce':
+            self._by_key[key] = message
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._wakeup.set()
+        return True
+
+    def _drop_oldest(self):
+        oldest = self._queue.popleft()
+        if oldest.key is not None and self._by_key.get(oldest.key) is oldest:
+            del self._by_key[oldest.key]
+        self.dropped += 1
+
+    def _overflow_disconnect(self):
+        self.closed = True
+        self.dropped += len(self._queue) + 1
+        self._queue.clear()
+        self._by_key.clear()
+        print(f"[Proxy] WS client {self.id} disconnected: send queue full ({self.max_queue})")
+        asyncio.ensure_future(self._close(1008, "slow consumer"))
+
+    async def _close(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _drain(self):
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                message = self._queue.popleft()
+                if message.key is not None and self._by_key.get(message.key) is message:
+                    del self._by_key[message.key]
+                if isinstance(message.payload, bytes):
+                    await self.websocket.send_bytes(message.payload)
+                else:
+                    await self.websocket.send_text(message.payload)
+                self.sent += 1
+                self.last_lag_ms = (time.monotonic() - message.enqueued_at) * 1000
+                self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            # The receive loop sees the disconnect and cleans up; just stop writing
+            self.closed = True
+            print(f"[Proxy] WS client {self.id} send failed: {err!r}")
+
+    def stats(self) -> dict:
+        return {
+            "id": self.id,
+            "policy": self.policy,
+            "subscriptions": sorted(self.subscriptions),
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self.max_depth,
+            "queue_limit": self.max_queue,
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "lag_ms": round(self.last_lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "connected_s": round(time.monotonic() - self.connected_at, 1),
+        }
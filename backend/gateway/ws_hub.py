@@ -0,0 +1,299 @@
+"""
+Shared upstream WebSocket with subscription multiplexing.
+
+Instead of one TS /ws connection per browser, the proxy keeps a small pool
+of upstream links and fans SystemEvents out to local clients itself. It
+speaks the protocol of src/core/websocket/ws-gateway.ts on both sides:
+
+- clients send {"type": "hello", "subscriptions": [...]}, {"type":
+  "subscribe" | "unsubscribe", "category": ...} and {"type": "ping"};
+  all of them are answered locally ('connected' on open, 'pong' on ping)
+- events carry no channel; their category comes from the type prefix,
+  exactly as getEventCategory() derives it (unknown prefixes fall back
+  to 'resolver')
+- a client with an empty subscription set receives every upstream
+  category, as in ws-gateway.ts
+- each category is requested upstream on the one link its name hashes
+  to; a link re-sends its hello whenever its category set changes, and
+  on reconnect. A link with nothing to carry subscribes to IDLE_CATEGORY,
+  since an empty list would mean "everything" upstream
+- events are relayed as the original frame, so the payload is serialized
+  once no matter how many clients receive it; delivery goes through each
+  client's bounded queue (see ws_client), so the upstream reader never
+  waits on a slow browser
+- dropped links reconnect with backoff and resend their hello
+- local categories (e.g. 'jobs') are never requested upstream; the proxy
+  publishes to them itself, and only clients that name them receive them
+"""
+
+import asyncio
+import json
+import time
+import zlib
+
+from gateway.ws_client import LocalClient
+
+# ws-gateway.ts getEventCategory(): type prefix -> category
+EVENT_CATEGORIES = (
+    ('bootstrap.', 'bootstrap'),
+    ('resolver.', 'resolver'),
+    ('attribution.', 'attribution'),
+    ('alert.', 'alerts'),
+    ('signal.', 'signals'),
+)
+DEFAULT_CATEGORY = 'resolver'
+UPSTREAM_CATEGORIES = tuple(category for _, category in EVENT_CATEGORIES)
+
+# A category no event maps to; keeps an unused link quiet
+IDLE_CATEGORY = '_proxy_idle'
+
+# Fields that identify the thing an event describes, for the coalesce policy
+IDENTITY_FIELDS = ('dedupKey', 'input', 'id')
+
+
+def event_category(type_: str) -> str:
+    for prefix, category in EVENT_CATEGORIES:
+        if (type_ or '').startswith(prefix):
+            return category
+    return DEFAULT_CATEGORY
+
+
+def event_key(message: dict):
+    """type:identity of an event, for the coalesce overflow policy; None for one-off events"""
+    for field in IDENTITY_FIELDS:
+        if message.get(field) is not None:
+            return f"{message.get('type')}:{message[field]}"
+    return None
+
+
+def now_ms() -> int:
+    """Timestamp in the format of JS Date.now()"""
+    return int(time.time() * 1000)
+
+
+def system_message(type_: str, **fields) -> str:
+    return json.dumps({"type": type_, **fields, "timestamp": now_ms()}, separators=(',', ':'))
+
+
+class UpstreamLink:
+    """One upstream /ws connection carrying a share of the categories."""
+
+    def __init__(self, hub, index: int):
+        self.hub = hub
+        self.index = index
+        self.categories = set()
+        self.worker = None
+        self._ws = None
+        self._task = None
+        self.connects = 0
+        self.received = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def hello(self) -> str:
+        return json.dumps({"type": "hello", "subscriptions": sorted(self.categories) or [IDLE_CATEGORY]})
+
+    async def _run(self):
+        delay = 0.1
+        while True:
+            worker = self.hub.pick_worker()
+            if worker is None:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+                continue
+            worker.ws_sessions += 1
+            try:
+                async with worker.ws_connect() as ws:
+                    self.worker, self._ws = worker, ws
+                    self.connects += 1
+                    delay = 0.1
+                    await ws.send(self.hello())
+                    async for message in ws:
+                        self.received += 1
+                        await self.hub.dispatch(self, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                print(f"[Proxy] WS upstream link {self.index} dropped: {err!r}")
+            finally:
+                worker.ws_sessions -= 1
+                self.worker, self._ws = None, None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5.0)
+
+    async def reconnect(self):
+        """Drop the upstream connection; _run reconnects to a freshly picked worker"""
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def carry(self, categories: set):
+        """Request exactly these categories upstream; replayed on reconnect if the link is down"""
+        if categories == self.categories:
+            return
+        self.categories = set(categories)
+        if self._ws is not None:
+            try:
+                await self._ws.send(self.hello())
+            except Exception:
+                pass
+
+
+class WsHub:
+    """Fans upstream SystemEvents out to local clients by category."""
+
+    def __init__(self, pick_worker, links: int = 1, local_categories=()):
+        self.pick_worker = pick_worker
+        self.local_categories = set(local_categories)
+        self.links = [UpstreamLink(self, i) for i in range(max(1, links))]
+        self.clients = {}
+        self.fanned_out = 0
+        self.upstream_hellos = 0
+
+    def link_for(self, category: str) -> UpstreamLink:
+        return self.links[zlib.crc32(category.encode()) % len(self.links)]
+
+    def start(self):
+        for link in self.links:
+            link.start()
+
+    async def stop(self):
+        for link in self.links:
+            await link.stop()
+
+    async def move_off(self, worker):
+        """Reconnect the links attached to a worker that is being retired"""
+        for link in self.links:
+            if link.worker is worker:
+                await link.reconnect()
+
+    @staticmethod
+    def wants(client: LocalClient, category: str, local: bool = False) -> bool:
+        if category in client.subscriptions:
+            return True
+        # An empty set means "everything" upstream; local categories are opt-in
+        return not local and not client.subscriptions
+
+    def needed_categories(self) -> set:
+        """Upstream categories some local client currently wants"""
+        needed = set()
+        for client in self.clients.values():
+            if not client.subscriptions:
+                return set(UPSTREAM_CATEGORIES)
+            needed |= client.subscriptions
+        return needed - self.local_categories
+
+    async def resubscribe(self):
+        """Bring every link's upstream category set in line with what local clients want"""
+        needed = self.needed_categories()
+        for link in self.links:
+            categories = {category for category in needed if self.link_for(category) is link}
+            if categories != link.categories:
+                self.upstream_hellos += 1
+                await link.carry(categories)
+
+    async def register(self, client: LocalClient):
+        self.start()
+        client.start()
+        self.clients[client.id] = client
+        client.offer(system_message('connected', clientId=f"ws_proxy_{client.id}"))
+        await self.resubscribe()
+
+    async def unregister(self, client: LocalClient):
+        self.clients.pop(client.id, None)
+        await client.stop()
+        await self.resubscribe()
+
+    async def handle_client_message(self, client: LocalClient, data):
+        """Apply a client message (text or binary); anything else is ignored, as ws-gateway.ts does"""
+        client.received += 1
+        try:
+            message = json.loads(data)
+        except (ValueError, UnicodeDecodeError):
+            return
+        if not isinstance(message, dict):
+            return
+        type_ = message.get('type')
+        category = message.get('category')
+        if type_ == 'hello':
+            if isinstance(message.get('subscriptions'), list):
+                client.subscriptions = {str(c) for c in message['subscriptions']}
+                await self.resubscribe()
+        elif type_ == 'subscribe' and category:
+            client.subscriptions.add(str(category))
+            await self.resubscribe()
+        elif type_ == 'unsubscribe' and category:
+            client.subscriptions.discard(str(category))
+            await self.resubscribe()
+        elif type_ == 'ping':
+            client.offer(system_message('pong'))
+
+    def publish(self, category: str, type_: str, payload: dict):
+        """Send a proxy-generated event to the local clients subscribed to a local category"""
+        targets = [client for client in self.clients.values() if self.wants(client, category, local=True)]
+        if not targets:
+            return
+        raw = system_message(type_, **payload)
+        self.fanned_out += len(targets)
+        for client in targets:
+            client.offer(raw, event_key({"type": type_, **payload}))
+
+    async def dispatch(self, link: UpstreamLink, raw):
+        """Relay one upstream event to the local clients that want it"""
+        try:
+            message = json.loads(raw)
+            type_ = message.get('type')
+        except (ValueError, UnicodeDecodeError, AttributeError):
+            return
+        # Replies to the link itself
+        if type_ in ('connected', 'pong'):
+            return
+        category = event_category(type_)
+        # Only the link that carries a category relays it, so nothing is delivered twice
+        if self.link_for(category) is not link:
+            return
+        targets = [client for client in self.clients.values() if self.wants(client, category)]
+        if not targets:
+            return
+        key = event_key(message)
+        self.fanned_out += len(targets)
+        for client in targets:
+            client.offer(raw, key)
+
+    def stats(self) -> dict:
+        categories = {}
+        for client in self.clients.values():
+            for category in client.subscriptions or ('*',):
+                categories[category] = categories.get(category, 0) + 1
+        return {
+            "clients": len(self.clients),
+            "categories": categories,
+            "upstream_links": [
+                {
+                    "index": link.index,
+                    "connected": link.connected,
+                    "worker": link.worker.index if link.worker else None,
+                    "categories": sorted(link.categories),
+                    "connects": link.connects,
+                    "received": link.received,
+                }
+                for link in self.links
+            ],
+            "upstream_hellos": self.upstream_hellos,
+            "messages_fanned_out": self.fanned_out,
+            "connections": [client.stats() for client in self.clients.values()],
+        }
@@ -5,29 +5,474 @@ BlockView Backend - Supervisor Compatibility Layer
 ✅ TypeScript backend is the ONLY execution layer
 
 This file exists ONLY for supervisor/uvicorn compatibility.
-It launches TypeScript on port 8002 and proxies requests from 8001.
+It launches TypeScript workers on ports 8002+ (TS_WORKERS, default: CPU count)
+and proxies requests from 8001.
 
 ALL business logic is in TypeScript:
 - Bootstrap Worker, Resolver, Indexers, Attribution, ENS, WebSocket
 """
 
 import os
-import subprocess
+import sys
 import asyncio
 import atexit
+import hmac
+import ipaddress
+import json
+import math
+import re
+import signal
+import tempfile
+import time
 import httpx
 from pathlib import Path
+from urllib.parse import parse_qsl, urlencode
 from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from starlette.middleware.cors import CORSMiddleware
 import websockets
 
+from gateway.batch import BatchError, SubRequest, decode_body, empty_body, parse_batch, sub_request_scope
+from gateway.bulkhead import Bulkheads, RouteClass
+from gateway.cache import CachedResponse, ResponseCache, cache_key, longest_prefix
+from gateway.coalesce import SingleFlight
+from gateway.compression import Compressor, available_encodings, is_compressible, negotiate
+from gateway.config import env_bool, env_float, env_int, env_list, env_map
+from gateway.delta import DELTA_IM, DeltaHistory, wants_delta
+from gateway.etag import etag_matches, make_etag, not_modified_headers, variant_etag
+from gateway.jobs import JobQueue
+from gateway.metrics import ProxyMetrics, RouteTemplates
+from gateway.projection import ProjectionError, parse_fields, project_body
+from gateway.ratelimit import RateLimiter
+from gateway.readiness import ReadinessGate, StartupTimings, wait_until_ready
+from gateway.resilience import CircuitBreaker, HedgeStats, LatencyTracker, RetryBudget, hedged_call
+from gateway.snapshot import SnapshotEntry, read_snapshot, write_snapshot
+from gateway.supervisor import Supervisor
+from gateway.upstream import make_upstream_client, upstream_limits
+from gateway.workers import WorkerPool, available_cpus
+from gateway.ws_client import OVERFLOW_POLICIES, LocalClient
+from gateway.ws_hub import WsHub, event_key
+
 ROOT_DIR = Path(__file__).parent
 TS_PORT = 8002
-TS_URL = f"http://127.0.0.1:{TS_PORT}"
 
-ts_process = None
+# Number of TypeScript workers, on consecutive ports starting at TS_PORT.
+# Unset, it follows the CPUs this container may use (affinity and cgroup
+# quota, not the host's core count), capped at TS_WORKERS_MAX: every worker
+# is a Node process of a few hundred MB plus a standby during restarts.
+# Replicas keep their own in-process caches (see gateway/workers.py).
+TS_WORKERS_MAX = env_int('TS_WORKERS_MAX', 4)
+TS_WORKERS = env_int('TS_WORKERS', 0) or min(available_cpus(), TS_WORKERS_MAX)
+
+# What the workers run: 'tsx' (the real TypeScript backend) or 'fixtures'
+# (fixtures/backend.py, replaying recorded responses with no DB or network)
+TS_BACKEND = os.environ.get('TS_BACKEND', 'tsx').lower()
+if TS_BACKEND not in ('tsx', 'fixtures'):
+    raise ValueError(f"TS_BACKEND must be 'tsx' or 'fixtures', got {TS_BACKEND!r}")
+
+# Proxy <-> TS transport: 'tcp' (loopback ports) or 'uds' (Unix sockets in TS_SOCKET_DIR)
+TS_TRANSPORT = os.environ.get('TS_TRANSPORT', 'tcp').lower()
+TS_SOCKET_DIR = os.environ.get('TS_SOCKET_DIR') or tempfile.gettempdir()
+
+# Upstream connection pool, per worker. Each bulkhead route class gets its own
+# pool sized to its concurrency cap, bounded by these connection and
+# keep-alive limits (which also size the shared client used for probes).
+# Keep-alive expiry stays below Fastify's 72s keepAliveTimeout so the proxy
+# never reuses a socket Node is closing.
+PROXY_TIMEOUT = env_float('PROXY_TIMEOUT', 60)
+PROXY_POOL_MAX_CONNECTIONS = env_int('PROXY_POOL_MAX_CONNECTIONS', 100)
+PROXY_POOL_MAX_KEEPALIVE = env_int('PROXY_POOL_MAX_KEEPALIVE', 50)
+PROXY_POOL_KEEPALIVE_EXPIRY = env_float('PROXY_POOL_KEEPALIVE_EXPIRY', 30)
+
+# Pass bodies through chunk by chunk instead of buffering them in the proxy.
+# Set PROXY_STREAMING=false to fall back to the old buffered behaviour.
+PROXY_STREAMING = env_bool('PROXY_STREAMING', True)
+
+# Strong ETags on buffered and cached 200 responses; If-None-Match gets a 304
+PROXY_ETAGS = env_bool('PROXY_ETAGS', True)
+
+# Delta responses for polling clients: a GET with "A-IM: json-delta" and the
+# ETag it holds in If-None-Match gets a 226 patch against that version while
+# the proxy still remembers it (PROXY_DELTA_VERSIONS per route and query, for
+# up to PROXY_DELTA_MAX_KEYS queries and PROXY_DELTA_MAX_MB of bodies in all).
+# Only queries a client has asked a delta for are remembered, and only their
+# successful bodies. Delta routes are always buffered.
+PROXY_DELTAS = env_bool('PROXY_DELTAS', True)
+PROXY_DELTA_ROUTES = env_list('PROXY_DELTA_ROUTES', [
+    '/api/rankings',
+    '/api/rankings/dashboard',
+    '/api/rankings/movers',
+])
+PROXY_DELTA_VERSIONS = env_int('PROXY_DELTA_VERSIONS', 8)
+PROXY_DELTA_MAX_KEYS = env_int('PROXY_DELTA_MAX_KEYS', 256)
+PROXY_DELTA_MAX_MB = env_int('PROXY_DELTA_MAX_MB', 32)
+
+# Server-side field projection: GET <route>?fields=symbol,engineScore,... on
+# these routes gets every list item trimmed to the named (dotted) paths.
+# Projected bodies are cached under their own key for PROXY_PROJECTION_TTL
+# seconds, unless the route's own cache TTL applies.
+PROXY_PROJECTION_ROUTES = env_list('PROXY_PROJECTION_ROUTES', [
+    '/api/tokens',
+    '/api/token-runner/analyses',
+    '/api/rankings',
+])
+PROXY_PROJECTION_MAX_FIELDS = env_int('PROXY_PROJECTION_MAX_FIELDS', 50)
+PROXY_PROJECTION_TTL = env_float('PROXY_PROJECTION_TTL', 15)
+
+# NDJSON exports of whole collections; always streamed, even with
+# PROXY_STREAMING=false, since they are never meant to sit in memory
+PROXY_EXPORT_ROUTES = env_list('PROXY_EXPORT_ROUTES', [
+    '/api/tokens/export',
+    '/api/token-runner/analyses/export',
+])
+
+# Hop-by-hop headers must not be forwarded in either direction (RFC 7230 §6.1)
+HOP_BY_HOP = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'transfer-encoding', 'upgrade',
+}
+
+# Readiness probing: how long to wait for the child to become healthy,
+# and how long an early request may queue before it gets a 503.
+TS_READY_PATH = os.environ.get('TS_READY_PATH', '/api/health')
+TS_READY_DEADLINE = env_float('TS_READY_DEADLINE', 90)
+PROXY_READY_WAIT = env_float('PROXY_READY_WAIT', 10)
+
+# Supervision: crashed workers are restarted after TS_RESTART_BACKOFF
+# seconds, doubling per consecutive crash up to TS_RESTART_BACKOFF_MAX
+# (the streak resets once a worker has stayed up TS_RESTART_STABLE_AFTER).
+# Rolling restarts (SIGHUP or POST /api/_proxy/workers/restart) start each
+# replacement on a standby port and give the old worker TS_DRAIN_TIMEOUT
+# seconds to finish in-flight requests; stopped workers get TS_STOP_TIMEOUT
+# seconds after SIGTERM before they are killed.
+TS_RESTART_BACKOFF = env_float('TS_RESTART_BACKOFF', 0.5)
+TS_RESTART_BACKOFF_MAX = env_float('TS_RESTART_BACKOFF_MAX', 30)
+TS_RESTART_STABLE_AFTER = env_float('TS_RESTART_STABLE_AFTER', 60)
+TS_DRAIN_TIMEOUT = env_float('TS_DRAIN_TIMEOUT', 30)
+TS_STOP_TIMEOUT = env_float('TS_STOP_TIMEOUT', 10)
+
+# Response cache for hot read endpoints.
+# PROXY_CACHE_ROUTES: "prefix=ttl_seconds,..."
+# PROXY_CACHE_PURGE: "mutating_path=prefix|prefix,..." (applied on 2xx non-GET calls)
+PROXY_CACHE = env_bool('PROXY_CACHE', True)
+PROXY_CACHE_ROUTES = {k: float(v) for k, v in env_map('PROXY_CACHE_ROUTES', {
+    '/api/tokens/stats': '30',
+    '/api/rankings/buckets': '30',
+    '/api/rankings/dashboard': '30',
+    '/api/token-runner/top': '30',
+}).items()}
+PROXY_CACHE_PURGE = {k: v.split('|') for k, v in env_map('PROXY_CACHE_PURGE', {
+    '/api/rankings/compute': '/api/rankings|/api/tokens/stats',
+    '/api/token-runner/run': '/api/token-runner|/api/tokens/stats',
+    '/api/tokens/sync': '/api/tokens|/api/rankings',
+    '/api/tokens/seed': '/api/tokens|/api/rankings',
+}).items()}
+# Stale serving per route prefix, in seconds past the TTL (RFC 5861):
+# PROXY_CACHE_STALE: serve the expired entry while one background request refreshes it
+# PROXY_CACHE_STALE_IF_ERROR: serve it when the upstream fails or is not ready
+PROXY_CACHE_STALE = {k: float(v) for k, v in env_map('PROXY_CACHE_STALE', {
+    '/api/rankings': '120',
+    '/api/tokens/stats': '60',
+    '/api/token-runner/top': '60',
+}).items()}
+PROXY_CACHE_STALE_IF_ERROR = {k: float(v) for k, v in env_map('PROXY_CACHE_STALE_IF_ERROR', {
+    '/api/rankings': '600',
+    '/api/tokens/stats': '600',
+    '/api/token-runner/top': '600',
+}).items()}
+PROXY_CACHE_MAX_ENTRIES = env_int('PROXY_CACHE_MAX_ENTRIES', 1024)
+PROXY_CACHE_MAX_MB = env_int('PROXY_CACHE_MAX_MB', 64)
+
+# Warm restarts: cached responses under PROXY_SNAPSHOT_ROUTES are written to
+# PROXY_SNAPSHOT_PATH every PROXY_SNAPSHOT_INTERVAL seconds and on shutdown.
+# On startup, entries younger than PROXY_SNAPSHOT_MAX_AGE are restored as
+# stale, so they are served while the workers start; once the first worker
+# is ready, the restored keys and the PROXY_WARMUP paths are fetched again.
+# The default path names the instance (PROXY_INSTANCE_ID, else the proxy's
+# PORT), so proxies sharing a host never overwrite each other's snapshot.
+PROXY_SNAPSHOT = env_bool('PROXY_SNAPSHOT', True)
+PROXY_INSTANCE_ID = re.sub(r'[^A-Za-z0-9_.-]', '_', os.environ.get('PROXY_INSTANCE_ID') or os.environ.get('PORT') or '8001')
+PROXY_SNAPSHOT_PATH = os.environ.get('PROXY_SNAPSHOT_PATH') or os.path.join(
+    tempfile.gettempdir(), f"blockview-proxy-cache-{PROXY_INSTANCE_ID}.snapshot")
+PROXY_SNAPSHOT_ROUTES = env_list('PROXY_SNAPSHOT_ROUTES', [
+    '/api/rankings/dashboard',
+    '/api/rankings/buckets',
+    '/api/tokens/stats',
+    '/api/token-runner/top',
+])
+PROXY_SNAPSHOT_INTERVAL = env_float('PROXY_SNAPSHOT_INTERVAL', 60)
+PROXY_SNAPSHOT_MAX_AGE = env_float('PROXY_SNAPSHOT_MAX_AGE', 3600)
+PROXY_WARMUP = env_list('PROXY_WARMUP', [
+    '/api/rankings/dashboard',
+    '/api/rankings/buckets',
+    '/api/tokens/stats',
+    '/api/token-runner/top',
+])
+
+# Single-flight coalescing of identical in-flight GETs, opted in per exact
+# path. Coalesced responses are buffered, so list pages (/api/rankings,
+# /api/tokens) stay off this list and keep streaming.
+PROXY_COALESCE = env_bool('PROXY_COALESCE', True)
+PROXY_COALESCE_ROUTES = env_list('PROXY_COALESCE_ROUTES', [
+    '/api/rankings/dashboard',
+    '/api/rankings/buckets',
+    '/api/rankings/movers',
+    '/api/tokens/stats',
+    '/api/tokens/top',
+    '/api/token-runner/top',
+    '/api/token-runner/stats',
+])
+
+# WebSocket: share PROXY_WS_UPSTREAM_LINKS upstream connections between all
+# browser clients (PROXY_WS_SHARED=false bridges each client to its own).
+# Either way /ws goes to the primary worker, the only one emitting events.
+PROXY_WS_SHARED = env_bool('PROXY_WS_SHARED', True)
+PROXY_WS_UPSTREAM_LINKS = env_int('PROXY_WS_UPSTREAM_LINKS', 1)
+
+# Per-client send queue bound and what to do when it overflows:
+# drop_oldest | coalesce (same event type + identity) | disconnect
+PROXY_WS_QUEUE = env_int('PROXY_WS_QUEUE', 256)
+PROXY_WS_OVERFLOW = os.environ.get('PROXY_WS_OVERFLOW', 'drop_oldest')
+if PROXY_WS_OVERFLOW not in OVERFLOW_POLICIES:
+    raise ValueError(f"PROXY_WS_OVERFLOW must be one of {OVERFLOW_POLICIES}, got {PROXY_WS_OVERFLOW!r}")
+
+# Negotiated response compression. brotli/zstd need the optional `brotli` and
+# `zstandard` packages; encodings that are not installed are skipped.
+PROXY_COMPRESSION = env_bool('PROXY_COMPRESSION', True)
+PROXY_COMPRESSION_MIN_BYTES = env_int('PROXY_COMPRESSION_MIN_BYTES', 1024)
+PROXY_COMPRESSION_ENCODINGS = tuple(
+    enc for enc in env_list('PROXY_COMPRESSION_ENCODINGS', ['zstd', 'br', 'gzip'])
+    if enc in available_encodings()
+)
+PROXY_COMPRESSION_LEVELS = {k: int(v) for k, v in env_map('PROXY_COMPRESSION_LEVELS', {
+    'gzip': '6',
+    'br': '5',
+    'zstd': '6',
+}).items()}
+
+# Per-route metrics in Prometheus format at /api/_proxy/metrics. Paths are
+# folded into route templates; PROXY_METRICS_TEMPLATES adds templates
+# ("/api/foo/:id,...") for parameterised routes the id heuristics miss.
+PROXY_METRICS = env_bool('PROXY_METRICS', True)
+PROXY_METRICS_TEMPLATES = env_list('PROXY_METRICS_TEMPLATES', []) + [
+    '/api/tokens/stats',
+    '/api/tokens/top',
+    '/api/tokens/sync',
+    '/api/tokens/seed',
+    '/api/tokens/trending',
+    '/api/tokens/export',
+    '/api/tokens/:symbol',
+    '/api/tokens/:address/profile',
+    '/api/tokens/:address/cohorts',
+    '/api/rankings/bucket/:bucket',
+    '/api/rankings/token/:symbol',
+    '/api/token-runner/analysis/:symbol',
+    '/api/token-runner/analyses/export',
+    '/api/ens/resolve/:name',
+    '/api/ens/reverse/:address',
+]
+PROXY_METRICS_MAX_ROUTES = env_int('PROXY_METRICS_MAX_ROUTES', 200)
+
+# Per-client token-bucket rate limiting. Clients are keyed by the
+# PROXY_RATE_KEY_HEADER API key when sent, else by IP: the socket peer, or,
+# with PROXY_TRUST_FORWARDED behind an ingress, the X-Forwarded-For entry
+# PROXY_FORWARDED_HOPS from the right (the one the trusted ingress appended;
+# entries left of it are client-controlled).
+# PROXY_RATE_COSTS: "prefix=tokens,..." (unlisted routes cost PROXY_RATE_DEFAULT_COST).
+# Requests short of tokens wait up to PROXY_RATE_MAX_WAIT seconds, at most
+# PROXY_RATE_QUEUE per client; beyond that they get 429 with Retry-After.
+# Off by default: behind an ingress, enable it together with
+# PROXY_TRUST_FORWARDED, or every user shares the ingress's bucket (or its
+# loopback exemption). Enabling it without that logs a warning at startup.
+PROXY_RATE_LIMIT = env_bool('PROXY_RATE_LIMIT', False)
+PROXY_RATE = env_float('PROXY_RATE', 20)
+PROXY_RATE_BURST = env_float('PROXY_RATE_BURST', 60)
+PROXY_RATE_COSTS = {k: float(v) for k, v in env_map('PROXY_RATE_COSTS', {
+    '/api/health': '0',
+    '/api/token-runner/run': '30',
+    '/api/rankings/compute': '30',
+    '/api/tokens/sync': '30',
+    '/api/tokens/seed': '30',
+    '/api/tokens/export': '10',
+    '/api/token-runner/analyses/export': '10',
+}).items()}
+PROXY_RATE_DEFAULT_COST = env_float('PROXY_RATE_DEFAULT_COST', 1)
+PROXY_RATE_QUEUE = env_int('PROXY_RATE_QUEUE', 8)
+PROXY_RATE_MAX_WAIT = env_float('PROXY_RATE_MAX_WAIT', 2)
+PROXY_RATE_KEY_HEADER = os.environ.get('PROXY_RATE_KEY_HEADER', 'x-api-key').lower()
+PROXY_TRUST_FORWARDED = env_bool('PROXY_TRUST_FORWARDED', False)
+PROXY_FORWARDED_HOPS = env_int('PROXY_FORWARDED_HOPS', 1)
+# Local callers (supervisor probes, benchmarks on the box) are not limited;
+# matched against the socket peer only, never a forwarded address
+PROXY_RATE_EXEMPT = env_list('PROXY_RATE_EXEMPT', ['ip:127.0.0.1', 'ip:::1'])
+
+# Bulkheads: route classes with their own upstream connection pool,
+# concurrency cap and timeout, picked by longest path prefix.
+# PROXY_ROUTE_CLASSES: "prefix=class,..."; unlisted paths use 'default'.
+# A call that finds its class full waits up to the class's queue wait,
+# then gets a 503; an upstream that outlasts the class timeout gets a 504.
+PROXY_ROUTE_CLASSES = env_map('PROXY_ROUTE_CLASSES', {
+    '/api/token-runner/run': 'heavy',
+    '/api/rankings/compute': 'heavy',
+    '/api/tokens/sync': 'heavy',
+    '/api/tokens/seed': 'heavy',
+    '/api/tokens/export': 'export',
+    '/api/token-runner/analyses/export': 'export',
+    '/api/health': 'interactive',
+    '/api/tokens': 'interactive',
+    '/api/rankings': 'interactive',
+    '/api/token-runner': 'interactive',
+})
+PROXY_CLASS_CONCURRENCY = {k: int(v) for k, v in env_map('PROXY_CLASS_CONCURRENCY', {
+    'heavy': '4',
+    'export': '4',
+    'interactive': '64',
+    'default': '32',
+}).items()}
+# For streamed exports the timeout bounds each read, not the whole transfer
+PROXY_CLASS_TIMEOUT = {k: float(v) for k, v in env_map('PROXY_CLASS_TIMEOUT', {
+    'heavy': '300',
+    'export': '60',
+    'interactive': '15',
+    'default': str(PROXY_TIMEOUT),
+}).items()}
+PROXY_CLASS_QUEUE_WAIT = {k: float(v) for k, v in env_map('PROXY_CLASS_QUEUE_WAIT', {
+    'heavy': '10',
+    'export': '5',
+    'interactive': '2',
+    'default': '5',
+}).items()}
+
+# Upstream resilience. Idempotent GETs get a second attempt on another
+# worker once they have been outstanding for their route's recent p95
+# (at least PROXY_HEDGE_MIN_DELAY_MS), and are retried on another worker
+# after a refused connection, up to PROXY_RETRY_MAX times. Hedges and
+# retries together stay within PROXY_RETRY_BUDGET of requests (plus a
+# PROXY_RETRY_BURST allowance). A worker with PROXY_BREAKER_FAILURES
+# consecutive failures is skipped for PROXY_BREAKER_COOLDOWN seconds;
+# with every worker's breaker open, requests get an immediate 503.
+PROXY_HEDGE = env_bool('PROXY_HEDGE', True)
+PROXY_HEDGE_MIN_DELAY_MS = env_float('PROXY_HEDGE_MIN_DELAY_MS', 20)
+PROXY_HEDGE_MIN_SAMPLES = env_int('PROXY_HEDGE_MIN_SAMPLES', 20)
+PROXY_RETRY_MAX = env_int('PROXY_RETRY_MAX', 1)
+PROXY_RETRY_BUDGET = env_float('PROXY_RETRY_BUDGET', 0.1)
+PROXY_RETRY_BURST = env_float('PROXY_RETRY_BURST', 10)
+PROXY_BREAKER = env_bool('PROXY_BREAKER', True)
+PROXY_BREAKER_FAILURES = env_int('PROXY_BREAKER_FAILURES', 5)
+PROXY_BREAKER_COOLDOWN = env_float('PROXY_BREAKER_COOLDOWN', 5)
+
+# Asynchronous jobs: POSTs to PROXY_JOB_ROUTES are answered with 202 and a
+# job id, then run in the background (status at /api/_proxy/jobs/<id>, and
+# as job.updated events in the 'jobs' WebSocket category in shared mode). Identical submissions
+# collapse into one run; a queued job starts after PROXY_JOB_DEBOUNCE
+# seconds and at most PROXY_JOB_CONCURRENCY jobs run at once. A caller
+# sending "Prefer: wait=N" gets the result inline if the job finishes
+# within N seconds (at most PROXY_JOB_MAX_WAIT).
+PROXY_JOBS = env_bool('PROXY_JOBS', True)
+PROXY_JOB_ROUTES = env_list('PROXY_JOB_ROUTES', [
+    '/api/token-runner/run',
+    '/api/rankings/compute',
+])
+PROXY_JOB_DEBOUNCE = env_float('PROXY_JOB_DEBOUNCE', 0.5)
+PROXY_JOB_CONCURRENCY = env_int('PROXY_JOB_CONCURRENCY', 2)
+PROXY_JOB_HISTORY = env_int('PROXY_JOB_HISTORY', 200)
+PROXY_JOB_MAX_WAIT = env_float('PROXY_JOB_MAX_WAIT', 300)
+
+# Batch endpoint (POST /api/_proxy/batch): up to PROXY_BATCH_MAX GETs per
+# call, run concurrently through the normal proxy pipeline
+PROXY_BATCH_MAX = env_int('PROXY_BATCH_MAX', 20)
+
+# Upstream statuses that count against a worker's breaker
+OVERLOAD_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD'}
+
+# Reserved proxy-local endpoints; never forwarded to TypeScript.
+# The mutating ones (cache purge, rolling restart) only answer loopback
+# peers, or callers sending PROXY_ADMIN_TOKEN in X-Admin-Token when set.
+PROXY_ADMIN_PREFIX = '/api/_proxy'
+PROXY_ADMIN_TOKEN = os.environ.get('PROXY_ADMIN_TOKEN', '')
+
+pool = WorkerPool(TS_PORT, TS_WORKERS, socket_dir=TS_SOCKET_DIR if TS_TRANSPORT == 'uds' else None)
+if PROXY_BREAKER:
+    for _worker in pool.all_workers():
+        _worker.breaker = CircuitBreaker(PROXY_BREAKER_FAILURES, PROXY_BREAKER_COOLDOWN)
 http_client = None
+supervisor = None
+backend_ready = ReadinessGate()
+response_cache = ResponseCache(
+    PROXY_CACHE_ROUTES,
+    PROXY_CACHE_PURGE,
+    max_entries=PROXY_CACHE_MAX_ENTRIES,
+    max_bytes=PROXY_CACHE_MAX_MB * 1024 * 1024,
+    stale=PROXY_CACHE_STALE,
+    stale_if_error=PROXY_CACHE_STALE_IF_ERROR,
+) if PROXY_CACHE else None
+revalidations = {}
+snapshot_task = None
+warmup_task = None
+single_flight = SingleFlight(PROXY_COALESCE_ROUTES) if PROXY_COALESCE else None
+delta_history = DeltaHistory(PROXY_DELTA_VERSIONS, PROXY_DELTA_MAX_KEYS, PROXY_DELTA_MAX_MB * 1024 * 1024) if PROXY_DELTAS and PROXY_ETAGS else None
+compressor = Compressor(PROXY_COMPRESSION_LEVELS) if PROXY_COMPRESSION and PROXY_COMPRESSION_ENCODINGS else None
+
+def pick_ws_upstream():
+    return pool.pick_for_websocket()
+
+ws_hub = WsHub(
+    pick_ws_upstream,
+    links=PROXY_WS_UPSTREAM_LINKS,
+    local_categories=['jobs'] if PROXY_JOBS else [],
+) if PROXY_WS_SHARED else None
+ws_direct_clients = {}
+
+bulkheads = Bulkheads(
+    [
+        RouteClass(
+            name,
+            PROXY_CLASS_CONCURRENCY.get(name, PROXY_CLASS_CONCURRENCY.get('default', 32)),
+            PROXY_CLASS_TIMEOUT.get(name, PROXY_TIMEOUT),
+            PROXY_CLASS_QUEUE_WAIT.get(name, 5),
+        )
+        for name in {'default', *PROXY_ROUTE_CLASSES.values(), *PROXY_CLASS_CONCURRENCY}
+    ],
+    PROXY_ROUTE_CLASSES,
+)
+
+rate_limiter = RateLimiter(
+    PROXY_RATE,
+    PROXY_RATE_BURST,
+    PROXY_RATE_COSTS,
+    default_cost=PROXY_RATE_DEFAULT_COST,
+    max_queue=PROXY_RATE_QUEUE,
+    max_wait=PROXY_RATE_MAX_WAIT,
+    exempt=PROXY_RATE_EXEMPT,
+) if PROXY_RATE_LIMIT else None
+
+retry_budget = RetryBudget(PROXY_RETRY_BUDGET, PROXY_RETRY_BURST)
+upstream_latency = LatencyTracker(min_samples=PROXY_HEDGE_MIN_SAMPLES)
+hedge_stats = HedgeStats()
+
+def job_updated(job):
+    if ws_hub is not None:
+        ws_hub.publish('jobs', 'job.updated', job.as_dict())
+
+# run_job lives with the upstream helpers further down
+job_queue = JobQueue(
+    PROXY_JOB_ROUTES,
+    lambda job: run_job(job),
+    debounce=PROXY_JOB_DEBOUNCE,
+    concurrency=PROXY_JOB_CONCURRENCY,
+    history=PROXY_JOB_HISTORY,
+    on_update=job_updated,
+) if PROXY_JOBS else None
+
+def live_ws_clients():
+    return ws_hub.clients.values() if ws_hub is not None else ws_direct_clients.values()
+
+metrics = ProxyMetrics(
+    RouteTemplates(PROXY_METRICS_TEMPLATES, PROXY_METRICS_MAX_ROUTES),
+    live_ws_clients=live_ws_clients,
+) if PROXY_METRICS else None
 
 app = FastAPI(title="BlockView Proxy", docs_url=None, redoc_url=None)
 
@@ -40,22 +485,26 @@ app.add_middleware(
 )
 
 def cleanup():
-    global ts_process
-    if ts_process:
-        ts_process.terminate()
-        try:
-            ts_process.wait(timeout=5)
-        except:
-            ts_process.kill()
+    pool.terminate_all(timeout=TS_STOP_TIMEOUT)
 
 atexit.register(cleanup)
 
 @app.on_event("startup")
 async def startup():
-    global ts_process, http_client
+    global http_client, supervisor, snapshot_task, warmup_task
+    
+    if rate_limiter is not None and not PROXY_TRUST_FORWARDED:
+        print("[Proxy] Warning: rate limiting keys clients by socket peer (PROXY_TRUST_FORWARDED is off); "
+              "behind an ingress every user shares one bucket, or the loopback exemption")
+    
+    warm_keys = []
+    if response_cache is not None and PROXY_SNAPSHOT:
+        warm_keys = restore_snapshot()
+        if warm_keys:
+            print(f"[Proxy] Restored {len(warm_keys)} cached response(s) from {PROXY_SNAPSHOT_PATH}, serving them as stale")
+        snapshot_task = asyncio.get_running_loop().create_task(snapshot_loop())
     
     env = os.environ.copy()
-    env['PORT'] = str(TS_PORT)
     env['MONGODB_URI'] = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/blockview')
     env['NODE_ENV'] = os.environ.get('NODE_ENV', 'development')
     env['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'info')
@@ -72,8 +521,10 @@ async def startup():
     if os.environ.get('TELEGRAM_BOT_TOKEN'):
         env['TELEGRAM_BOT_TOKEN'] = os.environ.get('TELEGRAM_BOT_TOKEN')
     
-    tsx = str(ROOT_DIR / 'node_modules' / '.bin' / 'tsx')
-    server = str(ROOT_DIR / 'src' / 'server.ts')
+    if TS_BACKEND == 'fixtures':
+        cmd = [sys.executable, '-m', 'fixtures.backend']
+    else:
+        cmd = [str(ROOT_DIR / 'node_modules' / '.bin' / 'tsx'), str(ROOT_DIR / 'src' / 'server.ts')]
     
     print("=" * 60)
     print("BlockView Backend")
@@ -81,60 +532,1099 @@ async def startup():
     print("✅ TypeScript is the ONLY execution layer")
     print("=" * 60)
     
-    ts_process = subprocess.Popen([tsx, server], cwd=str(ROOT_DIR), env=env)
-    http_client = httpx.AsyncClient(timeout=60.0)
-    await asyncio.sleep(3)
+    if TS_BACKEND == 'fixtures':
+        print("[Proxy] TS_BACKEND=fixtures: workers replay recorded responses (fixtures/recorded.json)")
+    if TS_TRANSPORT == 'uds':
+        print(f"[Proxy] Starting {len(pool)} TypeScript worker(s) on Unix sockets in {TS_SOCKET_DIR}")
+    else:
+        print(f"[Proxy] Starting {len(pool)} TypeScript worker(s) on ports {TS_PORT}-{TS_PORT + len(pool) - 1}")
+    
+    http_client = make_upstream_client(
+        pool,
+        timeout=PROXY_TIMEOUT,
+        limits=upstream_limits(PROXY_POOL_MAX_CONNECTIONS, PROXY_POOL_MAX_KEEPALIVE, PROXY_POOL_KEEPALIVE_EXPIRY),
+    )
+    for route_class in bulkheads.classes.values():
+        route_class.client = make_upstream_client(pool, timeout=route_class.timeout, limits=route_class_limits(route_class))
+    
+    def spawn(worker):
+        timings = StartupTimings()
+        worker.spawn(cmd, env, str(ROOT_DIR))
+        timings.mark("spawned")
+        return timings
+    
+    supervisor = Supervisor(
+        pool,
+        spawn,
+        probe_worker,
+        on_ready=worker_ready,
+        on_retire=worker_retiring,
+        backoff=TS_RESTART_BACKOFF,
+        backoff_max=TS_RESTART_BACKOFF_MAX,
+        stable_after=TS_RESTART_STABLE_AFTER,
+        drain_timeout=TS_DRAIN_TIMEOUT,
+        stop_timeout=TS_STOP_TIMEOUT,
+    )
+    supervisor.start()
+    if response_cache is not None:
+        for path in PROXY_WARMUP:
+            key = cache_key(*path.partition('?')[::2])
+            if key not in warm_keys:
+                warm_keys.append(key)
+        warmup_task = asyncio.get_running_loop().create_task(warm_up(warm_keys))
+    try:
+        # `supervisorctl signal HUP` (or kill -HUP) rolls the workers without dropping requests
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, supervisor.schedule_rolling_restart)
+    except (NotImplementedError, RuntimeError, ValueError):
+        pass
+
+async def probe_worker(worker, timings, require_healthy: bool = False) -> bool:
+    """Probe one worker in the background; True once it should take traffic"""
+    ok = await wait_until_ready(
+        http_client,
+        f"{worker.url}{TS_READY_PATH}",
+        deadline=TS_READY_DEADLINE,
+        timings=timings,
+        process=worker.process,
+    )
+    name = f"worker {worker.index} ({worker.role}, {worker.socket_path or f':{worker.port}'})"
+    if ok:
+        print(f"[Proxy] TypeScript {name} ready: {timings.report()}")
+    elif worker.alive() and not require_healthy:
+        # Still alive but slow: stop queueing and let requests through
+        print(f"[Proxy] TypeScript {name} not healthy before deadline, forwarding anyway: {timings.report()}")
+    elif worker.alive():
+        print(f"[Proxy] TypeScript {name} not healthy before deadline: {timings.report()}")
+        return False
+    else:
+        print(f"[Proxy] TypeScript {name} exited during startup: {timings.report()}")
+        return False
+    return True
+
+def worker_ready(worker):
+    # A fresh process starts with a clean record; the gate opens with the first healthy worker
+    if worker.breaker is not None:
+        worker.breaker.on_success()
+    backend_ready.open()
+
+async def worker_retiring(worker):
+    # Shared WS links would hold the drain open; move them to the replacement now
+    if ws_hub is not None:
+        await ws_hub.move_off(worker)
 
 @app.on_event("shutdown")
 async def shutdown():
     global http_client
+    if supervisor is not None:
+        await supervisor.stop()
+    if job_queue is not None:
+        await job_queue.stop()
+    for task in [snapshot_task, warmup_task, *revalidations.values()]:
+        if task is not None:
+            task.cancel()
+    if snapshot_task is not None:
+        try:
+            count = write_snapshot(PROXY_SNAPSHOT_PATH, snapshot_entries())
+            print(f"[Proxy] Saved {count} cached response(s) to {PROXY_SNAPSHOT_PATH}")
+        except OSError as err:
+            print(f"[Proxy] Writing cache snapshot failed: {err!r}")
+    if ws_hub is not None:
+        await ws_hub.stop()
     cleanup()
+    for route_class in bulkheads.classes.values():
+        if route_class.client is not None:
+            await route_class.client.aclose()
     if http_client:
         await http_client.aclose()
 
+# Proxy-local stats; registered before the catch-all so they are not proxied
+@app.get(f"{PROXY_ADMIN_PREFIX}/cache")
+async def cache_stats():
+    if response_cache is None:
+        return {"ok": True, "data": {"enabled": False}}
+    return {"ok": True, "data": {"enabled": True, **response_cache.stats()}}
+
+def admin_allowed(request: Request) -> bool:
+    """Loopback peer or the admin token; forwarded addresses are never trusted here"""
+    token = request.headers.get('x-admin-token')
+    if PROXY_ADMIN_TOKEN and token and hmac.compare_digest(token.encode(), PROXY_ADMIN_TOKEN.encode()):
+        return True
+    try:
+        return ipaddress.ip_address(request.client.host if request.client else '').is_loopback
+    except ValueError:
+        return False
+
+def admin_forbidden() -> JSONResponse:
+    return JSONResponse(status_code=403, content={"ok": False, "error": "Admin endpoints need loopback access or X-Admin-Token"})
+
+@app.delete(f"{PROXY_ADMIN_PREFIX}/cache")
+async def cache_clear(request: Request):
+    if not admin_allowed(request):
+        return admin_forbidden()
+    if response_cache is not None:
+        response_cache.clear()
+    return {"ok": True}
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/coalesce")
+async def coalesce_stats():
+    if single_flight is None:
+        return {"ok": True, "data": {"enabled": False}}
+    return {"ok": True, "data": {"enabled": True, **single_flight.stats()}}
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/deltas")
+async def delta_stats():
+    if delta_history is None:
+        return {"ok": True, "data": {"enabled": False}}
+    return {"ok": True, "data": {"enabled": True, "routes": PROXY_DELTA_ROUTES, **delta_history.stats()}}
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/ws")
+async def ws_stats():
+    if ws_hub is None:
+        return {"ok": True, "data": {
+            "shared": False,
+            "clients": len(ws_direct_clients),
+            "connections": [client.stats() for client in ws_direct_clients.values()],
+        }}
+    return {"ok": True, "data": {"shared": True, **ws_hub.stats()}}
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/compression")
+async def compression_stats():
+    if compressor is None:
+        return {"ok": True, "data": {"enabled": False}}
+    return {"ok": True, "data": {
+        "enabled": True,
+        "encodings": PROXY_COMPRESSION_ENCODINGS,
+        "levels": PROXY_COMPRESSION_LEVELS,
+        "min_bytes": PROXY_COMPRESSION_MIN_BYTES,
+        "by_encoding": compressor.stats.as_dict(),
+    }}
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/bulkheads")
+async def bulkhead_stats():
+    return {"ok": True, "data": bulkheads.stats()}
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/ratelimit")
+async def ratelimit_stats():
+    if rate_limiter is None:
+        return {"ok": True, "data": {"enabled": False}}
+    return {"ok": True, "data": {"enabled": True, **rate_limiter.stats()}}
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/workers")
+async def worker_stats():
+    return {"ok": True, "data": {
+        **pool.as_dict(),
+        "supervisor": supervisor.stats() if supervisor is not None else None,
+    }}
+
+@app.post(f"{PROXY_ADMIN_PREFIX}/workers/restart")
+async def workers_restart(request: Request, wait: bool = False):
+    """Rolling restart of every worker; ?wait=true answers once it has finished"""
+    if not admin_allowed(request):
+        return admin_forbidden()
+    task = supervisor.schedule_rolling_restart() if supervisor is not None else None
+    if task is None:
+        return JSONResponse(status_code=409, content={"ok": False, "error": "Rolling restart already in progress"})
+    if wait:
+        return {"ok": True, "data": await asyncio.shield(task)}
+    return JSONResponse(status_code=202, content={"ok": True, "data": {"started": True}})
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/jobs")
+async def job_list():
+    if job_queue is None:
+        return {"ok": True, "data": {"enabled": False}}
+    return {"ok": True, "data": {
+        "enabled": True,
+        **job_queue.stats(),
+        "jobs": [job_queue.refresh(job).as_dict() for job in reversed(job_queue.jobs.values())],
+    }}
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/jobs/{{job_id}}")
+async def job_status(job_id: str, wait: float = 0):
+    """One job with its result once finished; ?wait=N long-polls up to N seconds"""
+    job = job_queue.get(job_id) if job_queue is not None else None
+    if job is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "Job not found"})
+    await job.wait(min(wait, PROXY_JOB_MAX_WAIT))
+    return {"ok": True, "data": job_queue.refresh(job).as_dict(include_result=True)}
+
+@app.post(f"{PROXY_ADMIN_PREFIX}/batch")
+async def batch(request: Request):
+    """Run many GETs in one round trip; sub-responses come back in request order"""
+    try:
+        subs = parse_batch(await request.json(), PROXY_BATCH_MAX, PROXY_ADMIN_PREFIX, PROXY_EXPORT_ROUTES)
+    except ValueError as err:
+        # BatchError, or a body that is not JSON at all
+        message = str(err) if isinstance(err, BatchError) else "Body must be JSON"
+        return JSONResponse(status_code=400, content={"ok": False, "error": message})
+    
+    responses = await asyncio.gather(*[run_sub_request(request, sub) for sub in subs])
+    body = json.dumps({"ok": True, "data": {"responses": responses}}, separators=(',', ':')).encode()
+    headers = {'content-type': 'application/json'}
+    encoding = response_encoding(request, headers, len(body))
+    if encoding:
+        body = compressor.compress(body, encoding)
+    mark_encoded(headers, encoding)
+    return Response(content=body, headers=headers)
+
+async def run_sub_request(request: Request, sub) -> dict:
+    """One batch entry through proxy(), as if the caller had sent it alone"""
+    sub_request = Request(sub_request_scope(request.scope, sub), receive=empty_body)
+    try:
+        response = await proxy(sub_request, sub.path.lstrip('/'))
+        if isinstance(response, StreamingResponse):
+            # Draining the iterator also releases the worker and bulkhead slot
+            body = b''.join([chunk async for chunk in response.body_iterator])
+        else:
+            body = response.body
+    except Exception as err:
+        print(f"[Proxy] Batch sub-request {sub.path} failed: {err!r}")
+        return {"id": sub.id, "status": 500, "body": {"error": "Sub-request failed"}}
+    result = {"id": sub.id, "status": response.status_code, "body": decode_body(response.headers.get('content-type'), body)}
+    if 'x-cache' in response.headers:
+        result["cache"] = response.headers['x-cache']
+    return result
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/resilience")
+async def resilience_stats():
+    return {"ok": True, "data": {
+        "hedging": PROXY_HEDGE,
+        "hedge_min_delay_ms": PROXY_HEDGE_MIN_DELAY_MS,
+        "max_retries": PROXY_RETRY_MAX,
+        **hedge_stats.as_dict(),
+        "retry_budget": retry_budget.as_dict(),
+        "route_p95_ms": upstream_latency.as_dict(),
+        "breakers": {w.index: w.breaker.as_dict() for w in pool.workers if w.breaker is not None},
+    }}
+
+@app.get(f"{PROXY_ADMIN_PREFIX}/metrics")
+async def metrics_endpoint():
+    if metrics is None:
+        return Response(status_code=404)
+    return Response(content=metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+def response_encoding(request: Request, headers: dict, size: int = None):
+    """Content-Encoding to apply to this response, or None to send it as-is"""
+    if compressor is None or 'content-encoding' in headers:
+        return None
+    if not is_compressible(headers.get('content-type')):
+        return None
+    if size is not None and size < PROXY_COMPRESSION_MIN_BYTES:
+        return None
+    return negotiate(request.headers.get('accept-encoding', ''), PROXY_COMPRESSION_ENCODINGS)
+
+def mark_encoded(headers: dict, encoding):
+    """Set Content-Encoding and Vary on a compressible response"""
+    if compressor is None or not is_compressible(headers.get('content-type')):
+        return
+    vary = headers.get('vary')
+    if not vary:
+        headers['vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        headers['vary'] = f"{vary}, Accept-Encoding"
+    if encoding:
+        headers['content-encoding'] = encoding
+        headers.pop('content-length', None)
+
+def encoded_variant(key: str, entry: CachedResponse, encoding: str) -> bytes:
+    """Compressed body of a cached entry; compressed once, then reused"""
+    variant = entry.variants.get(encoding)
+    if variant is None:
+        variant = compressor.compress(entry.body, encoding)
+        if response_cache is not None:
+            response_cache.store_variant(key, entry, encoding, variant)
+        else:
+            entry.variants[encoding] = variant
+    return variant
+
+def client_has_current(request: Request, headers: dict, etag: str, encoding) -> bool:
+    """Set the ETag of the body as it will be sent; True if If-None-Match already names it"""
+    if not PROXY_ETAGS or request.method != 'GET':
+        return False
+    headers['etag'] = variant_etag(etag, encoding)
+    return etag_matches(request.headers.get('if-none-match'), etag)
+
+def not_modified(headers: dict, encoding) -> Response:
+    mark_encoded(headers, encoding)
+    return Response(status_code=304, headers=not_modified_headers(headers))
+
+def projection_for(path: str, query: str):
+    """(field tree or None, upstream target) for a request; raises ProjectionError"""
+    params = parse_qsl(query, keep_blank_values=True)
+    fields = [value for name, value in params if name == 'fields']
+    if not fields or path not in PROXY_PROJECTION_ROUTES:
+        return None, f"{path}?{query}" if query else path
+    tree = parse_fields(','.join(fields), PROXY_PROJECTION_MAX_FIELDS)
+    upstream_query = urlencode([(name, value) for name, value in params if name != 'fields'])
+    return tree, f"{path}?{upstream_query}" if upstream_query else path
+
+def projected(resp: httpx.Response, tree) -> httpx.Response:
+    """resp with its list items trimmed to tree; non-JSON and failed responses pass through"""
+    if tree is None or resp.status_code != 200 or 'json' not in resp.headers.get('content-type', ''):
+        return resp
+    try:
+        body = project_body(resp.content, tree)
+    except ValueError:
+        return resp
+    # The upstream ETag and length describe the full body
+    headers = [(k, v) for k, v in resp.headers.items() if k.lower() not in ('etag', 'content-length', 'content-encoding')]
+    return httpx.Response(resp.status_code, headers=headers, content=body)
+
+def delta_route(request: Request) -> bool:
+    return delta_history is not None and request.method == 'GET' and request.url.path in PROXY_DELTA_ROUTES
+
+def delta_response(request: Request, headers: dict, body: bytes, etag: str):
+    """226 patch from the version the client holds to this body, or None to send the body itself"""
+    key = cache_key(request.url.path, request.url.query)
+    wanted = wants_delta(request.headers.get('a-im'))
+    # Versions are kept only for queries polled with deltas, and never for failures
+    if (wanted or delta_history.tracks(key)) and cacheable(200, body):
+        delta_history.record(key, etag, body)
+    if not wanted:
+        return None
+    found = delta_history.patch(key, request.headers.get('if-none-match'), etag)
+    if found is None or len(found[1]) >= len(body):
+        return None
+    base, patch = found
+    headers = {k: v for k, v in headers.items() if k.lower() not in ('content-type', 'content-length', 'etag')}
+    headers.update({'content-type': 'application/json', 'etag': etag, 'im': DELTA_IM, 'delta-base': base})
+    vary = headers.get('vary')
+    headers['vary'] = f"{vary}, A-IM" if vary else 'A-IM'
+    encoding = response_encoding(request, headers, len(patch))
+    if encoding:
+        patch = compressor.compress(patch, encoding)
+    mark_encoded(headers, encoding)
+    return Response(content=patch, status_code=226, headers=headers)
+
+def cached_response(request: Request, key: str, entry: CachedResponse, state: str = 'HIT') -> Response:
+    headers = dict(entry.headers)
+    headers['x-cache'] = state
+    headers['age'] = str(int(entry.age()))
+    body = entry.body
+    encoding = response_encoding(request, headers, len(body))
+    if entry.status_code == 200 and client_has_current(request, headers, entry.etag, encoding):
+        # Unchanged since the client's copy: no body, and no upstream call either
+        return not_modified(headers, encoding)
+    if entry.status_code == 200 and delta_route(request):
+        delta = delta_response(request, headers, body, entry.etag)
+        if delta is not None:
+            return delta
+    if encoding:
+        body = encoded_variant(key, entry, encoding)
+    mark_encoded(headers, encoding)
+    return Response(content=body, status_code=entry.status_code, headers=headers)
+
+def revalidate(key: str, ttl, parent: dict = None):
+    """Refresh a cache entry in the background; one refresh per key at a time"""
+    if key in revalidations:
+        return
+    generation = response_cache.generation
+    path, _, query = key.partition('?')
+    try:
+        projection, target = projection_for(path, query)
+    except ProjectionError:
+        return
+    refresh_request = Request(sub_request_scope(parent or {'headers': []}, SubRequest(key, path, query)), empty_body)
+    if metrics is not None:
+        refresh_request.state.route = metrics.route_for(path)
+    
+    async def refresh():
+        try:
+            if not await backend_ready.wait(PROXY_READY_WAIT):
+                return
+            if single_flight is not None and single_flight.enabled_for(path):
+                flight_key = key if projection is None else cache_key(*target.partition('?')[::2])
+                resp = await single_flight.do(flight_key, lambda: forward_buffered(refresh_request, target))
+            else:
+                resp = await forward_buffered(refresh_request, target)
+            resp = projected(resp, projection)
+            if ttl is not None and cacheable(resp.status_code, resp.content):
+                entry = CachedResponse(resp.status_code, list(buffered_headers(resp).items()), resp.content, ttl)
+                response_cache.put(key, entry, generation)
+        except UpstreamError:
+            pass
+        except Exception as err:
+            print(f"[Proxy] Refreshing {key} failed: {err!r}")
+        finally:
+            revalidations.pop(key, None)
+    
+    revalidations[key] = asyncio.get_running_loop().create_task(refresh())
+
+def snapshot_entries() -> list:
+    return [
+        SnapshotEntry(key, entry.status_code, entry.headers, entry.body, entry.age())
+        for key, entry in response_cache.items(PROXY_SNAPSHOT_ROUTES)
+    ]
+
+def restore_snapshot() -> list:
+    """Load the snapshot into the cache as stale entries; returns their keys"""
+    keys = []
+    for saved in read_snapshot(PROXY_SNAPSHOT_PATH, PROXY_SNAPSHOT_MAX_AGE):
+        path = saved.key.split('?', 1)[0]
+        if response_cache.ttl_for(path) is None or not longest_prefix(path, PROXY_SNAPSHOT_ROUTES):
+            continue
+        # Expired from the start, with its real age for the Age header
+        entry = CachedResponse(saved.status_code, saved.headers, saved.body, 0)
+        entry.stored_at -= saved.age
+        if response_cache.put(saved.key, entry):
+            keys.append(saved.key)
+    return keys
+
+async def snapshot_loop():
+    while True:
+        await asyncio.sleep(PROXY_SNAPSHOT_INTERVAL)
+        try:
+            # Collected on the loop, written off it
+            await asyncio.to_thread(write_snapshot, PROXY_SNAPSHOT_PATH, snapshot_entries())
+        except OSError as err:
+            print(f"[Proxy] Writing cache snapshot failed: {err!r}")
+
+async def warm_up(keys: list):
+    """Fetch keys into the cache as soon as the first worker is ready"""
+    if not await backend_ready.wait(TS_READY_DEADLINE):
+        return
+    for key in keys:
+        revalidate(key, response_cache.ttl_for(key.split('?', 1)[0]))
+
+def stale_or(request: Request, cache_slot, response: Response) -> Response:
+    """A stale copy of a cached route in place of an upstream failure, while stale-if-error allows it"""
+    if cache_slot is None or response.status_code < 500:
+        return response
+    entry = response_cache.get_stale(cache_slot[0], on_error=True)
+    if entry is None:
+        return response
+    return cached_response(request, cache_slot[0], entry, 'STALE')
+
+def cacheable(status_code: int, body: bytes) -> bool:
+    # TS handlers report failures as 200 {"ok": false, ...}; never cache those
+    return status_code == 200 and not body.startswith(b'{"ok":false')
+
+def upstream_headers(resp) -> dict:
+    return {k: v for k, v in resp.headers.items() if k.lower() not in HOP_BY_HOP}
+
 # Proxy all API requests to TypeScript
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
 async def proxy(request: Request, path: str):
-    url = f"{TS_URL}/{path}"
+    if metrics is None:
+        return await route_request(request, path)
+    
+    route = metrics.route_for(request.url.path)
+    request.state.route = route
+    bytes_in = int(request.headers.get('content-length') or 0)
+    started = time.perf_counter()
+    metrics.request_started(route)
+    try:
+        response = await route_request(request, path)
+    except BaseException:
+        metrics.request_finished(route, request.method, 500, time.perf_counter() - started, bytes_in)
+        raise
+    
+    if isinstance(response, StreamingResponse):
+        # Streamed responses are finished when their last chunk has been sent
+        response.body_iterator = measured_stream(response.body_iterator, request, response.status_code, started, bytes_in)
+    else:
+        metrics.request_finished(route, request.method, response.status_code, time.perf_counter() - started, bytes_in, len(response.body))
+    return response
+
+async def measured_stream(chunks, request: Request, status_code: int, started: float, bytes_in: int):
+    bytes_out = 0
+    try:
+        async for chunk in chunks:
+            bytes_out += len(chunk)
+            yield chunk
+    finally:
+        metrics.request_finished(request.state.route, request.method, status_code, time.perf_counter() - started, bytes_in, bytes_out)
+
+def upstream_timed(route: str, started: float):
+    if metrics is not None:
+        metrics.upstream_observed(route, time.perf_counter() - started)
+
+def upstream_failed(route: str):
+    if metrics is not None:
+        metrics.upstream_failed(route)
+
+def peer_identity(request: Request) -> str:
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def client_identity(request: Request) -> str:
+    """Rate-limit key: the API key if one was sent, else the client IP"""
+    api_key = request.headers.get(PROXY_RATE_KEY_HEADER)
+    if api_key:
+        return f"key:{api_key}"
+    if PROXY_TRUST_FORWARDED and PROXY_FORWARDED_HOPS > 0:
+        # Each proxy appends the address it saw, so only the right-most
+        # PROXY_FORWARDED_HOPS entries were written by infrastructure we trust
+        hops = [hop.strip() for hop in ','.join(request.headers.getlist('x-forwarded-for')).split(',') if hop.strip()]
+        if len(hops) >= PROXY_FORWARDED_HOPS:
+            return f"ip:{hops[-PROXY_FORWARDED_HOPS]}"
+    return peer_identity(request)
+
+def too_many_requests(retry_after: float) -> JSONResponse:
+    seconds = max(1, math.ceil(retry_after))
+    return JSONResponse(
+        status_code=429,
+        content={"ok": False, "error": "Too many requests", "retryAfter": seconds},
+        headers={"retry-after": str(seconds)},
+    )
+
+async def route_request(request: Request, path: str):
+    target = f"/{path}"
     if request.url.query:
-        url += f"?{request.url.query}"
+        target += f"?{request.url.query}"
+    
+    # Admission control before anything else, cache hits included
+    if rate_limiter is not None:
+        retry_after = await rate_limiter.acquire(client_identity(request), request.url.path, peer=peer_identity(request))
+        if retry_after is not None:
+            return too_many_requests(retry_after)
+    
+    # Long compute calls become background jobs (accepted even while the backend starts)
+    if job_queue is not None and job_queue.handles(request.method, request.url.path):
+        return await submit_job(request)
+    
+    # fields= trims list items in the proxy; TypeScript gets the query without it
+    projection = None
+    if request.method == 'GET' and request.url.path in PROXY_PROJECTION_ROUTES:
+        try:
+            projection, target = projection_for(request.url.path, request.url.query)
+        except ProjectionError as err:
+            return JSONResponse(status_code=400, content={"ok": False, "error": str(err)})
+    
+    # Cache lookup for hot read endpoints (answered even while the backend starts)
+    cache_slot = None
+    if response_cache is not None and request.method == 'GET':
+        ttl = response_cache.ttl_for(request.url.path)
+        if ttl is None and projection is not None and PROXY_PROJECTION_TTL > 0:
+            ttl = PROXY_PROJECTION_TTL
+        if ttl is not None:
+            key = cache_key(request.url.path, request.url.query)
+            if 'no-cache' not in request.headers.get('cache-control', ''):
+                entry = response_cache.get(key)
+                if entry is not None:
+                    return cached_response(request, key, entry)
+                entry = response_cache.get_stale(key)
+                if entry is not None:
+                    revalidate(key, ttl, request.scope)
+                    return cached_response(request, key, entry, 'STALE')
+            cache_slot = (key, ttl, response_cache.generation)
+    
+    # Requests that arrive during startup queue briefly instead of failing,
+    # unless a stale copy (e.g. restored from the snapshot) can answer now
+    if not backend_ready.is_open and cache_slot is not None:
+        entry = response_cache.get_stale(cache_slot[0], on_error=True)
+        if entry is not None:
+            return cached_response(request, cache_slot[0], entry, 'STALE')
+    if not await backend_ready.wait(PROXY_READY_WAIT):
+        return stale_or(request, cache_slot, backend_unavailable())
+    retry_budget.deposit()
+    
+    # Identical in-flight GETs on opted-in routes share one upstream call
+    if single_flight is not None and request.method == 'GET' and single_flight.enabled_for(request.url.path):
+        # Keyed on what goes upstream, so projections share the full fetch
+        key = cache_slot[0] if cache_slot and projection is None else cache_key(*target.partition('?')[::2])
+        try:
+            resp, shaped = await single_flight.do(key, lambda: forward_coalesced(request, target))
+        except UpstreamError as err:
+            return stale_or(request, cache_slot, err.response())
+        # The first caller of each request shape builds its entry; the rest reuse it and its variants
+        shape = cache_key(request.url.path, request.url.query)
+        if shape not in shaped:
+            shaped_resp = projected(resp, projection)
+            shaped[shape] = (shaped_resp, response_entry(shaped_resp, cache_slot))
+        shaped_resp, entry = shaped[shape]
+        return stale_or(request, cache_slot, buffered_response(request, shaped_resp, cache_slot, entry))
+    
+    try:
+        streamable = PROXY_STREAMING and not delta_route(request) and projection is None
+        if streamable or longest_prefix(request.url.path, PROXY_EXPORT_ROUTES):
+            return await proxy_streaming(request, target, cache_slot)
+        resp = await forward_buffered(request, target)
+    except UpstreamError as err:
+        return stale_or(request, cache_slot, err.response())
+    return stale_or(request, cache_slot, buffered_response(request, projected(resp, projection), cache_slot))
+
+class UpstreamError(Exception):
+    """A request the workers could not answer; subclasses override its error response"""
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(status_code=502, content={"error": "Bad gateway"})
+
+class BackendUnavailable(UpstreamError):
+    """No worker is ready, or the picked worker refused the connection"""
+
+    def response(self) -> JSONResponse:
+        return backend_unavailable()
+
+class RouteClassFull(UpstreamError):
+    """The route's bulkhead stayed at its concurrency cap for the whole queue wait"""
+
+    def __init__(self, route_class: RouteClass):
+        super().__init__(route_class.name)
+        self.route_class = route_class
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=503,
+            content={"error": f"Too many concurrent {self.route_class.name} requests"},
+            headers={"retry-after": "1"},
+        )
+
+class CircuitOpen(UpstreamError):
+    """Every running worker's breaker is open; fail now instead of queueing"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Backend unavailable"},
+            headers={"retry-after": str(max(1, math.ceil(self.retry_after)))},
+        )
+
+class UpstreamTimeout(UpstreamError):
+    """The worker did not answer within the route class timeout"""
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(status_code=504, content={"error": "Backend timed out"})
+
+def backend_unavailable() -> JSONResponse:
+    return JSONResponse(status_code=503, content={"error": "Backend starting..."})
+
+def route_class_limits(route_class: RouteClass) -> httpx.Limits:
+    """A class's per-worker pool: its concurrency cap, within the PROXY_POOL_* bounds"""
+    connections = min(route_class.max_concurrency, PROXY_POOL_MAX_CONNECTIONS)
+    return upstream_limits(connections, min(connections, PROXY_POOL_MAX_KEEPALIVE), PROXY_POOL_KEEPALIVE_EXPIRY)
+
+def upstream_client(route_class: RouteClass) -> httpx.AsyncClient:
+    return route_class.client or http_client
+
+async def enter_bulkhead(request: Request) -> RouteClass:
+    route_class = bulkheads.classify(request.url.path)
+    if not await route_class.acquire():
+        raise RouteClassFull(route_class)
+    return route_class
+
+def no_worker_error() -> UpstreamError:
+    tripped = [
+        w.breaker for w in pool.workers
+        if w.ready and w.alive() and w.breaker is not None and not w.breaker.accepting()
+    ]
+    return CircuitOpen(min(b.retry_after() for b in tripped)) if tripped else BackendUnavailable()
+
+def hedge_delay(route: str, replayable: bool):
+    """Seconds before a second attempt goes to another worker, or None for no hedge"""
+    if not (PROXY_HEDGE and replayable and len(pool) > 1):
+        return None
+    p95 = upstream_latency.p95(route)
+    if p95 is None:
+        return None
+    return max(p95, PROXY_HEDGE_MIN_DELAY_MS / 1000)
+
+def request_route(request: Request, route_class: RouteClass) -> str:
+    """Metrics route template of a request, or its route class name with metrics off"""
+    return getattr(request.state, 'route', route_class.name)
+
+async def send_upstream(route: str, route_class: RouteClass, build, stream: bool, replayable: bool):
+    """
+    Send build(worker) to the least-loaded worker and return (response, worker).
+
+    Replayable requests (idempotent, no streamed body) may be hedged and
+    retried on other workers; the first response wins. The returned worker
+    stays acquired until the caller releases it.
+    """
+    client = upstream_client(route_class)
+    
+    async def attempt(worker):
+        breaker = worker.breaker
+        if breaker is not None:
+            breaker.on_attempt()
+        pool.acquire(worker)
+        started = time.perf_counter()
+        try:
+            resp = await client.send(build(worker), stream=stream)
+        except BaseException as err:
+            pool.release(worker)
+            if breaker is not None:
+                if isinstance(err, (httpx.ConnectError, httpx.TimeoutException)):
+                    breaker.on_failure()
+                else:
+                    breaker.on_abandon()
+            raise
+        if breaker is not None:
+            if resp.status_code in OVERLOAD_STATUSES:
+                breaker.on_failure()
+            else:
+                breaker.on_success()
+        upstream_latency.record(route, time.perf_counter() - started)
+        upstream_timed(route, started)
+        return resp, worker
+    
+    async def discard(result):
+        resp, worker = result
+        await resp.aclose()
+        pool.release(worker)
+    
+    try:
+        result = await hedged_call(
+            pool.pick,
+            attempt,
+            discard,
+            hedge_delay=hedge_delay(route, replayable),
+            budget=retry_budget,
+            max_retries=PROXY_RETRY_MAX if replayable else 0,
+            retryable=(httpx.ConnectError,),
+            stats=hedge_stats,
+        )
+    except httpx.ConnectError:
+        upstream_failed(route)
+        raise BackendUnavailable()
+    except httpx.TimeoutException:
+        route_class.timeouts += 1
+        upstream_failed(route)
+        raise UpstreamTimeout()
+    if result is None:
+        raise no_worker_error()
+    return result
+
+async def forward_buffered(request: Request, target: str) -> httpx.Response:
+    """Send the request to the least-loaded worker and read the full response"""
+    if pool.pick() is None:
+        raise no_worker_error()
     
     body = await request.body()
     headers = {k: v for k, v in request.headers.items() if k.lower() not in ('host', 'content-length')}
+    if compressor is not None:
+        # The proxy owns compression; keep upstream bodies in identity encoding
+        headers.pop('accept-encoding', None)
     
-    try:
-        resp = await http_client.request(
+    route_class = await enter_bulkhead(request)
+    client = upstream_client(route_class)
+    
+    def build(worker):
+        return client.build_request(
             method=request.method,
-            url=url,
+            url=f"{worker.url}{target}",
             content=body or None,
             headers=headers,
+            timeout=route_class.timeout,
         )
-        return Response(
-            content=resp.content,
-            status_code=resp.status_code,
-            headers={k: v for k, v in resp.headers.items() if k.lower() not in ('transfer-encoding', 'connection')},
+    
+    try:
+        resp, worker = await send_upstream(
+            request_route(request, route_class), route_class, build,
+            stream=False, replayable=request.method in IDEMPOTENT_METHODS,
         )
-    except httpx.ConnectError:
-        return JSONResponse(status_code=503, content={"error": "Backend starting..."})
+    finally:
+        route_class.release()
+    pool.release(worker)
+    return resp
+
+def prefer_wait(request: Request) -> float:
+    """Seconds from an RFC 7240 "Prefer: wait=N" header, or 0"""
+    for preference in request.headers.get('prefer', '').split(','):
+        name, _, value = preference.strip().partition('=')
+        if name.strip().lower() == 'wait':
+            try:
+                return min(max(float(value.strip().strip('"')), 0), PROXY_JOB_MAX_WAIT)
+            except ValueError:
+                return 0
+    return 0
+
+async def submit_job(request: Request) -> Response:
+    """Queue a compute call as a background job and answer 202, or its result if it finishes in time"""
+    body = await request.body()
+    headers = {
+        k: v for k, v in request.headers.items()
+        if k.lower() not in HOP_BY_HOP and k.lower() not in ('host', 'content-length', 'accept-encoding', 'prefer')
+    }
+    job, deduplicated = job_queue.submit(request.method, request.url.path, request.url.query, body, headers)
+    location = f"{PROXY_ADMIN_PREFIX}/jobs/{job.id}"
+    
+    if await job.wait(prefer_wait(request)) and job.status_code is not None:
+        response_headers = {'x-job-id': job.id, 'content-location': location}
+        if job.content_type:
+            response_headers['content-type'] = job.content_type
+        return Response(content=job.result, status_code=job.status_code, headers=response_headers)
+    
+    return JSONResponse(
+        status_code=202,
+        content={"ok": True, "data": {**job_queue.refresh(job).as_dict(), "deduplicated": deduplicated}},
+        headers={'location': location, 'x-job-id': job.id, 'retry-after': '1'},
+    )
+
+async def run_job(job) -> tuple:
+    """Make a job's upstream call; returns (status_code, content_type, body)"""
+    if not await backend_ready.wait(TS_READY_DEADLINE):
+        error = backend_unavailable()
+        return error.status_code, 'application/json', error.body
+    
+    route_class = bulkheads.classify(job.path)
+    route = metrics.route_for(job.path) if metrics is not None else route_class.name
+    target = f"{job.path}?{job.query}" if job.query else job.path
+    try:
+        if not await route_class.acquire():
+            raise RouteClassFull(route_class)
+        client = upstream_client(route_class)
+        
+        def build(worker):
+            return client.build_request(
+                method=job.method,
+                url=f"{worker.url}{target}",
+                content=job.body or None,
+                headers=job.headers,
+                timeout=route_class.timeout,
+            )
+        
+        try:
+            resp, worker = await send_upstream(route, route_class, build, stream=False, replayable=False)
+        finally:
+            route_class.release()
+    except UpstreamError as err:
+        error = err.response()
+        return error.status_code, 'application/json', error.body
+    pool.release(worker)
+    
+    if response_cache is not None and resp.is_success:
+        response_cache.on_mutation(job.path)
+    return resp.status_code, resp.headers.get('content-type'), resp.content
+
+def buffered_headers(resp: httpx.Response) -> dict:
+    return {k: v for k, v in resp.headers.items() if k.lower() not in ('transfer-encoding', 'connection', 'content-encoding', 'content-length')}
+
+async def forward_coalesced(request: Request, target: str) -> tuple:
+    """
+    forward_buffered for a single flight: the response plus a dict, shared by
+    every caller, of (response, entry) per request shape built from it
+    """
+    return await forward_buffered(request, target), {}
+
+def response_entry(resp: httpx.Response, cache_slot=None) -> CachedResponse:
+    """
+    Entry for a buffered response, stored when the slot allows it. Unstored
+    entries still carry the ETag and compressed variants for coalesced callers.
+    """
+    stored = bool(cache_slot) and cacheable(resp.status_code, resp.content)
+    entry = CachedResponse(resp.status_code, list(buffered_headers(resp).items()), resp.content, cache_slot[1] if stored else 0)
+    if stored:
+        response_cache.put(cache_slot[0], entry, cache_slot[2])
+    return entry
+
+def buffered_response(request: Request, resp: httpx.Response, cache_slot=None, entry=None) -> Response:
+    """
+    Build the client response from a fully read upstream response; entry is
+    the one response_entry already built for it when the call was coalesced
+    """
+    response_headers = buffered_headers(resp)
+    body = resp.content
+    if entry is None and cache_slot and cacheable(resp.status_code, body):
+        entry = response_entry(resp, cache_slot)
+    elif response_cache is not None and request.method != 'GET' and resp.is_success:
+        response_cache.on_mutation(request.url.path)
+    if cache_slot:
+        response_headers['x-cache'] = 'MISS'
+    
+    encoding = response_encoding(request, response_headers, len(body))
+    if resp.status_code == 200:
+        etag = entry.etag if entry else response_headers.get('etag') or make_etag(body)
+        if client_has_current(request, response_headers, etag, encoding):
+            return not_modified(response_headers, encoding)
+        if delta_route(request):
+            delta = delta_response(request, response_headers, body, etag)
+            if delta is not None:
+                return delta
+    if encoding:
+        # Coalesced callers share the entry, so its variant is compressed only once
+        body = encoded_variant(cache_slot[0] if cache_slot else None, entry, encoding) if entry else compressor.compress(body, encoding)
+    mark_encoded(response_headers, encoding)
+    return Response(content=body, status_code=resp.status_code, headers=response_headers)
+
+async def proxy_streaming(request: Request, target: str, cache_slot=None):
+    """Forward request and response bodies without holding either in memory."""
+    if pool.pick() is None:
+        raise no_worker_error()
+    
+    headers = {k: v for k, v in request.headers.items() if k.lower() != 'host' and k.lower() not in HOP_BY_HOP}
+    if compressor is not None:
+        # The proxy owns compression; keep upstream bodies in identity encoding
+        headers.pop('accept-encoding', None)
+    
+    # Only attach a body stream when the client actually sent one, otherwise
+    # httpx would switch bodyless GETs to chunked transfer encoding.
+    has_body = 'content-length' in request.headers or 'transfer-encoding' in request.headers
+    route_class = await enter_bulkhead(request)
+    client = upstream_client(route_class)
+    
+    def build(worker):
+        return client.build_request(
+            method=request.method,
+            url=f"{worker.url}{target}",
+            content=request.stream() if has_body else None,
+            headers=headers,
+            timeout=route_class.timeout,
+        )
+    
+    # The worker and the bulkhead slot stay taken until the body has been fully relayed
+    try:
+        resp, worker = await send_upstream(
+            request_route(request, route_class), route_class, build, stream=True,
+            replayable=request.method in IDEMPOTENT_METHODS and not has_body,
+        )
+    except BaseException:
+        route_class.release()
+        raise
+    
+    if response_cache is not None and request.method != 'GET' and resp.is_success:
+        # Fastify only sends headers once the handler has finished
+        response_cache.on_mutation(request.url.path)
+    
+    response_headers = upstream_headers(resp)
+    body = resp.aiter_raw()
+    if cache_slot and resp.status_code == 200:
+        response_headers['x-cache'] = 'MISS'
+        body = tee_into_cache(body, resp, dict(response_headers), cache_slot)
+    
+    length = response_headers.get('content-length')
+    encoding = response_encoding(request, response_headers, int(length) if length else None)
+    if encoding:
+        # The cache tee above still sees the identity body
+        body = compressor.compress_stream(body, encoding)
+    mark_encoded(response_headers, encoding)
+    
+    released = False
+    
+    async def finish():
+        nonlocal released
+        if released:
+            return
+        released = True
+        await resp.aclose()
+        pool.release(worker)
+        route_class.release()
+    
+    # The background task is skipped if the body raises midway, so the
+    # body also releases on exit; whichever runs first wins
+    body = release_after(body, finish)
+    
+    # aiter_raw() keeps the upstream content-encoding, so unless the proxy
+    # compressed the body itself, its headers stay valid as-is
+    return StreamingResponse(
+        body,
+        status_code=resp.status_code,
+        headers=response_headers,
+        background=BackgroundTask(finish),
+    )
+
+async def release_after(chunks, finish):
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await finish()
+
+async def tee_into_cache(chunks, resp, headers: dict, cache_slot):
+    """Relay chunks to the client and store the complete body if it stays small enough"""
+    key, ttl, generation = cache_slot
+    buffered = []
+    size = 0
+    async for chunk in chunks:
+        yield chunk
+        if buffered is not None:
+            size += len(chunk)
+            if size > response_cache.max_entry_bytes:
+                buffered = None
+            else:
+                buffered.append(chunk)
+    if buffered is not None:
+        body = b''.join(buffered)
+        if cacheable(resp.status_code, body):
+            stored = {k: v for k, v in headers.items() if k != 'x-cache'}
+            response_cache.put(key, CachedResponse(resp.status_code, list(stored.items()), body, ttl), generation)
 
 # WebSocket proxy
 @app.websocket("/ws")
 async def ws_proxy(websocket: WebSocket):
     await websocket.accept()
+    if not await backend_ready.wait(PROXY_READY_WAIT):
+        await websocket.close(code=1013)
+        return
+    
+    if ws_hub is not None:
+        await ws_shared_session(websocket)
+        return
+    
+    # Only the primary emits SystemEvents; sessions stay on it for their lifetime
+    worker = pool.pick_for_websocket()
+    if worker is None:
+        await websocket.close(code=1013)
+        return
+    
+    client = LocalClient(websocket, PROXY_WS_QUEUE, PROXY_WS_OVERFLOW)
+    ws_direct_clients[client.id] = client
+    if metrics is not None:
+        metrics.ws_opened()
+    client.start()
+    worker.ws_sessions += 1
     try:
-        async with websockets.connect(f"ws://127.0.0.1:{TS_PORT}/ws") as ts_ws:
+        async with worker.ws_connect() as ts_ws:
             async def to_client():
                 async for msg in ts_ws:
-                    await websocket.send_text(msg)
+                    client.offer(msg, coalesce_key(msg) if client.policy == 'coalesce' else None)
             async def to_backend():
                 while True:
-                    data = await websocket.receive_text()
-                    await ts_ws.send(data)
-            await asyncio.gather(to_client(), to_backend(), return_exceptions=True)
-    except:
+                    message = await websocket.receive()
+                    if message['type'] == 'websocket.disconnect':
+                        return
+                    client.received += 1
+                    data = message.get('text')
+                    await ts_ws.send(data if data is not None else message.get('bytes'))
+            # Whichever side finishes first ends the session
+            done, pending = await asyncio.wait(
+                [asyncio.ensure_future(to_client()), asyncio.ensure_future(to_backend())],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in pending:
+                task.cancel()
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+    except (WebSocketDisconnect, websockets.ConnectionClosed):
         pass
+    except Exception as err:
+        print(f"[Proxy] WS bridge to worker {worker.index} failed: {err!r}")
     finally:
+        worker.ws_sessions -= 1
+        ws_direct_clients.pop(client.id, None)
+        await client.stop()
+        if metrics is not None:
+            metrics.ws_closed(client)
         try:
             await websocket.close()
-        except:
+        except RuntimeError:
+            # Already closed by the client or by the slow-consumer policy
             pass
+
+def coalesce_key(msg):
+    """type:identity of an upstream event, for the coalesce overflow policy"""
+    try:
+        return event_key(json.loads(msg))
+    except (ValueError, UnicodeDecodeError, AttributeError):
+        return None
+
+async def ws_shared_session(websocket: WebSocket):
+    """Serve one browser client from the shared upstream hub"""
+    client = LocalClient(websocket, PROXY_WS_QUEUE, PROXY_WS_OVERFLOW)
+    await ws_hub.register(client)
+    if metrics is not None:
+        metrics.ws_opened()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            data = message.get('text')
+            await ws_hub.handle_client_message(client, data if data is not None else message.get('bytes'))
+    finally:
+        await ws_hub.unregister(client)
+        if metrics is not None:
+            metrics.ws_closed(client)
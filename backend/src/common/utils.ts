@@ -1,3 +1,4 @@
+import { Readable } from 'stream';
 import type { Pagination, PaginatedResponse } from './types.js';
 
 /**
@@ -84,3 +85,26 @@ export function isValidAddress(address: string): boolean {
 export function normalizeAddress(address: string): string {
   return address.toLowerCase();
 }
+
+/**
+ * Serialize documents from an async source (e.g. a Mongoose query cursor)
+ * as newline-delimited JSON, one document per line.
+ * Lines are sent in batches of about `chunkBytes`, and only as fast as the
+ * client reads them; destroying the stream closes the source.
+ */
+export function toNdjson(source: AsyncIterable<unknown>, chunkBytes = 64 * 1024): Readable {
+  async function* lines() {
+    let batch = '';
+    for await (const doc of source) {
+      batch += JSON.stringify(doc) + '\n';
+      if (batch.length >= chunkBytes) {
+        yield batch;
+        batch = '';
+      }
+    }
+    if (batch) {
+      yield batch;
+    }
+  }
+  return Readable.from(lines(), { objectMode: false });
+}
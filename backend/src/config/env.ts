@@ -38,6 +38,16 @@ const EnvSchema = z.object({
   
   // Legacy Python compatibility
   LEGACY_PYTHON_ENABLED: z.coerce.boolean().default(false),
+
+  // Worker role behind the Python proxy (replicas skip seeding and background jobs)
+  WORKER_ROLE: z.enum(['primary', 'replica']).default('primary'),
+
+  // Primary started during a rolling restart: serve HTTP at once, but start
+  // seeding and background jobs only on SIGUSR2, once the old primary is gone
+  WORKER_DEFER_JOBS: z.coerce.boolean().default(false),
+
+  // Listen on a Unix domain socket instead of PORT (set by the Python proxy)
+  SOCKET_PATH: z.string().optional(),
 });
 
 export type Env = z.infer<typeof EnvSchema>;
@@ -62,6 +72,9 @@ export const env: Env = EnvSchema.parse({
   CONFIDENCE_FLOOR: process.env.CONFIDENCE_FLOOR,
   CONFIDENCE_SMOOTHING_FACTOR: process.env.CONFIDENCE_SMOOTHING_FACTOR,
   LEGACY_PYTHON_ENABLED: process.env.LEGACY_PYTHON_ENABLED,
+  WORKER_ROLE: process.env.WORKER_ROLE,
+  WORKER_DEFER_JOBS: process.env.WORKER_DEFER_JOBS,
+  SOCKET_PATH: process.env.SOCKET_PATH || undefined,
 });
 
 /**
@@ -15,7 +15,8 @@ interface RuntimeConfig {
   updatedAt: Date;
 }
 
-// Cache
+// Cache (per process: behind the Python proxy every worker has its own copy,
+// so an update made through one worker reaches the others only after the TTL)
 let configCache: RuntimeConfig | null = null;
 let cacheTimestamp = 0;
 const CACHE_TTL_MS = 5000; // 5 seconds
@@ -3,7 +3,7 @@
  * 
  * API endpoints for batch token analysis
  */
-import type { FastifyInstance, FastifyRequest } from 'fastify';
+import type { FastifyInstance, FastifyReply, FastifyRequest } from 'fastify';
 import {
   runTokenRunner,
   getTokenAnalysis,
@@ -11,6 +11,33 @@ import {
   getTopByEngineScore,
 } from './token_runner.service.js';
 import { TokenAnalysisModel } from './token_analysis.model.js';
+import { toNdjson } from '../../common/utils.js';
+
+interface AnalysesQuery {
+  status?: string;
+  label?: string;
+  limit?: string;
+  offset?: string;
+}
+
+const ANALYSIS_LIST_FIELDS = '-_id symbol contractAddress engineScore confidence risk engineLabel engineStrength analyzedAt status';
+
+/**
+ * Mongo filter for the analyses list query parameters
+ */
+function analysesFilter(query: AnalysesQuery): any {
+  const filter: any = {};
+  
+  if (query.status) {
+    filter.status = query.status;
+  }
+  
+  if (query.label) {
+    filter.engineLabel = query.label.toUpperCase();
+  }
+  
+  return filter;
+}
 
 export async function tokenRunnerRoutes(app: FastifyInstance): Promise<void> {
   
@@ -126,24 +153,10 @@ export async function tokenRunnerRoutes(app: FastifyInstance): Promise<void> {
    * Get all analyses with pagination
    */
   app.get('/token-runner/analyses', async (request: FastifyRequest) => {
-    const query = request.query as {
-      status?: string;
-      label?: string;
-      limit?: string;
-      offset?: string;
-    };
+    const query = request.query as AnalysesQuery;
     
     try {
-      const filter: any = {};
-      
-      if (query.status) {
-        filter.status = query.status;
-      }
-      
-      if (query.label) {
-        filter.engineLabel = query.label.toUpperCase();
-      }
-      
+      const filter = analysesFilter(query);
       const limit = Math.min(parseInt(query.limit || '50'), 100);
       const offset = parseInt(query.offset || '0');
       
@@ -152,7 +165,7 @@ export async function tokenRunnerRoutes(app: FastifyInstance): Promise<void> {
           .sort({ engineScore: -1 })
           .limit(limit)
           .skip(offset)
-          .select('-_id symbol contractAddress engineScore confidence risk engineLabel engineStrength analyzedAt status')
+          .select(ANALYSIS_LIST_FIELDS)
           .lean(),
         TokenAnalysisModel.countDocuments(filter),
       ]);
@@ -176,5 +189,20 @@ export async function tokenRunnerRoutes(app: FastifyInstance): Promise<void> {
     }
   });
   
+  /**
+   * GET /api/token-runner/analyses/export
+   * Every analysis matching the status/label filters as NDJSON, streamed
+   * from a database cursor in the same order as GET /analyses
+   */
+  app.get('/token-runner/analyses/export', async (request: FastifyRequest, reply: FastifyReply) => {
+    const cursor = TokenAnalysisModel.find(analysesFilter(request.query as AnalysesQuery))
+      .sort({ engineScore: -1 })
+      .select(ANALYSIS_LIST_FIELDS)
+      .lean()
+      .cursor({ batchSize: 500 });
+    
+    return reply.type('application/x-ndjson').send(toNdjson(cursor));
+  });
+  
   app.log.info('[Token Runner] Routes registered');
 }
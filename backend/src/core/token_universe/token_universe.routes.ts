@@ -3,13 +3,60 @@
  * 
  * API endpoints for token universe management
  */
-import type { FastifyInstance, FastifyRequest } from 'fastify';
+import type { FastifyInstance, FastifyReply, FastifyRequest } from 'fastify';
 import { TokenUniverseModel } from './token_universe.model.js';
 import { 
   ingestTokenUniverse,
   getTokenUniverseStats,
 } from './token_universe.service.js';
 import { seedTokenUniverse } from './token_universe.seed.js';
+import { toNdjson } from '../../common/utils.js';
+
+interface TokenQuery {
+  active?: string;
+  chainId?: string;
+  minMarketCap?: string;
+  search?: string;
+  limit?: string;
+  offset?: string;
+  sortBy?: string;
+  sortOrder?: string;
+}
+
+const TOKEN_LIST_FIELDS = '-_id symbol name contractAddress chainId marketCap volume24h priceUsd priceChange24h marketCapRank imageUrl active lastSyncedAt source';
+
+/**
+ * Mongo filter and sort for the token list query parameters
+ */
+function tokenQuery(query: TokenQuery): { filter: any; sort: Record<string, 1 | -1> } {
+  const filter: any = {};
+  
+  if (query.active === 'true') {
+    filter.active = true;
+  }
+  
+  if (query.chainId) {
+    filter.chainId = parseInt(query.chainId);
+  }
+  
+  if (query.minMarketCap) {
+    filter.marketCap = { $gte: parseInt(query.minMarketCap) };
+  }
+  
+  if (query.search) {
+    filter.$or = [
+      { symbol: { $regex: query.search, $options: 'i' } },
+      { name: { $regex: query.search, $options: 'i' } },
+    ];
+  }
+  
+  // Sorting
+  const sortField = query.sortBy || 'marketCap';
+  const sortOrder = query.sortOrder === 'asc' ? 1 : -1;
+  const sort: Record<string, 1 | -1> = { [sortField]: sortOrder };
+  
+  return { filter, sort };
+}
 
 export async function tokenUniverseRoutes(app: FastifyInstance): Promise<void> {
   
@@ -56,53 +103,19 @@ export async function tokenUniverseRoutes(app: FastifyInstance): Promise<void> {
    * Query token universe
    */
   app.get('/tokens', async (request: FastifyRequest) => {
-    const query = request.query as {
-      active?: string;
-      chainId?: string;
-      minMarketCap?: string;
-      search?: string;
-      limit?: string;
-      offset?: string;
-      sortBy?: string;
-      sortOrder?: string;
-    };
+    const query = request.query as TokenQuery;
     
     try {
-      const filter: any = {};
-      
-      if (query.active === 'true') {
-        filter.active = true;
-      }
-      
-      if (query.chainId) {
-        filter.chainId = parseInt(query.chainId);
-      }
-      
-      if (query.minMarketCap) {
-        filter.marketCap = { $gte: parseInt(query.minMarketCap) };
-      }
-      
-      if (query.search) {
-        filter.$or = [
-          { symbol: { $regex: query.search, $options: 'i' } },
-          { name: { $regex: query.search, $options: 'i' } },
-        ];
-      }
-      
+      const { filter, sort } = tokenQuery(query);
       const limit = Math.min(parseInt(query.limit || '100'), 500);
       const offset = parseInt(query.offset || '0');
       
-      // Sorting
-      const sortField = query.sortBy || 'marketCap';
-      const sortOrder = query.sortOrder === 'asc' ? 1 : -1;
-      const sort: Record<string, 1 | -1> = { [sortField]: sortOrder };
-      
       const [tokens, total] = await Promise.all([
         TokenUniverseModel.find(filter)
           .sort(sort)
           .limit(limit)
           .skip(offset)
-          .select('-_id symbol name contractAddress chainId marketCap volume24h priceUsd priceChange24h marketCapRank imageUrl active lastSyncedAt source')
+          .select(TOKEN_LIST_FIELDS)
           .lean(),
         TokenUniverseModel.countDocuments(filter),
       ]);
@@ -126,6 +139,23 @@ export async function tokenUniverseRoutes(app: FastifyInstance): Promise<void> {
     }
   });
   
+  /**
+   * GET /api/tokens/export
+   * Whole filtered token universe as NDJSON (same filters and sort as
+   * GET /api/tokens, no limit/offset), streamed from a database cursor
+   */
+  app.get('/tokens/export', async (request: FastifyRequest, reply: FastifyReply) => {
+    const { filter, sort } = tokenQuery(request.query as TokenQuery);
+    
+    const cursor = TokenUniverseModel.find(filter)
+      .sort(sort)
+      .select(TOKEN_LIST_FIELDS)
+      .lean()
+      .cursor({ batchSize: 500 });
+    
+    return reply.type('application/x-ndjson').send(toNdjson(cursor));
+  });
+  
   /**
    * GET /api/tokens/:symbol
    * Get single token by symbol
@@ -25,57 +25,81 @@ async function main(): Promise<void> {
   // B6: Run startup checks (fail-fast)
   await runStartupChecks(app);
 
-  // P2.5: Seed token registry with known tokens
-  console.log('[Server] Seeding token registry...');
-  await seedTokenRegistry();
+  // Seeding and background jobs run in the primary worker only;
+  // replica workers behind the proxy just serve HTTP traffic.
+  const isPrimary = env.WORKER_ROLE === 'primary';
+  let jobsStarted = false;
+  const startBackgroundJobs = async (): Promise<void> => {
+    if (jobsStarted) return;
+    jobsStarted = true;
+    // P2.5: Seed token registry with known tokens
+    console.log('[Server] Seeding token registry...');
+    await seedTokenRegistry();
   
-  // БЛОК 1: Ensure ML Runtime Config exists (default: OFF)
-  console.log('[Server] Initializing ML Runtime Config...');
-  await ensureDefaultConfig();
+    // БЛОК 1: Ensure ML Runtime Config exists (default: OFF)
+    console.log('[Server] Initializing ML Runtime Config...');
+    await ensureDefaultConfig();
   
-  // БЛОК 2: Seed Token Universe if empty
-  const tokenCount = await TokenUniverseModel.countDocuments();
-  if (tokenCount === 0) {
-    console.log('[Server] Seeding Token Universe...');
-    await seedTokenUniverse();
-  } else {
-    console.log(`[Server] Token Universe already has ${tokenCount} tokens`);
-  }
+    // БЛОК 2: Seed Token Universe if empty
+    const tokenCount = await TokenUniverseModel.countDocuments();
+    if (tokenCount === 0) {
+      console.log('[Server] Seeding Token Universe...');
+      await seedTokenUniverse();
+    } else {
+      console.log(`[Server] Token Universe already has ${tokenCount} tokens`);
+    }
+
+    // Register scheduled jobs (including ERC-20 indexer)
+    registerDefaultJobs();
 
-  // Register scheduled jobs (including ERC-20 indexer)
-  registerDefaultJobs();
+    // Start scheduler jobs
+    scheduler.startAll();
 
-  // Start scheduler jobs
-  scheduler.startAll();
+    // Start bootstrap worker
+    const workerStarted = await bootstrapWorker.start();
+    console.log(`[Server] Bootstrap worker: ${workerStarted ? 'started' : 'skipped (lock held)'}`);
 
-  // Start bootstrap worker
-  const workerStarted = await bootstrapWorker.start();
-  console.log(`[Server] Bootstrap worker: ${workerStarted ? 'started' : 'skipped (lock held)'}`);
+    // B5: Start health monitor
+    startHealthMonitor();
 
-  // B5: Start health monitor
-  startHealthMonitor();
+    // TEMPORARY FIX: Start Telegram polling (until ingress routing is fixed)
+    console.log('[Server] Starting Telegram polling worker (TEMPORARY FIX)...');
+    startTelegramPolling().catch(err => {
+      console.error('[Server] Telegram polling error:', err);
+    });
+  };
 
-  // TEMPORARY FIX: Start Telegram polling (until ingress routing is fixed)
-  console.log('[Server] Starting Telegram polling worker (TEMPORARY FIX)...');
-  startTelegramPolling().catch(err => {
-    console.error('[Server] Telegram polling error:', err);
-  });
+  if (!isPrimary) {
+    console.log('[Server] Replica worker: skipping seeding and background jobs');
+  } else if (env.WORKER_DEFER_JOBS) {
+    // Rolling restart: the old primary keeps running its jobs until it has drained
+    console.log('[Server] Primary worker: background jobs wait for SIGUSR2 from the proxy');
+    process.once('SIGUSR2', () => {
+      startBackgroundJobs().catch(err => {
+        console.error('[Server] Background jobs failed to start:', err);
+      });
+    });
+  } else {
+    await startBackgroundJobs();
+  }
 
   // Graceful shutdown
   const shutdown = async (signal: string) => {
     console.log(`[Server] Received ${signal}, shutting down...`);
 
-    // Stop Telegram polling
-    stopTelegramPolling();
+    if (jobsStarted) {
+      // Stop Telegram polling
+      stopTelegramPolling();
     
-    // Stop monitoring first
-    stopHealthMonitor();
+      // Stop monitoring first
+      stopHealthMonitor();
     
-    // Stop worker
-    await bootstrapWorker.stop();
+      // Stop worker
+      await bootstrapWorker.stop();
     
-    // Stop scheduler
-    scheduler.stopAll();
+      // Stop scheduler
+      scheduler.stopAll();
+    }
     
     // Close app and DB
     await app.close();
@@ -90,8 +114,13 @@ async function main(): Promise<void> {
 
   // Start server
   try {
-    await app.listen({ port: env.PORT, host: '0.0.0.0' });
-    console.log(`[Server] ✓ Backend started on port ${env.PORT}`);
+    if (env.SOCKET_PATH) {
+      await app.listen({ path: env.SOCKET_PATH });
+      console.log(`[Server] ✓ Backend started on socket ${env.SOCKET_PATH}`);
+    } else {
+      await app.listen({ port: env.PORT, host: '0.0.0.0' });
+      console.log(`[Server] ✓ Backend started on port ${env.PORT}`);
+    }
     console.log(`[Server] Environment: ${env.NODE_ENV}`);
     console.log(`[Server] WebSocket: ${env.WS_ENABLED ? 'enabled' : 'disabled'}`);
     console.log(`[Server] Indexer: ${env.INDEXER_ENABLED && env.INFURA_RPC_URL ? 'enabled' : 'disabled'}`);
@@ -26,11 +26,35 @@ async function fetchDashboardData(limit = 20) {
   return response.json();
 }
 
-async function computeRankings() {
+// Long-poll rounds (up to 25s each) before giving up on a recompute job
+const COMPUTE_MAX_POLLS = 12;
+
+async function computeRankings(resubmitted = false) {
   const response = await fetch(`${API_URL}/api/rankings/compute`, {
     method: 'POST',
   });
-  return response.json();
+  if (response.status !== 202) {
+    return response.json();
+  }
+  // The proxy runs recomputes as background jobs; long-poll until it finishes
+  const location = response.headers.get('Location');
+  for (let poll = 0; poll < COMPUTE_MAX_POLLS; poll++) {
+    const status = await fetch(`${API_URL}${location}?wait=25`);
+    if (status.status === 404) {
+      // Jobs live in proxy memory, so a proxy restart forgets them; submit once more
+      return resubmitted
+        ? { ok: false, error: 'Computation job was lost' }
+        : computeRankings(true);
+    }
+    if (!status.ok) {
+      return { ok: false, error: `Computation status failed (${status.status})` };
+    }
+    const job = (await status.json()).data;
+    if (job.state === 'succeeded' || job.state === 'failed') {
+      return job.result || { ok: false, error: job.error };
+    }
+  }
+  return { ok: false, error: 'Computation is still running; refresh later' };
 }
 
 async function syncTokens() {
@@ -0,0 +1,103 @@
+"""
+Endpoint catalog
+The API calls exercised by test_blockchain_analyzer.py and
+test_token_runner.py, in one place so benchmarks and fixture tooling can
+reuse them instead of keeping their own lists.
+
+Each entry has a stable name (used as the key in benchmark reports), the
+method and path with query, an optional JSON body and headers, and the
+status the suites expect. Mutating calls are marked so read-only load
+mixes can leave them out.
+
+Through the proxy, rankings.compute and token_runner.run are background
+jobs answered with 202; they send WAIT_FOR_JOB so the result (and its
+200) comes back inline, as the suites do.
+"""
+from typing import NamedTuple, Optional
+
+
+class Endpoint(NamedTuple):
+    name: str
+    method: str
+    path: str
+    body: Optional[dict] = None
+    expect_status: int = 200
+    mutating: bool = False
+    headers: Optional[dict] = None
+
+
+WAIT_FOR_JOB = {"Prefer": "wait=120"}
+
+
+ENDPOINTS = [
+    # System
+    Endpoint("health", "GET", "/api/health"),
+
+    # Token Universe (Stage B)
+    Endpoint("tokens.stats", "GET", "/api/tokens/stats"),
+    Endpoint("tokens.list", "GET", "/api/tokens?limit=10"),
+    Endpoint("tokens.search", "GET", "/api/tokens?search=ETH&limit=5"),
+    Endpoint("tokens.top", "GET", "/api/tokens/top?limit=10"),
+    Endpoint("tokens.symbol", "GET", "/api/tokens/USDT"),
+
+    # Rankings
+    Endpoint("rankings.list", "GET", "/api/rankings?limit=10"),
+    Endpoint("rankings.buckets", "GET", "/api/rankings/buckets"),
+    Endpoint("rankings.bucket", "GET", "/api/rankings/bucket/BUY?limit=5"),
+    Endpoint("rankings.dashboard", "GET", "/api/rankings/dashboard?limit=5"),
+    Endpoint("rankings.movers", "GET", "/api/rankings/movers?limit=5"),
+    Endpoint("rankings.compute", "POST", "/api/rankings/compute", mutating=True, headers=WAIT_FOR_JOB),
+
+    # Token Runner (Stage C)
+    Endpoint("token_runner.stats", "GET", "/api/token-runner/stats"),
+    Endpoint("token_runner.top", "GET", "/api/token-runner/top?limit=10"),
+    Endpoint("token_runner.analyses", "GET", "/api/token-runner/analyses?limit=50"),
+    Endpoint("token_runner.analyses_completed", "GET", "/api/token-runner/analyses?status=completed&limit=5"),
+    Endpoint("token_runner.analyses_neutral", "GET", "/api/token-runner/analyses?label=NEUTRAL&limit=5"),
+    Endpoint("token_runner.analysis", "GET", "/api/token-runner/analysis/USDT"),
+    Endpoint("token_runner.analysis_missing", "GET", "/api/token-runner/analysis/NONEXISTENT_TOKEN_XYZ"),
+    Endpoint("token_runner.run", "POST", "/api/token-runner/run", body={"batchSize": 5, "mode": "fast"}, mutating=True,
+             headers=WAIT_FOR_JOB),
+
+    # ML runtime
+    Endpoint("ml.runtime", "GET", "/api/engine/ml/runtime"),
+    Endpoint("ml.runtime_update", "POST", "/api/engine/ml/runtime", body={"mlMode": "advisor", "mlEnabled": True}, mutating=True),
+]
+
+BY_NAME = {endpoint.name: endpoint for endpoint in ENDPOINTS}
+
+# Named traffic mixes: endpoint name -> relative weight
+MIXES = {
+    # Every read endpoint equally
+    "reads": {e.name: 1 for e in ENDPOINTS if not e.mutating},
+    # Roughly what the dashboard UI does on a page load and refresh
+    "dashboard": {
+        "rankings.dashboard": 6,
+        "rankings.buckets": 3,
+        "tokens.stats": 3,
+        "token_runner.top": 2,
+        "rankings.movers": 2,
+        "tokens.symbol": 1,
+        "token_runner.analysis": 1,
+    },
+    # Reads with an occasional batch run and recompute mixed in
+    "mixed": {
+        **{e.name: 4 for e in ENDPOINTS if not e.mutating},
+        "token_runner.run": 1,
+        "rankings.compute": 1,
+    },
+}
+
+
+def parse_mix(spec: str) -> dict:
+    """A mix name from MIXES, or explicit "name=weight,name=weight" """
+    if spec in MIXES:
+        return dict(MIXES[spec])
+    weights = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in BY_NAME:
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        weights[name] = float(weight or 1)
+    return weights
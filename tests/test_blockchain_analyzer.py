@@ -3,10 +3,13 @@ Blockchain Analyzer API Tests
 Tests for Token Universe, Rankings, and ML Runtime APIs
 """
 import pytest
+import json
 import requests
 import os
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://crypto-analyzer-39.preview.emergentagent.com')
+# Compute calls are background jobs at the proxy; wait for the result inline
+WAIT_FOR_JOB = {'Prefer': 'wait=120'}
 
 
 class TestTokenUniverseAPI:
@@ -70,6 +73,19 @@ class TestTokenUniverseAPI:
         assert data["ok"] is True
         print(f"✓ Token search for 'ETH': {data['data']['total']} results")
     
+    def test_export_tokens_as_ndjson(self):
+        """GET /api/tokens/export?search=ETH - Whole filtered collection as NDJSON"""
+        total = requests.get(f"{BASE_URL}/api/tokens?search=ETH&limit=1").json()["data"]["total"]
+        response = requests.get(f"{BASE_URL}/api/tokens/export?search=ETH", stream=True)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        
+        tokens = [json.loads(line) for line in response.iter_lines() if line]
+        assert len(tokens) == total
+        for token in tokens:
+            assert "ETH" in f"{token['symbol']} {token.get('name', '')}".upper()
+        print(f"✓ Token export for 'ETH': {len(tokens)} lines")
+    
     def test_get_single_token(self):
         """GET /api/tokens/:symbol - Get single token by symbol"""
         response = requests.get(f"{BASE_URL}/api/tokens/USDT")
@@ -206,7 +222,7 @@ class TestRankingsAPI:
     
     def test_compute_rankings(self):
         """POST /api/rankings/compute - Trigger ranking computation"""
-        response = requests.post(f"{BASE_URL}/api/rankings/compute")
+        response = requests.post(f"{BASE_URL}/api/rankings/compute", headers=WAIT_FOR_JOB)
         assert response.status_code == 200
         
         data = response.json()
@@ -0,0 +1,134 @@
+"""
+Latency Budget Tests
+Per-endpoint p95 budgets for the read APIs in tests/endpoints.py
+
+Each endpoint is warmed up, then sampled sequentially; the test fails when
+the p95 exceeds its budget (or any sample returns an unexpected status),
+with the full distribution in the failure message. Every run appends its
+timings to a history file outside the repository, one line per endpoint,
+so trends across commits can be compared.
+
+The suite measures a live deployment, so a plain `pytest tests/` skips it.
+Run it with both knobs set:
+
+    LATENCY_BUDGETS=1 REACT_APP_BACKEND_URL=http://localhost:8001 pytest tests/test_latency_budgets.py
+
+Knobs:
+- LATENCY_BUDGETS           1 to run the suite at all
+- REACT_APP_BACKEND_URL     target, as in the other API suites (required)
+- LATENCY_SAMPLES           measured requests per endpoint (default 30)
+- LATENCY_WARMUP            unmeasured requests first (default 5)
+- LATENCY_BUDGET_SCALE      multiply every budget, e.g. 3 on a slow CI box
+- LATENCY_HISTORY           history file (default ~/.cache/blockview/latency-history.jsonl,
+                            empty string disables it)
+"""
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+import requests
+
+from tests.endpoints import BY_NAME
+from tests.latency import git_revision, percentile
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '')
+
+pytestmark = pytest.mark.skipif(
+    os.environ.get('LATENCY_BUDGETS') != '1' or not BASE_URL,
+    reason="latency budgets run only with LATENCY_BUDGETS=1 and REACT_APP_BACKEND_URL set",
+)
+
+SAMPLES = int(os.environ.get('LATENCY_SAMPLES', '30'))
+WARMUP = int(os.environ.get('LATENCY_WARMUP', '5'))
+BUDGET_SCALE = float(os.environ.get('LATENCY_BUDGET_SCALE', '1'))
+HISTORY = os.environ.get(
+    'LATENCY_HISTORY',
+    str(Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / ".cache") / "blockview" / "latency-history.jsonl"),
+)
+
+# p95 budgets in milliseconds, keyed by endpoint name in tests/endpoints.py
+BUDGETS = {
+    "health": 50,
+    "tokens.stats": 150,
+    "tokens.list": 200,
+    "tokens.search": 250,
+    "tokens.top": 200,
+    "tokens.symbol": 150,
+    "rankings.list": 250,
+    "rankings.buckets": 150,
+    "rankings.bucket": 200,
+    "rankings.dashboard": 250,
+    "rankings.movers": 250,
+    "token_runner.stats": 200,
+    "token_runner.top": 200,
+    "token_runner.analyses": 300,
+    "token_runner.analysis": 150,
+    "ml.runtime": 100,
+}
+
+
+def record_history(entry):
+    if not HISTORY:
+        return
+    path = Path(HISTORY)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a") as f:
+        f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+@pytest.fixture(scope="module")
+def session():
+    with requests.Session() as s:
+        yield s
+
+
+@pytest.mark.parametrize("name", sorted(BUDGETS))
+def test_latency_budget(session, name):
+    """p95 latency of each endpoint stays within its budget"""
+    endpoint = BY_NAME[name]
+    budget = BUDGETS[name] * BUDGET_SCALE
+    url = f"{BASE_URL}{endpoint.path}"
+
+    for _ in range(WARMUP):
+        session.request(endpoint.method, url, json=endpoint.body, headers=endpoint.headers).content
+
+    latencies = []
+    bad_statuses = []
+    for _ in range(SAMPLES):
+        started = time.perf_counter()
+        response = session.request(endpoint.method, url, json=endpoint.body, headers=endpoint.headers)
+        response.content
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != endpoint.expect_status:
+            bad_statuses.append(response.status_code)
+    latencies.sort()
+
+    stats = {
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2),
+    }
+    passed = not bad_statuses and stats["p95_ms"] <= budget
+    record_history({
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "base_url": BASE_URL,
+        "endpoint": name,
+        "path": endpoint.path,
+        "samples": SAMPLES,
+        "budget_p95_ms": budget,
+        **stats,
+        "passed": passed,
+    })
+
+    assert not bad_statuses, f"{endpoint.method} {endpoint.path}: unexpected statuses {bad_statuses}"
+    assert stats["p95_ms"] <= budget, (
+        f"{endpoint.method} {endpoint.path}: p95 {stats['p95_ms']} ms exceeds budget {budget:g} ms "
+        f"(p50 {stats['p50_ms']}, p99 {stats['p99_ms']}, max {stats['max_ms']} over {SAMPLES} samples "
+        f"after {WARMUP} warm-up)"
+    )
+    print(f"✓ {name}: p95 {stats['p95_ms']} ms (budget {budget:g} ms)")
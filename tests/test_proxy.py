@@ -0,0 +1,1774 @@
+"""
+Proxy Layer Tests
+Offline tests for the FastAPI proxy in backend/server.py
+
+The TypeScript child is never started: the shared httpx client is swapped
+for one backed by an in-process mock upstream.
+"""
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from gateway.batch import BatchError, parse_batch  # noqa: E402
+from gateway.bulkhead import Bulkheads, RouteClass  # noqa: E402
+from fixtures.backend import FixtureBackend, load_recordings  # noqa: E402
+from gateway.cache import CachedResponse, ResponseCache, cache_key  # noqa: E402
+from gateway.coalesce import SingleFlight  # noqa: E402
+from gateway.compression import Compressor, negotiate  # noqa: E402
+from gateway.delta import DeltaHistory, apply_delta, diff  # noqa: E402
+from gateway.etag import etag_matches, make_etag  # noqa: E402
+from gateway.jobs import JobQueue  # noqa: E402
+from gateway.metrics import ProxyMetrics, RouteTemplates  # noqa: E402
+from gateway.projection import ProjectionError, parse_fields, project  # noqa: E402
+from gateway.ratelimit import RateLimiter  # noqa: E402
+from gateway.readiness import ReadinessGate, StartupTimings, wait_until_ready  # noqa: E402
+from gateway.resilience import CircuitBreaker, HedgeStats, LatencyTracker, RetryBudget  # noqa: E402
+from gateway.snapshot import SnapshotEntry, read_snapshot, write_snapshot  # noqa: E402
+from gateway.supervisor import Supervisor  # noqa: E402
+from gateway.workers import WorkerPool  # noqa: E402
+from gateway.ws_client import LocalClient  # noqa: E402
+from gateway.ws_hub import IDLE_CATEGORY, WsHub  # noqa: E402
+
+
+class FakeProcess:
+    """Stands in for a running Popen"""
+    pid = 0
+    returncode = None
+
+    def __init__(self):
+        self.signals = []
+
+    def send_signal(self, sig):
+        self.signals.append(sig)
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.returncode = -15
+
+    def wait(self, timeout=None):
+        return 0
+
+
+def ready_pool(size=1):
+    """Worker pool whose workers look alive and healthy"""
+    pool = WorkerPool(8002, size)
+    for worker in pool.workers:
+        worker.process = FakeProcess()
+        worker.ready = True
+    return pool
+
+
+async def chunked(data, size=64 * 1024):
+    """Async body stream, so the mock upstream behaves like a real socket"""
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def upstream_json(status, payload, headers=None):
+    """Streamed JSON response from the mock upstream"""
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    return httpx.Response(status, content=chunked(body), headers={"content-type": "application/json", **(headers or {})})
+
+
+# Other tests share one TestClient address; TestRateLimiting uses its own limiter
+if server.rate_limiter is not None:
+    server.rate_limiter.exempt.add("ip:testclient")
+
+
+def make_client(handler):
+    """Point the proxy at a mock upstream and return a test client"""
+    server.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    server.backend_ready = ReadinessGate()
+    server.backend_ready.open()
+    server.pool = ready_pool()
+    if server.response_cache is not None:
+        server.response_cache.clear()
+    return TestClient(server.app)
+
+
+class TestStreamingProxy:
+    """Streaming passthrough (PROXY_STREAMING)"""
+
+    def test_large_response_is_passed_through(self):
+        """Large upstream bodies arrive intact"""
+        payload = b"x" * (4 * 1024 * 1024)
+
+        def handler(request):
+            return httpx.Response(200, content=chunked(payload), headers={"content-type": "application/json"})
+
+        client = make_client(handler)
+        response = client.get("/api/token-runner/analyses?limit=1000")
+        assert response.status_code == 200
+        assert response.content == payload
+
+    def test_request_body_is_forwarded(self, monkeypatch):
+        """POST bodies reach the upstream unchanged"""
+        monkeypatch.setattr(server, "job_queue", None)
+        seen = {}
+
+        def handler(request):
+            seen["body"] = request.content
+            seen["url"] = str(request.url)
+            return upstream_json(200, {"ok": True})
+
+        client = make_client(handler)
+        response = client.post("/api/token-runner/run?mode=fast", json={"batchSize": 5})
+        assert response.status_code == 200
+        assert json.loads(seen["body"]) == {"batchSize": 5}
+        assert seen["url"].endswith("/api/token-runner/run?mode=fast")
+
+    def test_bodyless_get_is_not_chunked(self):
+        """GET without a body must not be sent with chunked encoding"""
+        seen = {}
+
+        def handler(request):
+            seen["headers"] = request.headers
+            return upstream_json(200, {"ok": True})
+
+        client = make_client(handler)
+        client.get("/api/health")
+        assert "transfer-encoding" not in seen["headers"]
+
+    def test_export_is_streamed_even_when_buffering(self, monkeypatch):
+        """NDJSON exports bypass PROXY_STREAMING=false and run in the export bulkhead"""
+        monkeypatch.setattr(server, "PROXY_STREAMING", False)
+        lines = b"".join(b'{"symbol":"ETH%d"}\n' % i for i in range(1000))
+        seen = {}
+
+        def handler(request):
+            seen["url"] = str(request.url)
+            return httpx.Response(200, content=chunked(lines, 4096), headers={"content-type": "application/x-ndjson"})
+
+        client = make_client(handler)
+        admitted = server.bulkheads.classes["export"].admitted
+        response = client.get("/api/tokens/export?search=ETH")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "content-length" not in response.headers
+        assert response.content == lines
+        assert seen["url"].endswith("/api/tokens/export?search=ETH")
+        assert server.bulkheads.classes["export"].admitted == admitted + 1
+
+    def test_connect_error_returns_503(self):
+        """Unreachable upstream maps to 503"""
+        def handler(request):
+            raise httpx.ConnectError("refused", request=request)
+
+        client = make_client(handler)
+        response = client.get("/api/health")
+        assert response.status_code == 503
+        assert response.json()["error"] == "Backend starting..."
+
+
+class TestReadiness:
+    """Readiness-gated startup"""
+
+    def test_probe_backs_off_until_healthy(self):
+        """wait_until_ready retries through refused connections and 503s"""
+        answers = iter(["refuse", "refuse", 503, 200])
+
+        def handler(request):
+            answer = next(answers)
+            if answer == "refuse":
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(answer, json={"ok": answer == 200})
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                timings = StartupTimings()
+                ok = await wait_until_ready(client, "http://ts/api/health", 5, timings, initial_delay=0.001)
+                return ok, timings
+
+        ok, timings = asyncio.run(run())
+        assert ok is True
+        assert timings.probes == 4
+        assert "listening" in timings.phases
+        assert timings.phases["ready"] >= timings.phases["listening"]
+
+    def test_probe_gives_up_at_deadline(self):
+        """wait_until_ready returns False once the deadline passes"""
+        def handler(request):
+            raise httpx.ConnectError("refused", request=request)
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                timings = StartupTimings()
+                return await wait_until_ready(client, "http://ts/api/health", 0.05, timings, initial_delay=0.01), timings
+
+        ok, timings = asyncio.run(run())
+        assert ok is False
+        assert "deadline" in timings.phases
+
+    def test_requests_fail_fast_when_gate_stays_closed(self, monkeypatch):
+        """Requests queue for PROXY_READY_WAIT, then get 503"""
+        client = make_client(lambda request: upstream_json(200, {"ok": True}))
+        server.backend_ready = ReadinessGate()
+        monkeypatch.setattr(server, "PROXY_READY_WAIT", 0.01)
+        response = client.get("/api/rankings/dashboard")
+        assert response.status_code == 503
+
+
+class TestWorkerPool:
+    """Multi-process TS worker pool"""
+
+    def test_workers_use_consecutive_ports(self):
+        """Worker 0 is primary, the rest are replicas on the next ports"""
+        pool = WorkerPool(8002, 3)
+        assert [w.port for w in pool.workers] == [8002, 8003, 8004]
+        assert [w.role for w in pool.workers] == ["primary", "replica", "replica"]
+
+    def test_pick_least_outstanding(self):
+        """Traffic goes to the worker with the fewest in-flight requests"""
+        pool = ready_pool(3)
+        pool.acquire(pool.workers[0])
+        pool.acquire(pool.workers[0])
+        pool.acquire(pool.workers[1])
+        assert pool.pick() is pool.workers[2]
+
+    def test_pick_skips_unready_workers(self):
+        """Workers that have not passed readiness get no traffic"""
+        pool = ready_pool(2)
+        pool.workers[0].ready = False
+        for _ in range(4):
+            assert pool.pick() is pool.workers[1]
+        pool.workers[1].ready = False
+        assert pool.pick() is None
+
+    def test_ties_are_spread(self):
+        """Idle workers share traffic instead of piling onto worker 0"""
+        pool = ready_pool(3)
+        picked = {pool.pick().index for _ in range(3)}
+        assert picked == {0, 1, 2}
+
+    def test_default_worker_count_follows_the_cgroup_quota(self, monkeypatch):
+        """A 1.5-CPU quota on a 64-core host means 2 CPUs, not 64"""
+        import gateway.workers as workers
+
+        monkeypatch.setattr(workers.os, "sched_getaffinity", lambda pid: set(range(64)), raising=False)
+        monkeypatch.setattr(workers, "_cgroup_cpu_quota", lambda: 1.5)
+        assert workers.available_cpus() == 2
+        monkeypatch.setattr(workers, "_cgroup_cpu_quota", lambda: None)
+        assert workers.available_cpus() == 64
+
+    def test_websockets_are_pinned_to_the_primary(self):
+        """Replicas emit no SystemEvents, so /ws never lands on one"""
+        pool = ready_pool(3)
+        pool.workers[0].ws_sessions = 5
+        assert pool.pick_for_websocket() is pool.workers[0]
+        pool.workers[0].ready = False
+        assert pool.pick_for_websocket() is None
+
+    def test_uds_workers_use_pseudo_hosts(self, tmp_path):
+        """UDS workers get their own socket and a host the client mounts onto it"""
+        pool = WorkerPool(8002, 2, socket_dir=str(tmp_path))
+        first, second = pool.workers
+        assert first.socket_path != second.socket_path
+        assert first.socket_path.startswith(str(tmp_path))
+        assert first.url == "http://ts-worker-0"
+        assert second.ws_url == "ws://ts-worker-1/ws"
+
+    def test_streamed_request_is_released(self):
+        """Outstanding count returns to zero once the body has been relayed"""
+        client = make_client(lambda request: upstream_json(200, {"ok": True}))
+        client.get("/api/rankings/dashboard?limit=5")
+        assert server.pool.workers[0].outstanding == 0
+
+
+class TestResponseCache:
+    """TTL + LRU response cache"""
+
+    def test_query_is_normalized(self):
+        """Parameter order does not split cache entries"""
+        assert cache_key("/api/rankings/dashboard", "limit=5&bucket=BUY") == \
+            cache_key("/api/rankings/dashboard", "bucket=BUY&limit=5")
+
+    def test_ttl_for_uses_longest_prefix(self):
+        """Route rules match whole path segments"""
+        cache = ResponseCache({"/api/rankings": 5, "/api/rankings/dashboard": 30}, {})
+        assert cache.ttl_for("/api/rankings/dashboard") == 30
+        assert cache.ttl_for("/api/rankings/movers") == 5
+        assert cache.ttl_for("/api/rankingsX") is None
+
+    def test_lru_eviction(self):
+        """Least recently used entries go first once the bound is hit"""
+        cache = ResponseCache({}, {}, max_entries=2)
+        cache.put("a", CachedResponse(200, [], b"a", 60))
+        cache.put("b", CachedResponse(200, [], b"b", 60))
+        cache.get("a")
+        cache.put("c", CachedResponse(200, [], b"c", 60))
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_expired_entries_miss(self):
+        """Entries past their TTL are dropped on lookup"""
+        cache = ResponseCache({}, {})
+        cache.put("a", CachedResponse(200, [], b"a", 0))
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+
+    def test_stale_generation_is_not_stored(self):
+        """A response fetched before a purge is not stored after it"""
+        cache = ResponseCache({}, {"/api/rankings/compute": ["/api/rankings"]})
+        generation = cache.generation
+        cache.on_mutation("/api/rankings/compute")
+        assert cache.put("/api/rankings/buckets", CachedResponse(200, [], b"x", 60), generation) is False
+
+    def test_proxy_serves_hits_and_purges_on_compute(self, monkeypatch):
+        """Second read is served from cache until a compute call purges it"""
+        monkeypatch.setattr(server, "job_queue", None)
+        calls = []
+
+        def handler(request):
+            calls.append((request.method, request.url.path))
+            if request.method == "POST":
+                return upstream_json(200, {"ok": True, "data": {"computed": 10}})
+            return upstream_json(200, {"ok": True, "data": {"BUY": len(calls)}})
+
+        client = make_client(handler)
+        first = client.get("/api/rankings/buckets")
+        second = client.get("/api/rankings/buckets")
+        assert first.headers["x-cache"] == "MISS"
+        assert second.headers["x-cache"] == "HIT"
+        assert second.json() == first.json()
+        assert len(calls) == 1
+
+        client.post("/api/rankings/compute")
+        third = client.get("/api/rankings/buckets")
+        assert third.headers["x-cache"] == "MISS"
+        assert len(calls) == 3
+
+        stats = client.get("/api/_proxy/cache").json()["data"]
+        assert stats["hits"] == 1
+        assert stats["purged"] == 1
+
+    def test_failed_results_are_not_cached(self):
+        """{"ok": false} answers are passed through but never stored"""
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return upstream_json(200, {"ok": False, "error": "not ready"})
+
+        client = make_client(handler)
+        client.get("/api/token-runner/top")
+        client.get("/api/token-runner/top")
+        assert len(calls) == 2
+
+
+class TestSingleFlight:
+    """Coalescing of identical in-flight GETs"""
+
+    def test_concurrent_callers_share_one_call(self):
+        """Callers that arrive while a call is in flight await its result"""
+        flight = SingleFlight(["/api/rankings/dashboard"])
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def run():
+            return await asyncio.gather(*[flight.do("k", fetch) for _ in range(10)])
+
+        results = asyncio.run(run())
+        assert results == ["result"] * 10
+        assert len(calls) == 1
+        assert flight.stats()["coalesced"] == 9
+
+    def test_routes_match_exact_paths(self):
+        """Opting in /api/rankings/dashboard leaves the streamed list pages alone"""
+        flight = SingleFlight(server.PROXY_COALESCE_ROUTES)
+        assert flight.enabled_for("/api/rankings/dashboard")
+        assert not flight.enabled_for("/api/rankings")
+        assert not flight.enabled_for("/api/rankings/bucket/BUY")
+
+    def test_leader_cancellation_does_not_cancel_followers(self):
+        """A disconnecting leader leaves the shared call running"""
+        flight = SingleFlight(["/api/rankings/dashboard"])
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "result"
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do("k", fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do("k", fetch))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        assert asyncio.run(run()) == "result"
+
+    def test_proxy_coalesces_identical_dashboard_requests(self):
+        """Concurrent identical GETs reach the upstream once"""
+        calls = []
+
+        async def handler(request):
+            calls.append(str(request.url))
+            await asyncio.sleep(0.05)
+            return upstream_json(200, {"ok": True, "data": {"buckets": {}}})
+
+        make_client(handler)
+        server.response_cache.clear()
+
+        async def run():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://proxy") as client:
+                return await asyncio.gather(*[
+                    client.get("/api/rankings/dashboard?limit=5", headers={"cache-control": "no-cache"})
+                    for _ in range(5)
+                ])
+
+        responses = asyncio.run(run())
+        assert all(r.status_code == 200 for r in responses)
+        assert len(calls) == 1
+
+
+class FakeSocket:
+    """Collects what the hub sends to a browser or upstream connection"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def send(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000, reason=""):
+        self.closed_with = code
+
+
+async def flush():
+    """Let client writer tasks drain their queues"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def hub_with_fake_upstream(links=1):
+    hub = WsHub(lambda: None, links=links)
+    for link in hub.links:
+        link._ws = FakeSocket()
+    return hub
+
+
+class FixtureWsWorker:
+    """Worker whose ws_connect() opens a /ws session on an in-process FixtureBackend"""
+
+    def __init__(self, app):
+        self.app = app
+        self.index = 0
+        self.ws_sessions = 0
+
+    def ws_connect(self):
+        return FixtureWsConnection(self.app)
+
+
+class FixtureWsConnection:
+    def __init__(self, app):
+        self.app = app
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+
+    async def __aenter__(self):
+        async def send(message):
+            if message["type"] == "websocket.send":
+                self.outgoing.put_nowait(message["text"])
+
+        self.incoming.put_nowait({"type": "websocket.connect"})
+        self.session = asyncio.ensure_future(self.app({"type": "websocket", "path": "/ws"}, self.incoming.get, send))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def send(self, text):
+        self.incoming.put_nowait({"type": "websocket.receive", "text": text})
+
+    async def close(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect"})
+        await self.session
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.outgoing.get()
+
+
+class TestWsHub:
+    """Shared upstream WebSocket multiplexing on ws-gateway.ts categories"""
+
+    def test_events_reach_clients_by_category(self):
+        """Against the fixture's ws-gateway protocol: categories filter, an empty list means everything"""
+        worker = FixtureWsWorker(FixtureBackend({"responses": {}}, ws_interval_ms=10))
+        hub = WsHub(lambda: worker, links=2, local_categories=["jobs"])
+        alerts, everything, jobs_only = (LocalClient(FakeSocket()) for _ in range(3))
+
+        async def run():
+            for client, subscriptions in ((alerts, ["alerts"]), (everything, []), (jobs_only, ["jobs"])):
+                await hub.register(client)
+                await hub.handle_client_message(client, json.dumps({"type": "hello", "subscriptions": subscriptions}))
+            await asyncio.sleep(0.1)
+            await hub.stop()
+            await flush()
+
+        asyncio.run(run())
+        events = {name: [m for m in client.websocket.sent if m["type"] != "connected"]
+                  for name, client in (("alerts", alerts), ("everything", everything), ("jobs", jobs_only))}
+        assert events["alerts"] and {m["type"] for m in events["alerts"]} == {"alert.new"}
+        assert {m["type"] for m in events["everything"]} == {
+            "bootstrap.progress", "resolver.updated", "attribution.confirmed", "alert.new", "signal.new",
+        }
+        alert_ids = [m["alertId"] for m in events["everything"] if m["type"] == "alert.new"]
+        assert len(alert_ids) == len(set(alert_ids)), "an event was relayed by more than one link"
+        assert events["jobs"] == []
+
+    def test_links_request_only_wanted_categories(self):
+        """Each link's hello follows the union of local subscriptions; idle links stay quiet"""
+        hub = hub_with_fake_upstream()
+        upstream = hub.links[0]._ws
+        a, b = LocalClient(FakeSocket()), LocalClient(FakeSocket())
+
+        async def run():
+            await hub.register(a)
+            await hub.handle_client_message(a, '{"type":"hello","subscriptions":["alerts"]}')
+            await hub.register(b)
+            await hub.handle_client_message(b, '{"type":"subscribe","category":"signals"}')
+            await hub.handle_client_message(b, '{"type":"unsubscribe","category":"signals"}')
+            await hub.unregister(b)
+            await hub.unregister(a)
+
+        asyncio.run(run())
+        assert [m["subscriptions"] for m in upstream.sent] == [
+            ["alerts", "attribution", "bootstrap", "resolver", "signals"],  # a connects with no subscriptions
+            ["alerts"],
+            ["alerts", "attribution", "bootstrap", "resolver", "signals"],  # so does b
+            ["alerts", "signals"],
+            ["alerts", "attribution", "bootstrap", "resolver", "signals"],  # b's set is empty again
+            ["alerts"],
+            [IDLE_CATEGORY],
+        ]
+        assert all(m["type"] == "hello" for m in upstream.sent)
+
+    def test_ping_and_local_events_are_answered_locally(self):
+        """connected/pong come from the proxy; job events go to opted-in clients only"""
+        hub = hub_with_fake_upstream()
+        hub.local_categories = {"jobs"}
+        watcher, other = LocalClient(FakeSocket()), LocalClient(FakeSocket())
+
+        async def run():
+            for client in (watcher, other):
+                await hub.register(client)
+            await hub.handle_client_message(watcher, '{"type":"subscribe","category":"jobs"}')
+            await hub.handle_client_message(other, '{"type":"ping"}')
+            hub.publish("jobs", "job.updated", {"id": "j1", "state": "running"})
+            await flush()
+
+        asyncio.run(run())
+        assert [m["type"] for m in watcher.websocket.sent] == ["connected", "job.updated"]
+        assert watcher.websocket.sent[1]["id"] == "j1"
+        assert [m["type"] for m in other.websocket.sent] == ["connected", "pong"]
+        assert all(m["type"] == "hello" for m in hub.links[0]._ws.sent)
+
+
+class TestSlowConsumerPolicies:
+    """Bounded per-client send queues"""
+
+    def test_drop_oldest(self):
+        """A full queue discards its oldest frames"""
+        client = LocalClient(FakeSocket(), max_queue=3, policy="drop_oldest")
+        for i in range(5):
+            client.offer(json.dumps({"n": i}))
+
+        async def run():
+            client.start()
+            await flush()
+
+        asyncio.run(run())
+        assert [m["n"] for m in client.websocket.sent] == [2, 3, 4]
+        assert client.stats()["dropped"] == 2
+        assert client.stats()["max_queue_depth"] == 3
+
+    def test_coalesce_keeps_latest_per_key(self):
+        """Queued frames with the same key are replaced by the newest"""
+        client = LocalClient(FakeSocket(), max_queue=10, policy="coalesce")
+        client.offer('{"channel":"market","n":1}', "market:tick")
+        client.offer('{"channel":"alerts","n":2}', "alerts:alert")
+        client.offer('{"channel":"market","n":3}', "market:tick")
+
+        async def run():
+            client.start()
+            await flush()
+
+        asyncio.run(run())
+        assert [m["n"] for m in client.websocket.sent] == [3, 2]
+        assert client.stats()["coalesced"] == 1
+
+    def test_disconnect_on_overflow(self):
+        """The disconnect policy closes a client whose queue is full"""
+        client = LocalClient(FakeSocket(), max_queue=2, policy="disconnect")
+
+        async def run():
+            assert client.offer("{}") and client.offer("{}")
+            assert client.offer("{}") is False
+            await flush()
+
+        asyncio.run(run())
+        assert client.closed
+        assert client.websocket.closed_with == 1008
+
+    def test_binary_frames_pass_through(self):
+        """bytes payloads are sent as binary frames"""
+        client = LocalClient(FakeSocket())
+        client.offer(b"\x00\x01")
+
+        async def run():
+            client.start()
+            await flush()
+
+        asyncio.run(run())
+        assert client.websocket.sent == [b"\x00\x01"]
+        assert client.stats()["sent"] == 1
+
+
+class TestCompression:
+    """Negotiated response compression"""
+
+    def test_negotiation_honors_q_values(self):
+        """Client q-values win; server preference breaks ties"""
+        encodings = ("zstd", "br", "gzip")
+        assert negotiate("gzip, br", encodings) == "br"
+        assert negotiate("gzip;q=1.0, br;q=0.5", encodings) == "gzip"
+        assert negotiate("br;q=0, gzip", encodings) == "gzip"
+        assert negotiate("*", encodings) == "zstd"
+        assert negotiate("identity", encodings) is None
+        assert negotiate("", encodings) is None
+
+    def test_streaming_gzip_round_trips(self):
+        """Incremental compression produces one valid gzip stream"""
+        import gzip
+
+        compressor = Compressor({"gzip": 6})
+        payload = json.dumps([{"symbol": f"T{i}", "engineScore": i} for i in range(2000)]).encode()
+
+        async def run():
+            return b"".join([chunk async for chunk in compressor.compress_stream(chunked(payload, 4096), "gzip")])
+
+        assert gzip.decompress(asyncio.run(run())) == payload
+        assert compressor.stats.as_dict()["gzip"]["bytes_in"] == len(payload)
+
+    def test_large_json_is_compressed(self, monkeypatch):
+        """Compressible bodies above the threshold are gzip-encoded for gzip clients"""
+        monkeypatch.setattr(server, "PROXY_COMPRESSION_ENCODINGS", ("gzip",))
+        payload = {"ok": True, "data": {"tokens": [{"symbol": f"T{i}"} for i in range(500)]}}
+        client = make_client(lambda request: upstream_json(200, payload))
+        response = client.get("/api/tokens?limit=500", headers={"accept-encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json() == payload
+
+    def test_small_bodies_are_not_compressed(self):
+        """Bodies under PROXY_COMPRESSION_MIN_BYTES go out as-is"""
+        client = make_client(lambda request: httpx.Response(
+            200, content=chunked(b'{"ok":true}'), headers={"content-type": "application/json", "content-length": "11"}))
+        response = client.get("/api/health", headers={"accept-encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+    def test_cached_variant_is_compressed_once(self, monkeypatch):
+        """Cache hits reuse the stored compressed variant"""
+        monkeypatch.setattr(server, "PROXY_COMPRESSION_ENCODINGS", ("gzip",))
+        monkeypatch.setattr(server, "compressor", Compressor({"gzip": 6}))
+        payload = {"ok": True, "data": {"buckets": {"BUY": [{"symbol": f"T{i}"} for i in range(300)]}}}
+        client = make_client(lambda request: upstream_json(200, payload))
+        for _ in range(4):
+            response = client.get("/api/rankings/dashboard?limit=300", headers={"accept-encoding": "gzip"})
+            assert response.json() == payload
+        assert response.headers["x-cache"] == "HIT"
+        assert server.compressor.stats.as_dict()["gzip"]["calls"] == 1
+
+    def test_coalesced_callers_share_one_compressed_entry(self, monkeypatch):
+        """Concurrent misses get the single-flight leader's entry and its variant"""
+        monkeypatch.setattr(server, "PROXY_COMPRESSION_ENCODINGS", ("gzip",))
+        monkeypatch.setattr(server, "compressor", Compressor({"gzip": 6}))
+        payload = {"ok": True, "data": {"buckets": {"BUY": [{"symbol": f"T{i}"} for i in range(300)]}}}
+        calls = []
+
+        async def handler(request):
+            calls.append(request.url.path)
+            await asyncio.sleep(0.05)
+            return upstream_json(200, payload)
+
+        make_client(handler)
+
+        async def run():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://proxy") as client:
+                return await asyncio.gather(*[
+                    client.get("/api/rankings/dashboard?limit=300", headers={"accept-encoding": "gzip"})
+                    for _ in range(10)
+                ])
+
+        responses = asyncio.run(run())
+        assert all(r.json() == payload and r.headers["content-encoding"] == "gzip" for r in responses)
+        assert len({r.headers["etag"] for r in responses}) == 1
+        assert len(calls) == 1
+        assert server.compressor.stats.as_dict()["gzip"]["calls"] == 1
+        assert server.response_cache.stats()["entries"] == 1
+
+
+class TestMetrics:
+    """Per-route metrics and the Prometheus endpoint"""
+
+    def test_paths_fold_into_templates(self):
+        """Static routes beat parameters; id-like segments are generalised"""
+        templates = RouteTemplates(["/api/tokens/:symbol", "/api/tokens/stats"])
+        assert templates.template_for("/api/tokens/USDT") == "/api/tokens/:symbol"
+        assert templates.template_for("/api/tokens/stats") == "/api/tokens/stats"
+        address = "0x" + "ab" * 20
+        assert templates.template_for(f"/api/actors/actor/{address}/card") == "/api/actors/actor/:address/card"
+        assert templates.template_for("/api/alerts/alert/65a1f0c2e4b0a1b2c3d4e5f6") == "/api/alerts/alert/:id"
+        assert templates.template_for("/api/ens/lookup/vitalik.eth") == "/api/ens/lookup/:name"
+
+    def test_route_cardinality_is_bounded(self):
+        """Templates past max_routes are counted as 'other'"""
+        templates = RouteTemplates([], max_routes=2)
+        assert templates.template_for("/api/a") == "/api/a"
+        assert templates.template_for("/api/b") == "/api/b"
+        assert templates.template_for("/api/c") == "other"
+        assert templates.template_for("/api/a") == "/api/a"
+
+    def test_requests_are_recorded_per_template(self, monkeypatch):
+        """Counts, status classes, latency and bytes land under the route template"""
+        metrics = ProxyMetrics(RouteTemplates(server.PROXY_METRICS_TEMPLATES))
+        monkeypatch.setattr(server, "metrics", metrics)
+        client = make_client(lambda request: upstream_json(
+            200 if request.url.path.endswith("USDT") else 404, {"ok": True, "data": {}}))
+        client.get("/api/tokens/USDT")
+        client.get("/api/tokens/WETH")
+
+        route = "/api/tokens/:symbol"
+        assert metrics.requests[(route, "GET", "2xx")] == 1
+        assert metrics.requests[(route, "GET", "4xx")] == 1
+        assert metrics.in_flight[route] == 0
+        assert metrics.duration.count((route, "GET")) == 2
+        assert metrics.upstream_latency.count((route,)) == 2
+        assert metrics.response_bytes[route] > 0
+
+    def test_metrics_endpoint_is_not_proxied(self, monkeypatch):
+        """The Prometheus endpoint is served by the proxy itself"""
+        monkeypatch.setattr(server, "metrics", ProxyMetrics(RouteTemplates(server.PROXY_METRICS_TEMPLATES)))
+        upstream_calls = []
+
+        def handler(request):
+            upstream_calls.append(request.url.path)
+            return upstream_json(200, {"ok": True})
+
+        client = make_client(handler)
+        client.get("/api/rankings/token/PEPE")
+        response = client.get("/api/_proxy/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert upstream_calls == ["/api/rankings/token/PEPE"]
+        body = response.text
+        assert 'proxy_http_requests_total{route="/api/rankings/token/:symbol",method="GET",status="2xx"} 1' in body
+        assert 'proxy_upstream_latency_seconds_bucket{route="/api/rankings/token/:symbol",le="+Inf"} 1' in body
+        assert "# TYPE proxy_ws_connections gauge" in body
+
+
+def fixture_get(app, method, url, **kwargs):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fixtures") as client:
+            return await client.request(method, url, **kwargs)
+
+    return asyncio.run(run())
+
+
+def fixture_ws(app, messages, duration=0.05):
+    """Frames a fixture /ws connection sends after the client sends messages"""
+    async def run():
+        incoming = asyncio.Queue()
+        for message in [{"type": "websocket.connect"}] + [{"type": "websocket.receive", "text": json.dumps(m)} for m in messages]:
+            incoming.put_nowait(message)
+        frames = []
+
+        async def send(message):
+            if message["type"] == "websocket.send":
+                frames.append(json.loads(message["text"]))
+
+        session = asyncio.ensure_future(app({"type": "websocket", "path": "/ws"}, incoming.get, send))
+        await asyncio.sleep(duration)
+        incoming.put_nowait({"type": "websocket.disconnect"})
+        await session
+        return frames
+
+    return asyncio.run(run())
+
+
+class TestFixtureBackend:
+    """Recorded-fixture stand-in upstream (TS_BACKEND=fixtures)"""
+
+    def test_replays_recordings_with_any_query_order(self):
+        """Recorded responses are found regardless of query parameter order"""
+        app = FixtureBackend(load_recordings())
+        response = fixture_get(app, "GET", "/api/token-runner/analyses?limit=5&status=completed")
+        assert response.status_code == 200
+        analyses = response.json()["data"]["analyses"]
+        assert analyses and all(a["status"] == "completed" for a in analyses)
+        assert fixture_get(app, "GET", "/api/nope").json()["statusCode"] == 404
+
+    def test_variants_match_request_body(self):
+        """POST recordings pick the variant whose fields match the JSON body"""
+        app = FixtureBackend(load_recordings())
+        assert fixture_get(app, "POST", "/api/engine/ml/runtime", json={"mlMode": "off"}).json()["data"]["mlMode"] == "off"
+        assert fixture_get(app, "POST", "/api/engine/ml/runtime", json={"mlMode": "bogus"}).json()["ok"] is False
+
+    def test_payload_padding_and_latency(self):
+        """Bodies are padded to FIXTURE_PAYLOAD_BYTES and delayed by the route latency"""
+        import time
+
+        app = FixtureBackend(load_recordings(), payload_bytes=50_000, route_latency={"/api/tokens": 50})
+        started = time.perf_counter()
+        response = fixture_get(app, "GET", "/api/tokens/stats")
+        assert time.perf_counter() - started >= 0.05
+        assert len(response.content) >= 50_000
+        assert response.json()["ok"] is True
+
+    def test_ws_speaks_the_gateway_protocol(self):
+        """hello/subscribe by category, and channel-less SystemEvents, as in ws-gateway.ts"""
+        app = FixtureBackend({"responses": {}}, ws_interval_ms=10)
+        alerts = fixture_ws(app, [{"type": "hello", "subscriptions": ["alerts"]}, {"type": "subscribe", "category": "signals"}, {"type": "ping"}])
+        everything = fixture_ws(app, [{"type": "hello", "subscriptions": []}])
+        assert alerts[0]["type"] == "connected" and alerts[1]["type"] == "pong"
+        assert {frame["type"] for frame in alerts[2:]} == {"alert.new", "signal.new"}
+        assert {frame["type"] for frame in everything[1:]} == {
+            "bootstrap.progress", "resolver.updated", "attribution.confirmed", "alert.new", "signal.new",
+        }
+        assert not any("channel" in frame for frame in alerts + everything)
+
+
+class TestRateLimiting:
+    """Per-client token buckets with a bounded wait"""
+
+    def test_bucket_admits_burst_then_rejects_with_retry_after(self):
+        """A drained bucket rejects with the time until the cost is covered"""
+        limiter = RateLimiter(rate=10, burst=5, max_queue=0)
+        for _ in range(5):
+            assert limiter.reserve("ip:a", 1, now=0.0) == (0.0, None)
+        wait, retry_after = limiter.reserve("ip:a", 1, now=0.0)
+        assert wait is None and abs(retry_after - 0.1) < 1e-9
+        # Other clients have their own bucket; time refills this one
+        assert limiter.reserve("ip:b", 1, now=0.0) == (0.0, None)
+        assert limiter.reserve("ip:a", 1, now=0.1) == (0.0, None)
+
+    def test_short_deficit_waits_in_bounded_queue(self):
+        """Up to max_queue requests wait for their tokens instead of failing"""
+        limiter = RateLimiter(rate=10, burst=1, max_queue=2, max_wait=1.0)
+        assert limiter.reserve("ip:a", 1, now=0.0) == (0.0, None)
+        assert limiter.reserve("ip:a", 1, now=0.0) == (0.1, None)
+        assert limiter.reserve("ip:a", 1, now=0.0)[0] == 0.2
+        # Queue full
+        assert limiter.reserve("ip:a", 1, now=0.0)[0] is None
+        assert limiter.delayed == 2 and limiter.rejected == 1
+
+    def test_route_costs_and_idle_expiry(self):
+        """Routes cost their configured tokens; idle full buckets are dropped"""
+        limiter = RateLimiter(rate=10, burst=30, costs={"/api/token-runner/run": 30, "/api/health": 0})
+        assert limiter.cost_for("/api/token-runner/run") == 30
+        assert limiter.cost_for("/api/health") == 0
+        assert limiter.cost_for("/api/tokens/USDT") == 1
+        limiter.reserve("ip:a", 1, now=0.0)
+        limiter.reserve("ip:b", 1, now=10.0)
+        assert limiter.stats()["clients"] == 1
+        assert limiter.expired == 1
+
+    def test_proxy_returns_429_with_retry_after(self, monkeypatch):
+        """Expensive calls over budget get 429 and never reach the backend"""
+        monkeypatch.setattr(server, "rate_limiter", RateLimiter(
+            rate=1, burst=30, costs={"/api/token-runner/run": 30}, max_queue=0))
+        monkeypatch.setattr(server, "job_queue", None)
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return upstream_json(200, {"ok": True, "data": {"processed": 5}})
+
+        client = make_client(handler)
+        assert client.post("/api/token-runner/run", json={"batchSize": 5}).status_code == 200
+        response = client.post("/api/token-runner/run", json={"batchSize": 5})
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "30"
+        assert response.json()["ok"] is False
+        # API keys get their own bucket
+        assert client.post("/api/token-runner/run", headers={"x-api-key": "k1"}).status_code == 200
+        assert calls == ["/api/token-runner/run", "/api/token-runner/run"]
+
+    def test_spoofed_forwarded_for_neither_exempts_nor_escapes(self, monkeypatch):
+        """Without trust, X-Forwarded-For is ignored; exemptions only ever match the socket peer"""
+        monkeypatch.setattr(server, "rate_limiter", RateLimiter(
+            rate=1, burst=30, costs={"/api/token-runner/run": 30}, max_queue=0, exempt=["ip:127.0.0.1"]))
+        monkeypatch.setattr(server, "job_queue", None)
+        client = make_client(lambda request: upstream_json(200, {"ok": True}))
+        assert client.post("/api/token-runner/run").status_code == 200
+        for forwarded in ("127.0.0.1", "10.0.0.7", "10.0.0.8, 127.0.0.1"):
+            response = client.post("/api/token-runner/run", headers={"x-forwarded-for": forwarded})
+            assert response.status_code == 429
+        # Even a trusted forwarded address cannot claim an exemption
+        monkeypatch.setattr(server, "PROXY_TRUST_FORWARDED", True)
+        response = client.post("/api/token-runner/run", headers={"x-forwarded-for": "10.0.0.9, 127.0.0.1"})
+        assert response.status_code == 200
+        response = client.post("/api/token-runner/run", headers={"x-forwarded-for": "10.0.0.9, 127.0.0.1"})
+        assert response.status_code == 429
+
+    def test_trusted_hop_is_counted_from_the_right(self, monkeypatch):
+        """The ingress-appended entry identifies the client; entries left of it are client-controlled"""
+        monkeypatch.setattr(server, "PROXY_TRUST_FORWARDED", True)
+
+        def identity(forwarded, hops):
+            monkeypatch.setattr(server, "PROXY_FORWARDED_HOPS", hops)
+            scope = {"type": "http", "method": "GET", "path": "/", "query_string": b"",
+                     "client": ("10.1.1.1", 5000),
+                     "headers": [(b"x-forwarded-for", value.encode()) for value in forwarded]}
+            return server.client_identity(Request(scope))
+
+        assert identity(["1.1.1.1, 2.2.2.2"], 1) == "ip:2.2.2.2"
+        assert identity(["6.6.6.6, 1.1.1.1, 2.2.2.2"], 2) == "ip:1.1.1.1"
+        # Repeated headers are one list, in order
+        assert identity(["6.6.6.6, 1.1.1.1", "2.2.2.2"], 2) == "ip:1.1.1.1"
+        # Fewer entries than trusted hops: the request skipped the ingress
+        assert identity(["2.2.2.2"], 2) == "ip:10.1.1.1"
+        assert identity([], 1) == "ip:10.1.1.1"
+        monkeypatch.setattr(server, "PROXY_TRUST_FORWARDED", False)
+        assert identity(["1.1.1.1, 2.2.2.2"], 1) == "ip:10.1.1.1"
+
+
+class TestBulkheads:
+    """Route classes with separate concurrency caps and timeouts"""
+
+    def test_slots_are_handed_over_in_order(self):
+        """Freed slots go to the oldest waiter; waiters give up after queue_wait"""
+        async def run():
+            route_class = RouteClass("heavy", max_concurrency=1, timeout=5, queue_wait=0.05)
+            assert await route_class.acquire()
+            order = []
+
+            async def waiter(name, wait):
+                route_class.queue_wait = wait
+                if await route_class.acquire():
+                    order.append(name)
+                    route_class.release()
+
+            first = asyncio.ensure_future(waiter("first", 1.0))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(waiter("second", 1.0))
+            await asyncio.sleep(0)
+            route_class.release()
+            await asyncio.gather(first, second)
+            route_class.queue_wait = 0.01
+            assert await route_class.acquire()
+            assert not await route_class.acquire()
+            return order, route_class
+
+        order, route_class = asyncio.run(run())
+        assert order == ["first", "second"]
+        assert route_class.active == 1 and route_class.rejected == 1
+
+    def test_heavy_class_at_capacity_does_not_block_reads(self, monkeypatch):
+        """A saturated heavy class answers 503 while interactive reads go through"""
+        monkeypatch.setattr(server, "bulkheads", Bulkheads(
+            [RouteClass("heavy", 1, 5, queue_wait=0.05), RouteClass("default", 8, 5)],
+            {"/api/token-runner/run": "heavy"},
+        ))
+        monkeypatch.setattr(server, "job_queue", None)
+        make_client(lambda request: None)
+        release = asyncio.Event()
+
+        async def handler(request):
+            if request.url.path == "/api/token-runner/run":
+                await release.wait()
+            return upstream_json(200, {"ok": True, "data": {}})
+
+        server.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        async def run():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://proxy") as client:
+                blocked = asyncio.ensure_future(client.post("/api/token-runner/run"))
+                await asyncio.sleep(0.01)
+                rejected = await client.post("/api/token-runner/run")
+                read = await client.get("/api/tokens/USDT")
+                release.set()
+                return (await blocked).status_code, rejected, read.status_code
+
+        blocked, rejected, read = asyncio.run(run())
+        assert blocked == 200 and read == 200
+        assert rejected.status_code == 503
+        assert rejected.headers["retry-after"] == "1"
+        assert server.bulkheads.classes["heavy"].active == 0
+
+    def test_class_pools_respect_global_pool_limits(self, monkeypatch):
+        """PROXY_POOL_MAX_CONNECTIONS / _KEEPALIVE bound every class's pool"""
+        monkeypatch.setattr(server, "PROXY_POOL_MAX_CONNECTIONS", 16)
+        monkeypatch.setattr(server, "PROXY_POOL_MAX_KEEPALIVE", 4)
+        small = server.route_class_limits(RouteClass("heavy", 2, 5))
+        large = server.route_class_limits(RouteClass("default", 64, 5))
+        assert (small.max_connections, small.max_keepalive_connections) == (2, 2)
+        assert (large.max_connections, large.max_keepalive_connections) == (16, 4)
+
+    def test_upstream_timeout_is_a_504(self, monkeypatch):
+        """A worker outlasting the class timeout yields 504 and frees the slot"""
+        monkeypatch.setattr(server, "bulkheads", Bulkheads([RouteClass("default", 2, 0.05)], {}))
+
+        def handler(request):
+            raise httpx.ReadTimeout("timed out", request=request)
+
+        client = make_client(handler)
+        response = client.get("/api/rankings/movers?limit=5")
+        assert response.status_code == 504
+        assert server.bulkheads.classes["default"].timeouts == 1
+        assert server.bulkheads.classes["default"].active == 0
+
+
+class TestResilience:
+    """Circuit breakers, the retry budget and hedged GETs"""
+
+    def test_unspecialised_upstream_error_is_a_502(self, monkeypatch):
+        """UpstreamError subclasses without their own response still answer with JSON"""
+        class Unexpected(server.UpstreamError):
+            pass
+
+        async def failing(request, target):
+            raise Unexpected()
+
+        client = make_client(lambda request: upstream_json(200, {"ok": True}))
+        monkeypatch.setattr(server, "forward_buffered", failing)
+        response = client.get("/api/rankings/dashboard?limit=5")
+        assert response.status_code == 502
+        assert response.json() == {"error": "Bad gateway"}
+
+    def test_breaker_opens_then_allows_one_trial(self):
+        """Consecutive failures open it; after the cooldown a single trial decides"""
+        breaker = CircuitBreaker(failures=2, cooldown=5)
+        breaker.on_failure(now=0)
+        assert breaker.accepting(now=0)
+        breaker.on_failure(now=1)
+        assert breaker.state == "open" and not breaker.accepting(now=2)
+        assert breaker.accepting(now=6)
+        breaker.on_attempt(now=6)
+        assert breaker.state == "half_open" and not breaker.accepting(now=6)
+        breaker.on_failure(now=7)
+        assert breaker.state == "open" and not breaker.accepting(now=8)
+        breaker.on_attempt(now=12)
+        breaker.on_success()
+        assert breaker.state == "closed" and breaker.accepting(now=12)
+
+    def test_retry_budget_caps_extra_attempts(self):
+        """Retries stay within ratio * requests plus the burst allowance"""
+        budget = RetryBudget(ratio=0.1, burst=1)
+        allowed = 0
+        for _ in range(100):
+            budget.deposit()
+            allowed += budget.withdraw()
+        assert allowed <= 11 and budget.denied >= 89
+
+    def test_refused_connection_is_retried_on_another_worker(self, monkeypatch):
+        """A GET whose worker refuses the connection is answered by the other one"""
+        monkeypatch.setattr(server, "hedge_stats", HedgeStats())
+        monkeypatch.setattr(server, "retry_budget", RetryBudget())
+
+        def handler(request):
+            if request.url.port == 8002:
+                raise httpx.ConnectError("refused", request=request)
+            return upstream_json(200, {"ok": True, "data": {"port": request.url.port}})
+
+        client = make_client(handler)
+        server.pool = ready_pool(2)
+        for worker in server.pool.workers:
+            worker.breaker = CircuitBreaker(failures=1, cooldown=30)
+        server.pool.workers[1].outstanding = 1  # the first attempt goes to the refusing worker
+        assert client.get("/api/tokens/USDT").json()["data"]["port"] == 8003
+        assert server.hedge_stats.retries == 1
+        # Worker 0 is now skipped without another connection attempt
+        assert server.pool.workers[0].breaker.state == "open"
+        assert client.get("/api/tokens/USDT").json()["data"]["port"] == 8003
+        assert server.hedge_stats.retries == 1
+
+    def test_slow_worker_is_hedged(self, monkeypatch):
+        """A GET outstanding past its route's p95 is answered by a second worker"""
+        route = server.metrics.route_for("/api/tokens/USDT") if server.metrics else "default"
+        latency = LatencyTracker(min_samples=1, refresh_every=1)
+        latency.record(route, 0.02)
+        monkeypatch.setattr(server, "upstream_latency", latency)
+        monkeypatch.setattr(server, "hedge_stats", HedgeStats())
+        monkeypatch.setattr(server, "retry_budget", RetryBudget())
+
+        async def handler(request):
+            if request.url.port == 8002:
+                await asyncio.sleep(5)
+            return upstream_json(200, {"ok": True, "data": {"port": request.url.port}})
+
+        client = make_client(handler)
+        server.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        server.pool = ready_pool(2)
+        server.pool.workers[1].outstanding = 1  # the first attempt goes to the slow worker
+        response = client.get("/api/tokens/USDT")
+        assert response.json()["data"]["port"] == 8003
+        assert server.hedge_stats.hedges == 1 and server.hedge_stats.hedge_wins == 1
+        assert server.pool.workers[0].outstanding == 0
+
+    def test_open_breakers_fail_fast(self):
+        """With every worker's breaker open the proxy answers 503 without calling upstream"""
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return upstream_json(200, {"ok": True})
+
+        client = make_client(handler)
+        breaker = CircuitBreaker(failures=1, cooldown=30)
+        breaker.on_failure()
+        server.pool.workers[0].breaker = breaker
+        response = client.get("/api/rankings/movers")
+        assert response.status_code == 503
+        assert int(response.headers["retry-after"]) >= 1
+        assert calls == []
+
+
+def fake_spawn(spawned):
+    def spawn(worker):
+        worker.process = FakeProcess()
+        worker.started_at = time.monotonic()
+        spawned.append(worker.name)
+    return spawn
+
+
+class TestSupervisor:
+    """Crash restarts with backoff and blue-green rolling restarts"""
+
+    def test_crashed_worker_is_restarted_with_backoff(self):
+        """An exited worker leaves rotation and is respawned; repeated crashes back off"""
+        pool = ready_pool(1)
+        spawned = []
+
+        async def probe(worker, context, require_healthy):
+            return True
+
+        async def run():
+            supervisor = Supervisor(pool, fake_spawn(spawned), probe, backoff=0.01, check_interval=0.005)
+            supervisor.start()
+            for _ in range(2):
+                await asyncio.sleep(0.02)
+                pool.workers[0].process.returncode = 1
+                await asyncio.sleep(0.005)
+                assert not pool.workers[0].available()
+            await asyncio.sleep(0.1)
+            await supervisor.stop()
+            return supervisor
+
+        supervisor = asyncio.run(run())
+        assert spawned == ["ts-worker-0"] * 3
+        assert pool.workers[0].available()
+        assert supervisor.restarts == 2 and supervisor.crash_streak == [2]
+        assert supervisor.backoff_for(0) == 0.04
+
+    def test_rolling_restart_drains_old_worker(self):
+        """The replacement takes new traffic first; the old worker stops once idle"""
+        pool = ready_pool(1)
+        old = pool.workers[0]
+        old.outstanding = 1
+        spawned = []
+
+        async def probe(worker, context, require_healthy):
+            return True
+
+        async def run():
+            supervisor = Supervisor(pool, fake_spawn(spawned), probe, drain_timeout=5)
+            task = supervisor.schedule_rolling_restart()
+            await asyncio.sleep(0.02)
+            assert pool.pick() is pool.workers[0] and pool.workers[0].port == 8003
+            assert old.alive() and not old.ready and not task.done()
+            assert supervisor.schedule_rolling_restart() is None
+            old.outstanding = 0
+            return await task
+
+        result = asyncio.run(run())
+        assert result["ok"] and result["replaced"] == [{"slot": 0, "worker": "ts-worker-0b", "drained": True}]
+        assert spawned == ["ts-worker-0b"] and not old.alive()
+        assert pool.standby[0] is old
+
+    def test_new_primary_starts_jobs_after_old_one_exits(self):
+        """Background jobs never run in two primaries at once; replicas are not signalled"""
+        import signal
+
+        pool = ready_pool(2)
+        old_primary = pool.workers[0]
+        spawned_deferred = []
+
+        def spawn(worker):
+            worker.process = FakeProcess()
+            spawned_deferred.append((worker.name, worker.defer_jobs))
+
+        async def probe(worker, context, require_healthy):
+            return True
+
+        async def run():
+            supervisor = Supervisor(pool, spawn, probe)
+            task = supervisor.schedule_rolling_restart()
+            await asyncio.sleep(0.01)
+            # Swapped in and serving, but still waiting for the old primary to drain
+            assert pool.workers[0].name == "ts-worker-0b" and pool.workers[0].process.signals == []
+            old_primary.outstanding = 0
+            return await task
+
+        old_primary.outstanding = 1
+        assert asyncio.run(run())["ok"]
+        assert spawned_deferred == [("ts-worker-0b", True), ("ts-worker-1b", False)]
+        assert not old_primary.alive()
+        assert pool.workers[0].process.signals == [signal.SIGUSR2] and not pool.workers[0].defer_jobs
+        assert pool.workers[1].process.signals == []
+
+    def test_admin_endpoints_need_loopback_or_token(self, monkeypatch):
+        """Cache purges and restarts from remote peers are refused, even with a forwarded loopback address"""
+        monkeypatch.setattr(server, "PROXY_ADMIN_TOKEN", "s3cret")
+        client = make_client(lambda request: upstream_json(200, {"ok": True}))
+        spoofed = {"x-forwarded-for": "127.0.0.1"}
+        assert client.delete("/api/_proxy/cache", headers=spoofed).status_code == 403
+        assert client.post("/api/_proxy/workers/restart", headers={"x-admin-token": "wrong"}).status_code == 403
+        assert client.delete("/api/_proxy/cache", headers={"x-admin-token": "s3cret"}).status_code == 200
+
+        async def from_loopback():
+            transport = httpx.ASGITransport(app=server.app, client=("127.0.0.1", 40000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://proxy") as local:
+                return await local.delete("/api/_proxy/cache")
+
+        assert asyncio.run(from_loopback()).status_code == 200
+
+    def test_unhealthy_replacement_keeps_old_worker(self):
+        """A replacement that never passes readiness is stopped and nothing is swapped"""
+        pool = ready_pool(1)
+        old = pool.workers[0]
+
+        async def probe(worker, context, require_healthy):
+            return not require_healthy
+
+        async def run():
+            supervisor = Supervisor(pool, fake_spawn([]), probe)
+            return await supervisor.schedule_rolling_restart()
+
+        result = asyncio.run(run())
+        assert not result["ok"] and result["failed"] == "ts-worker-0b"
+        assert pool.workers[0] is old and old.available()
+        assert not pool.standby[0].alive()
+
+
+class TestJobs:
+    """Background jobs for token-runner batches and ranking recomputes"""
+
+    def test_duplicate_submissions_collapse(self):
+        """Queued duplicates join one job; a trigger during a run queues one follow-up"""
+        runs = []
+        release = asyncio.Event()
+
+        async def run_job(job):
+            runs.append(job.id)
+            await release.wait()
+            return 200, "application/json", b'{"ok":true}'
+
+        async def run():
+            jobs = JobQueue(["/api/rankings/compute"], run_job, debounce=0.01)
+            first, _ = jobs.submit("POST", "/api/rankings/compute", "", b"", {})
+            same, deduplicated = jobs.submit("POST", "/api/rankings/compute", "", b"", {})
+            assert same is first and deduplicated
+            await asyncio.sleep(0.03)
+            assert first.state == "running"
+            follow_up, _ = jobs.submit("POST", "/api/rankings/compute", "", b"", {})
+            joined, _ = jobs.submit("POST", "/api/rankings/compute", "", b"", {})
+            other, _ = jobs.submit("POST", "/api/rankings/compute", "", b'{"limit":5}', {})
+            assert follow_up is not first and joined is follow_up and other is not follow_up
+            release.set()
+            assert await follow_up.wait(1) and await other.wait(1)
+            return jobs, first, follow_up
+
+        jobs, first, follow_up = asyncio.run(run())
+        assert len(runs) == 3
+        assert first.submissions == 2 and follow_up.submissions == 2
+        assert first.state == follow_up.state == "succeeded"
+        assert jobs.stats()["deduplicated"] == 2
+
+    def test_failed_upstream_answer_fails_the_job(self):
+        """{"ok": false} and error statuses mark the job failed, with the body kept"""
+        async def run_job(job):
+            return 200, "application/json", b'{"ok":false,"error":"no data"}'
+
+        async def run():
+            jobs = JobQueue(["/api/token-runner/run"], run_job, debounce=0)
+            job, _ = jobs.submit("POST", "/api/token-runner/run", "", b"", {})
+            await job.wait(1)
+            return job
+
+        job = asyncio.run(run())
+        assert job.state == "failed"
+        assert job.as_dict(include_result=True)["result"] == {"ok": False, "error": "no data"}
+
+    def test_proxy_answers_202_then_reports_the_result(self, monkeypatch):
+        """Submission returns a job id at once; the status endpoint has the upstream result"""
+        monkeypatch.setattr(server, "job_queue", JobQueue(server.PROXY_JOB_ROUTES, server.run_job, debounce=0))
+        calls = []
+
+        async def handler(request):
+            calls.append((request.url.path, request.content))
+            await asyncio.sleep(0.02)
+            return upstream_json(200, {"ok": True, "data": {"processed": 5}})
+
+        make_client(handler)
+
+        async def run():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://proxy") as client:
+                accepted = await client.post("/api/token-runner/run", json={"batchSize": 5})
+                duplicate = await client.post("/api/token-runner/run", json={"batchSize": 5})
+                status = await client.get(f"{accepted.headers['location']}?wait=1")
+                inline = await client.post("/api/rankings/compute", headers={"prefer": "wait=1"})
+                return accepted, duplicate, status, inline
+
+        accepted, duplicate, status, inline = asyncio.run(run())
+        assert accepted.status_code == 202 and accepted.json()["data"]["state"] == "queued"
+        assert duplicate.json()["data"]["id"] == accepted.json()["data"]["id"]
+        assert duplicate.json()["data"]["deduplicated"] is True
+        job = status.json()["data"]
+        assert job["state"] == "succeeded" and job["result"] == {"ok": True, "data": {"processed": 5}}
+        assert inline.status_code == 200 and inline.headers["x-job-id"]
+        assert calls == [
+            ("/api/token-runner/run", b'{"batchSize":5}'),
+            ("/api/rankings/compute", b""),
+        ]
+
+
+class TestBatch:
+    """Many GETs in one round trip through /api/_proxy/batch"""
+
+    def test_invalid_batches_are_rejected(self):
+        """Only GETs to /api/ routes outside the admin prefix, up to the batch limit"""
+        subs = parse_batch({"requests": ["/api/tokens/stats", {"id": "m", "path": "/api/rankings/movers?limit=5"}]}, 5, "/api/_proxy")
+        assert [(s.id, s.path, s.query) for s in subs] == [("0", "/api/tokens/stats", ""), ("m", "/api/rankings/movers", "limit=5")]
+        [sub] = parse_batch({"requests": [{"path": "/api/tokens/stats", "headers": {"Cache-Control": "no-cache", "Accept-Encoding": "br"}}]}, 5, "/api/_proxy")
+        assert sub.headers == ((b"cache-control", b"no-cache"),)
+        for payload in (
+            {"requests": []},
+            {"requests": [{"path": "/api/rankings/compute", "method": "POST"}]},
+            {"requests": ["/api/_proxy/batch"]},
+            {"requests": ["/health"]},
+            {"requests": ["/api/tokens/stats"] * 6},
+            {"requests": [{"path": "/api/tokens/stats", "method": 5}]},
+            {"requests": [{"path": ["/api/tokens/stats"]}]},
+            {"requests": [{"path": "/api/tokens/stats", "headers": ["cache-control"]}]},
+            {"requests": [{"path": "/api/tokens/stats", "headers": {"cache-control": 1}}]},
+            {"requests": [{"path": "/api/tokens/stats", "headers": {"x-a": "1\r\nx-b: 2"}}]},
+            {"requests": [{"path": "/api/tokens/stats", "headers": {"bad name": "1"}}]},
+            {"requests": ["/api/tokens/export?format=ndjson"]},
+        ):
+            try:
+                parse_batch(payload, 5, "/api/_proxy", ["/api/tokens/export"])
+            except BatchError:
+                continue
+            raise AssertionError(f"accepted {payload}")
+
+    def test_sub_requests_use_cache_and_coalescing(self):
+        """Sub-requests run concurrently, share in-flight calls and hit the cache"""
+        calls = []
+
+        async def handler(request):
+            calls.append(str(request.url.path))
+            await asyncio.sleep(0.02)
+            if request.url.path == "/api/nope":
+                return upstream_json(404, {"message": "Route GET:/api/nope not found"})
+            return upstream_json(200, {"ok": True, "data": {"path": request.url.path}})
+
+        client = make_client(handler)
+        batch = {"requests": [
+            {"id": "dashboard", "path": "/api/rankings/dashboard?limit=5"},
+            {"id": "again", "path": "/api/rankings/dashboard?limit=5"},
+            {"id": "movers", "path": "/api/rankings/movers?limit=5"},
+            {"id": "missing", "path": "/api/nope"},
+        ]}
+        first = client.post("/api/_proxy/batch", json=batch).json()["data"]["responses"]
+        assert [r["id"] for r in first] == ["dashboard", "again", "movers", "missing"]
+        assert [r["status"] for r in first] == [200, 200, 200, 404]
+        assert first[2]["body"] == {"ok": True, "data": {"path": "/api/rankings/movers"}}
+        assert sorted(calls) == ["/api/nope", "/api/rankings/dashboard", "/api/rankings/movers"]
+
+        second = client.post("/api/_proxy/batch", json={"requests": ["/api/rankings/dashboard?limit=5"]}).json()
+        assert second["data"]["responses"][0]["cache"] == "HIT"
+        assert len(calls) == 3
+
+    def test_malformed_body_is_a_400(self):
+        """A body that is not JSON is answered without touching the upstream"""
+        client = make_client(lambda request: upstream_json(200, {"ok": True}))
+        response = client.post("/api/_proxy/batch", content=b"not json")
+        assert response.status_code == 400
+        assert response.json()["ok"] is False
+        # Wrongly typed items and streamed exports are 400s too, not 500s
+        for item in ({"path": "/api/tokens/stats", "method": 5}, f"{server.PROXY_EXPORT_ROUTES[0]}?limit=5"):
+            response = client.post("/api/_proxy/batch", json={"requests": [item]})
+            assert response.status_code == 400 and response.json()["ok"] is False
+
+
+class TestETags:
+    """Strong ETags and If-None-Match handling"""
+
+    def test_if_none_match_comparison(self):
+        """Lists, W/ prefixes, encoding suffixes and * all match; other tags do not"""
+        etag = make_etag(b"body")
+        gzip_tag = etag[:-1] + '-gzip"'
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", W/{gzip_tag}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('"other"', etag)
+        assert not etag_matches(None, etag)
+        assert make_etag(b"body") == etag != make_etag(b"body2")
+
+    def test_cached_route_answers_304_without_upstream_call(self, monkeypatch):
+        """A matching If-None-Match on a cache hit costs neither body nor upstream call"""
+        monkeypatch.setattr(server, "PROXY_COMPRESSION_MIN_BYTES", 0)
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return upstream_json(200, {"ok": True, "data": {"BUY": 3}})
+
+        client = make_client(handler)
+        first = client.get("/api/rankings/buckets", headers={"accept-encoding": "identity"})
+        etag = first.headers["etag"]
+        again = client.get("/api/rankings/buckets", headers={"if-none-match": etag, "accept-encoding": "identity"})
+        assert again.status_code == 304 and again.content == b""
+        assert again.headers["etag"] == etag and again.headers["x-cache"] == "HIT"
+
+        gzipped = client.get("/api/rankings/buckets", headers={"accept-encoding": "gzip"})
+        assert gzipped.headers["etag"] == etag[:-1] + '-gzip"'
+        revalidated = client.get("/api/rankings/buckets", headers={"if-none-match": gzipped.headers["etag"], "accept-encoding": "gzip"})
+        assert revalidated.status_code == 304
+        assert "content-encoding" not in revalidated.headers
+        assert calls == ["/api/rankings/buckets"]
+
+    def test_buffered_response_changes_tag_with_body(self):
+        """Uncached polls still get 304 while the body is unchanged, and 200 once it changes"""
+        bodies = iter([{"movers": [1]}, {"movers": [1]}, {"movers": [2]}])
+
+        def handler(request):
+            return upstream_json(200, {"ok": True, "data": next(bodies)})
+
+        client = make_client(handler)
+        first = client.get("/api/rankings/movers?limit=5")
+        same = client.get("/api/rankings/movers?limit=5", headers={"if-none-match": first.headers["etag"]})
+        changed = client.get("/api/rankings/movers?limit=5", headers={"if-none-match": first.headers["etag"]})
+        assert same.status_code == 304
+        assert changed.status_code == 200 and changed.headers["etag"] != first.headers["etag"]
+
+
+def ranking_items(scores):
+    return [{"symbol": symbol, "compositeScore": score, "bucket": "BUY", "name": f"{symbol} token"} for symbol, score in scores]
+
+
+class TestDeltas:
+    """Delta responses for polling clients of ranking lists"""
+
+    def test_diff_round_trip(self):
+        """Patches carry only what changed and rebuild the new document exactly"""
+        old = {"ok": True, "data": {
+            "summary": {"BUY": 3, "SELL": 1},
+            "buckets": {"BUY": ranking_items([("AAA", 90), ("BBB", 80), ("CCC", 70)]), "SELL": ranking_items([("ZZZ", 10)])},
+        }}
+        new = json.loads(json.dumps(old))
+        buy = new["data"]["buckets"]["BUY"]
+        buy[2]["compositeScore"] = 95
+        del buy[1]["name"]
+        buy.insert(0, buy.pop(2))
+        buy.append(ranking_items([("DDD", 60)])[0])
+        new["data"]["buckets"]["SELL"] = []
+        new["data"]["summary"]["BUY"] = 4
+
+        ops = diff(old, new)
+        assert apply_delta(old, ops) == new
+        buy_op = next(op for op in ops if op["path"] == ["data", "buckets", "BUY"])
+        assert buy_op["changed"] == [{"symbol": "CCC", "compositeScore": 95}, {"symbol": "BBB", "$unset": ["name"]}]
+        assert buy_op["order"] == ["CCC", "AAA", "BBB", "DDD"]
+        assert {"op": "set", "path": ["data", "summary", "BUY"], "value": 4} in ops
+        assert diff(new, new) == []
+
+    def test_polling_client_gets_226_patch(self, monkeypatch):
+        """A client naming a remembered version gets IM Used with a patch from it"""
+        monkeypatch.setattr(server, "delta_history", DeltaHistory())
+        items = ranking_items([(f"T{i:03}", 100 - i) for i in range(50)])
+        versions = [items, items[:10] + [dict(items[10], compositeScore=1)] + items[11:]]
+        payloads = iter({"ok": True, "data": {"rankings": rankings, "total": 50}} for rankings in versions)
+
+        def handler(request):
+            return upstream_json(200, next(payloads))
+
+        client = make_client(handler)
+        first = client.get("/api/rankings?limit=50", headers={"a-im": "json-delta", "accept-encoding": "identity"})
+        delta = client.get("/api/rankings?limit=50", headers={"a-im": "json-delta", "if-none-match": first.headers["etag"], "accept-encoding": "identity"})
+        assert delta.status_code == 226
+        assert delta.headers["im"] == "json-delta" and delta.headers["delta-base"] == first.headers["etag"]
+        assert "A-IM" in delta.headers["vary"]
+        patch = delta.json()
+        assert patch["etag"] == delta.headers["etag"] != first.headers["etag"]
+        assert apply_delta(first.json(), patch["ops"])["data"]["rankings"] == versions[1]
+        assert len(delta.content) < len(first.content) / 5
+
+    def test_unknown_base_falls_back_to_full_body(self, monkeypatch):
+        """Evicted or foreign versions and clients without A-IM get the whole document"""
+        monkeypatch.setattr(server, "delta_history", DeltaHistory(versions=2))
+        counter = iter(range(100))
+
+        def handler(request):
+            n = next(counter)
+            return upstream_json(200, {"ok": True, "data": {"movers": ranking_items([("AAA", n), ("BBB", 50)]), "count": 2}})
+
+        client = make_client(handler)
+        oldest = client.get("/api/rankings/movers", headers={"a-im": "json-delta"})
+        client.get("/api/rankings/movers")
+        client.get("/api/rankings/movers")
+        evicted = client.get("/api/rankings/movers", headers={"a-im": "json-delta", "if-none-match": oldest.headers["etag"]})
+        foreign = client.get("/api/rankings/movers", headers={"a-im": "json-delta", "if-none-match": '"nope"'})
+        plain = client.get("/api/rankings/movers", headers={"if-none-match": oldest.headers["etag"]})
+        assert [r.status_code for r in (evicted, foreign, plain)] == [200, 200, 200]
+        assert evicted.json()["data"]["count"] == 2
+        assert server.delta_history.stats()["base_misses"] == 2
+
+    def test_history_is_opt_in_and_byte_bounded(self, monkeypatch):
+        """Only delta-polled queries are remembered, failures never, within the byte budget"""
+        history = DeltaHistory(versions=4, max_bytes=3000)
+        monkeypatch.setattr(server, "delta_history", history)
+        counter = iter(range(100))
+
+        def handler(request):
+            if request.url.params.get("limit") == "9":
+                return upstream_json(200, {"ok": False, "error": "boom"})
+            n = next(counter)
+            return upstream_json(200, {"ok": True, "data": {"movers": ranking_items([(f"T{i}", n) for i in range(10)])}})
+
+        client = make_client(handler)
+        client.get("/api/rankings/movers?limit=1")
+        client.get("/api/rankings/movers?limit=9", headers={"a-im": "json-delta"})
+        assert history.stats()["keys"] == 0
+        for limit in (2, 3, 4, 5):
+            client.get(f"/api/rankings/movers?limit={limit}", headers={"a-im": "json-delta"})
+            client.get(f"/api/rankings/movers?limit={limit}")
+        stats = history.stats()
+        assert stats["bytes"] <= 3000 and stats["evictions"] > 0
+        assert history.tracks("/api/rankings/movers?limit=5") and not history.tracks("/api/rankings/movers?limit=2")
+
+
+class TestStaleServing:
+    """stale-while-revalidate and stale-if-error for cached routes"""
+
+    def test_expired_entries_stay_within_stale_windows(self):
+        """Expired entries are kept, not served as hits, for as long as a stale window allows"""
+        windows = ResponseCache({"/a": 0}, {}, stale={"/a": 60}, stale_if_error={"/a": 120})
+        windows.put("/a", CachedResponse(200, [], b"x", 0))
+        assert windows.get("/a") is None
+        assert windows.get_stale("/a") is not None and windows.get_stale("/a", on_error=True) is not None
+        assert windows.stats()["expirations"] == 0 and windows.stats()["stale_hits"] == 2
+
+        plain = ResponseCache({"/a": 0}, {})
+        plain.put("/a", CachedResponse(200, [], b"x", 0))
+        assert plain.get("/a") is None and plain.get_stale("/a", on_error=True) is None
+        assert plain.stats()["expirations"] == 1
+
+    def test_stale_entry_served_while_one_refresh_runs(self, monkeypatch):
+        """Readers get the expired copy at once; a single background call refreshes it"""
+        monkeypatch.setattr(server, "response_cache", ResponseCache({"/api/rankings/dashboard": 0}, {}, stale={"/api/rankings": 60}))
+        versions = iter(range(100))
+
+        async def handler(request):
+            await asyncio.sleep(0.02)
+            return upstream_json(200, {"ok": True, "data": {"version": next(versions)}})
+
+        make_client(handler)
+
+        async def run():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://proxy") as client:
+                first = await client.get("/api/rankings/dashboard")
+                stale = await asyncio.gather(*(client.get("/api/rankings/dashboard") for _ in range(3)))
+                assert len(server.revalidations) == 1
+                while server.revalidations:
+                    await asyncio.sleep(0.01)
+                refreshed = await client.get("/api/rankings/dashboard")
+                return first, stale, refreshed
+
+        first, stale, refreshed = asyncio.run(run())
+        assert first.headers["x-cache"] == "MISS" and first.json()["data"]["version"] == 0
+        assert {(r.headers["x-cache"], r.json()["data"]["version"]) for r in stale} == {("STALE", 0)}
+        assert refreshed.headers["x-cache"] == "STALE" and refreshed.json()["data"]["version"] == 1
+
+    def test_upstream_failure_served_stale(self, monkeypatch):
+        """Errors and an unready backend fall back to the stale copy inside stale-if-error"""
+        monkeypatch.setattr(server, "response_cache", ResponseCache({"/api/rankings/dashboard": 0}, {}, stale_if_error={"/api/rankings": 60}))
+        monkeypatch.setattr(server, "PROXY_READY_WAIT", 0)
+        statuses = iter([200, 500, 500])
+
+        def handler(request):
+            status = next(statuses)
+            return upstream_json(status, {"ok": status == 200, "data": {"BUY": 3}})
+
+        client = make_client(handler)
+        first = client.get("/api/rankings/dashboard")
+        failed = client.get("/api/rankings/dashboard")
+        uncached = client.get("/api/rankings/movers")
+        server.backend_ready = ReadinessGate()
+        starting = client.get("/api/rankings/dashboard")
+        assert first.status_code == 200 and first.headers["x-cache"] == "MISS"
+        for response in (failed, starting):
+            assert response.status_code == 200 and response.headers["x-cache"] == "STALE"
+            assert response.json() == first.json()
+        assert uncached.status_code == 500
+
+
+class TestCacheSnapshot:
+    """Warm restarts from the on-disk cache snapshot"""
+
+    def test_snapshot_round_trip(self, tmp_path):
+        """Entries come back byte for byte; old ones and broken files are skipped"""
+        path = str(tmp_path / "cache.snapshot")
+        written = write_snapshot(path, [
+            SnapshotEntry("/api/tokens/stats", 200, [("content-type", "application/json")], b'{"ok":true}', 5),
+            SnapshotEntry("/api/rankings/buckets?x=1", 200, [], b"\x00" * 1000, 7200),
+        ])
+        assert written == 2
+        assert [p.name for p in tmp_path.iterdir()] == ["cache.snapshot"]  # no temporary file left over
+        entries = read_snapshot(path, max_age=3600)
+        assert [(e.key, e.headers, e.body) for e in entries] == [("/api/tokens/stats", [("content-type", "application/json")], b'{"ok":true}')]
+        assert entries[0].age >= 5
+
+        # A failed write keeps the previous snapshot and cleans up after itself
+        try:
+            write_snapshot(path, [SnapshotEntry("/api/tokens/stats", 200, [], "not bytes", 0)])
+        except TypeError:
+            pass
+        assert [p.name for p in tmp_path.iterdir()] == ["cache.snapshot"]
+        assert len(read_snapshot(path, max_age=3600)) == 1
+
+        (tmp_path / "broken.snapshot").write_bytes(b"not a snapshot")
+        assert read_snapshot(str(tmp_path / "broken.snapshot"), 3600) == []
+        assert read_snapshot(str(tmp_path / "missing.snapshot"), 3600) == []
+
+    def test_restored_entries_served_stale_before_ready(self, monkeypatch, tmp_path):
+        """After a restart, snapshot routes answer from the snapshot while the backend starts"""
+        monkeypatch.setattr(server, "PROXY_SNAPSHOT_PATH", str(tmp_path / "cache.snapshot"))
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return upstream_json(200, {"ok": True, "data": {"BUY": 3}})
+
+        client = make_client(handler)
+        first = client.get("/api/rankings/dashboard", headers={"accept-encoding": "identity"})
+        write_snapshot(server.PROXY_SNAPSHOT_PATH, server.snapshot_entries())
+
+        monkeypatch.setattr(server, "response_cache", ResponseCache(
+            server.PROXY_CACHE_ROUTES, {}, stale=server.PROXY_CACHE_STALE, stale_if_error=server.PROXY_CACHE_STALE_IF_ERROR,
+        ))
+        assert server.restore_snapshot() == ["/api/rankings/dashboard"]
+        server.backend_ready = ReadinessGate()
+        restored = client.get("/api/rankings/dashboard", headers={"if-none-match": first.headers["etag"]})
+        body = client.get("/api/rankings/dashboard")
+        assert restored.status_code == 304 and restored.headers["x-cache"] == "STALE"
+        assert body.headers["x-cache"] == "STALE" and body.json() == first.json()
+        assert calls == ["/api/rankings/dashboard"]
+
+    def test_warm_up_fetches_keys_once_ready(self, monkeypatch):
+        """Warm-up keys are fetched into the cache as soon as the backend is ready"""
+        calls = []
+
+        def handler(request):
+            calls.append(str(request.url.path))
+            return upstream_json(200, {"ok": True, "data": {"total": 10}})
+
+        client = make_client(handler)
+
+        async def run():
+            await server.warm_up(["/api/tokens/stats", "/api/token-runner/top?limit=5"])
+            while server.revalidations:
+                await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        assert sorted(calls) == ["/api/token-runner/top", "/api/tokens/stats"]
+        assert client.get("/api/token-runner/top?limit=5").headers["x-cache"] == "HIT"
+        assert len(calls) == 2
+
+
+class TestProjection:
+    """fields= projection of list endpoints"""
+
+    def test_fields_trim_list_items(self):
+        """Dotted paths reach into objects and lists; everything outside the lists is kept"""
+        tree = parse_fields("symbol, metrics.confidence,metrics.confidence.low,tags.name", 10)
+        assert tree == {"symbol": None, "metrics": {"confidence": None}, "tags": {"name": None}}
+        document = {"ok": True, "data": {"total": 1, "tokens": [{
+            "symbol": "AAA", "engineScore": 71,
+            "metrics": {"confidence": 0.9, "volume": 5},
+            "tags": [{"name": "defi", "weight": 1}],
+        }]}}
+        assert project(document, tree) == {"ok": True, "data": {"total": 1, "tokens": [{
+            "symbol": "AAA", "metrics": {"confidence": 0.9}, "tags": [{"name": "defi"}],
+        }]}}
+        for bad in ("", " , ", "a..b", "a;b", ",".join(f"f{i}" for i in range(11))):
+            try:
+                parse_fields(bad, 10)
+            except ProjectionError:
+                continue
+            raise AssertionError(f"accepted {bad!r}")
+
+    def test_projected_responses_are_cached_separately(self):
+        """TS never sees fields=; each projection is its own cache entry"""
+        queries = []
+
+        def handler(request):
+            queries.append(request.url.query.decode())
+            tokens = [{"symbol": f"T{i}", "engineScore": i, "name": "x" * 100, "chain": "eth"} for i in range(5)]
+            return upstream_json(200, {"ok": True, "data": {"tokens": tokens, "total": 5}})
+
+        client = make_client(handler)
+        first = client.get("/api/tokens?limit=5&fields=symbol,engineScore")
+        again = client.get("/api/tokens?fields=symbol,engineScore&limit=5")
+        other = client.get("/api/tokens?limit=5&fields=symbol")
+        full = client.get("/api/tokens?limit=5")
+        assert first.json()["data"] == {"tokens": [{"symbol": f"T{i}", "engineScore": i} for i in range(5)], "total": 5}
+        assert (first.headers["x-cache"], again.headers["x-cache"], other.headers["x-cache"]) == ("MISS", "HIT", "MISS")
+        assert other.json()["data"]["tokens"][0] == {"symbol": "T0"}
+        assert full.json()["data"]["tokens"][0]["name"] == "x" * 100
+        assert queries == ["limit=5", "limit=5", "limit=5"]
+
+    def test_invalid_fields_rejected_without_upstream_call(self):
+        """A malformed fields parameter is a 400 from the proxy"""
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return upstream_json(200, {"ok": True, "data": {"tokens": []}})
+
+        client = make_client(handler)
+        response = client.get("/api/token-runner/analyses?fields=engineScore;drop")
+        assert response.status_code == 400 and response.json()["ok"] is False
+        assert calls == []
@@ -8,14 +8,18 @@ Features tested:
 - GET /api/token-runner/analysis/:symbol - Single token analysis
 - GET /api/token-runner/top - Top tokens by engine score
 - GET /api/token-runner/analyses - All analyses with pagination
+- GET /api/token-runner/analyses/export - All matching analyses as NDJSON
 - Ranking v2 integration with Engine data
 """
 import pytest
+import json
 import requests
 import os
 import time
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://crypto-analyzer-39.preview.emergentagent.com')
+# Compute calls are background jobs at the proxy; wait for the result inline
+WAIT_FOR_JOB = {'Prefer': 'wait=120'}
 
 
 class TestTokenRunnerStats:
@@ -120,6 +124,23 @@ class TestTokenRunnerAnalyses:
             assert analysis["engineLabel"] == "NEUTRAL"
         
         print(f"✓ NEUTRAL analyses: {len(analyses)} returned")
+    
+    def test_export_analyses_as_ndjson(self):
+        """GET /api/token-runner/analyses/export?label=NEUTRAL - Every match as NDJSON"""
+        total = requests.get(f"{BASE_URL}/api/token-runner/analyses?label=NEUTRAL&limit=1").json()["data"]["total"]
+        response = requests.get(f"{BASE_URL}/api/token-runner/analyses/export?label=NEUTRAL", stream=True)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        
+        analyses = [json.loads(line) for line in response.iter_lines() if line]
+        assert len(analyses) == total
+        for analysis in analyses:
+            assert analysis["engineLabel"] == "NEUTRAL"
+        
+        # Same order as the paginated list
+        scores = [a["engineScore"] for a in analyses]
+        assert scores == sorted(scores, reverse=True)
+        print(f"✓ NEUTRAL analyses export: {len(analyses)} lines")
 
 
 class TestTokenRunnerSingleAnalysis:
@@ -208,7 +229,8 @@ class TestTokenRunnerRun:
         # Run with small batch for testing
         response = requests.post(
             f"{BASE_URL}/api/token-runner/run",
-            json={"batchSize": 5, "mode": "fast"}
+            json={"batchSize": 5, "mode": "fast"},
+            headers=WAIT_FOR_JOB,
         )
         assert response.status_code == 200
         
@@ -254,7 +276,7 @@ class TestRankingV2Integration:
     
     def test_compute_rankings_with_engine_data(self):
         """POST /api/rankings/compute - Returns withEngineData count"""
-        response = requests.post(f"{BASE_URL}/api/rankings/compute")
+        response = requests.post(f"{BASE_URL}/api/rankings/compute", headers=WAIT_FOR_JOB)
         assert response.status_code == 200
         
         data = response.json()
@@ -342,13 +364,14 @@ class TestIntegrationFlow:
         # Step 2: Run token runner (small batch)
         run_response = requests.post(
             f"{BASE_URL}/api/token-runner/run",
-            json={"batchSize": 3, "mode": "fast"}
+            json={"batchSize": 3, "mode": "fast"},
+            headers=WAIT_FOR_JOB,
         )
         run_result = run_response.json()["data"]
         print(f"Runner result: processed={run_result['processed']}, successful={run_result['successful']}")
         
         # Step 3: Compute rankings
-        rankings_response = requests.post(f"{BASE_URL}/api/rankings/compute")
+        rankings_response = requests.post(f"{BASE_URL}/api/rankings/compute", headers=WAIT_FOR_JOB)
         rankings_result = rankings_response.json()["data"]
         print(f"Rankings: computed={rankings_result['computed']}, withEngine={rankings_result['withEngineData']}")
         